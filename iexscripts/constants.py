@@ -17,3 +17,9 @@ MDB_PASSWORD  = "XXXXXXXXXXXXXXXXX"
 MDB_HOST      = "XXXXXXXXXXXXXXXXX" 
 MDB_PORT      = 0000000000000000000 
 MDB_NAMESPACE = "XXXXXXXXXXXXXXXXX" 
+
+# FTP
+FTP_HOST      = "XXXXXXXXXXXXXXXXX"
+FTP_PORT      = 0000000000000000000
+FTP_USER      = "XXXXXXXXXXXXXXXXX"
+FTP_PASSWORD  = "XXXXXXXXXXXXXXXXX"
@@ -14,7 +14,12 @@ import pymongo
 from pymongo import ASCENDING, DESCENDING
 from pymongo.errors import BulkWriteError
 import datetime
+import argparse
+import logging
 from mdb import Insert
+from mdb import Checkpoint
+from mdb.cache import enable_query_cache
+from mdb.instrument import enable_instrumentation, query_stats
 from mdb import Export
 from utils import Ftp
 
@@ -23,26 +28,53 @@ from utils import Ftp
 
 if __name__ == '__main__':
 
-    mdb_insert = Insert()
-    mdb_insert.insert_quotes()
-    mdb_insert.insert_dividends()
-    mdb_insert.insert_holdings()
-    mdb_insert.insert_performance()
-    mdb_insert.insert_stock_list()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', "--profile", dest="profile", action="store_true", help="Time every database call, log them to output/queries_daily.log and slow ones to the console")
+    parser.add_argument('-r', "--resume", dest="resume", action="store_true", help="Skip steps and symbols an earlier attempt of this run finished")
+    parser.add_argument("--run-id", dest="runID", default=datetime.date.today().strftime("%Y-%m-%d"), help="Run to resume, defaults to today's date YYYY-MM-DD")
+    args = parser.parse_args()
+
+    if args.profile:
+        #Every database call goes to the log file, slow ones to the console too
+        console = logging.StreamHandler()
+        console.setLevel(logging.WARNING)
+        logging.basicConfig(level=logging.WARNING, handlers=[console])
+        path = os.path.dirname(os.path.realpath(__file__)) + '/output/'
+        os.makedirs(path, exist_ok=True)
+        queries = logging.getLogger("diywealth.queries")
+        queries.setLevel(logging.INFO)
+        queries.addHandler(logging.FileHandler(path + 'queries_daily.log'))
+        enable_instrumentation()
+
+    #Reuse universe and latest-price reads across the insert jobs
+    enable_query_cache()
+
+    checkpoint = Checkpoint("daily", args.resume, args.runID)
+    mdb_insert = Insert(checkpoint=checkpoint)
+    checkpoint.run("insert_quotes", mdb_insert.insert_quotes)
+    checkpoint.run("insert_dividends", mdb_insert.insert_dividends)
+    checkpoint.run("insert_holdings", mdb_insert.insert_holdings)
+    checkpoint.run("insert_performance", mdb_insert.insert_performance)
+    checkpoint.run("insert_stock_list", mdb_insert.insert_stock_list)
     
     mdb_export = Export()
-    mdb_export.export_stock_list()
-    mdb_export.export_performance()
-
-    print('Upload data to webserver with FTP')
-    ftp = Ftp()
-    path = os.path.dirname(os.path.realpath(__file__))
-    path = path + '/output/json/'
-    file_list = []
-    for (dirpath, dirnames, filenames) in os.walk(path):
-        for f in filenames:
-            if '.json' in f:
-                file_list.append(f)
-        break
-    ftp.placeFiles(path, file_list)
-    ftp.quitConnection()
+    checkpoint.run("export_stock_list", mdb_export.export_stock_list)
+    checkpoint.run("export_performance", mdb_export.export_performance)
+
+    def upload():
+        print('Upload data to webserver with FTP')
+        ftp = Ftp()
+        path = os.path.dirname(os.path.realpath(__file__))
+        path = path + '/output/json/'
+        file_list = []
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            for f in filenames:
+                if '.json' in f:
+                    file_list.append(f)
+            break
+        ftp.placeFiles(path, file_list)
+        ftp.quitConnection()
+    checkpoint.run("upload", upload)
+
+    if args.profile:
+        print( query_stats.summary().head(20).to_string() )
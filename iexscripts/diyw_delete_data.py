@@ -14,6 +14,7 @@ import pymongo
 from pymongo import ASCENDING, DESCENDING
 from pymongo.errors import BulkWriteError
 import datetime
+import argparse
 from mdb import Delete
 
 ################################################
@@ -21,8 +22,11 @@ from mdb import Delete
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', "--dry-run", dest="dry_run", action="store_true", help="Only report duplicates")
+    args = parser.parse_args()
+
     mdb_delete = Delete()
-    #mdb_delete.delete_duplicate_charts()
-    mdb_delete.delete_duplicate_balancesheets()
+    mdb_delete.delete_duplicates(dry_run=args.dry_run)
     #mdb_delete.delete_performance("2019-12-31")
     #mdb_delete.delete_prices()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+A short script that creates the MongoDB indexes and checks that each query is index backed
+
+Usage: python3 diyw_indexes.py [--check]
+"""
+
+import argparse
+from mdb import Index
+
+################################################
+################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', "--check", dest="check", action="store_true", help="Explain each query and report COLLSCANs and in-memory SORTs")
+    args = parser.parse_args()
+
+    mdb_index = Index()
+    mdb_index.ensure_indexes()
+
+    if args.check:
+        print( mdb_index.check_indexes().to_string() )
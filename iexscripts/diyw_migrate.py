@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+A short script that adds native date fields to the time-keyed collections and reports any still missing
+
+Usage: python3 diyw_migrate.py [--check]
+"""
+
+import argparse
+from mdb import Index
+from mdb import Migrate
+
+################################################
+################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', "--check", dest="check", action="store_true", help="Only report documents without native dates")
+    args = parser.parse_args()
+
+    mdb_migrate = Migrate()
+    if not args.check:
+        mdb_migrate.migrate_native_dates()
+        #Native date indexes are part of the index catalog
+        Index().ensure_indexes()
+
+    #Once nothing is missing, mdb.dates.enable_native_reads() in the entry scripts takes effect
+    print( mdb_migrate.check_native_dates().to_string() )
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+A short script that brings the local Parquet mirror of the price and performance collections up to date
+
+Usage: python3 diyw_mirror.py
+"""
+
+from mdb.mirror import Mirror
+
+################################################
+################################################
+
+if __name__ == '__main__':
+
+    mirror = Mirror()
+    mirror.sync()
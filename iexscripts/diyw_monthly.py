@@ -14,14 +14,44 @@ import pymongo
 from pymongo import ASCENDING, DESCENDING
 from pymongo.errors import BulkWriteError
 import datetime
+import argparse
+import logging
 from mdb import Insert
+from mdb import Checkpoint
+from mdb.cache import enable_query_cache
+from mdb.instrument import enable_instrumentation, query_stats
 
 ################################################
 ################################################
 
 if __name__ == '__main__':
 
-    mdb_insert = Insert()
-    mdb_insert.insert_symbols()
-    mdb_insert.insert_company()
-    mdb_insert.insert_balancesheets()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', "--profile", dest="profile", action="store_true", help="Time every database call, log them to output/queries_monthly.log and slow ones to the console")
+    parser.add_argument('-r', "--resume", dest="resume", action="store_true", help="Skip steps and symbols an earlier attempt of this run finished")
+    parser.add_argument("--run-id", dest="runID", default=datetime.date.today().strftime("%Y-%m"), help="Run to resume, defaults to this month YYYY-MM")
+    args = parser.parse_args()
+
+    if args.profile:
+        #Every database call goes to the log file, slow ones to the console too
+        console = logging.StreamHandler()
+        console.setLevel(logging.WARNING)
+        logging.basicConfig(level=logging.WARNING, handlers=[console])
+        path = os.path.dirname(os.path.realpath(__file__)) + '/output/'
+        os.makedirs(path, exist_ok=True)
+        queries = logging.getLogger("diywealth.queries")
+        queries.setLevel(logging.INFO)
+        queries.addHandler(logging.FileHandler(path + 'queries_monthly.log'))
+        enable_instrumentation()
+
+    #Reuse universe and latest-price reads across the insert jobs
+    enable_query_cache()
+
+    checkpoint = Checkpoint("monthly", args.resume, args.runID)
+    mdb_insert = Insert(checkpoint=checkpoint)
+    checkpoint.run("insert_symbols", mdb_insert.insert_symbols)
+    checkpoint.run("insert_company", mdb_insert.insert_company)
+    checkpoint.run("insert_balancesheets", mdb_insert.insert_balancesheets)
+
+    if args.profile:
+        print( query_stats.summary().head(20).to_string() )
@@ -31,30 +31,39 @@ class Batch:
         from multiple stocks.
     """
 
-    def __init__(self, symbols, date_format='timestamp', output_format='dataframe'):
+    def __init__(self, symbols, date_format='timestamp', output_format='dataframe', token=None):
         """
             Args:
-                symbols - a list of symbols.
+                symbols - a list of symbols, at most 100 per request.
                 output_format - dataframe (pandas) or json
                 convert_dates - Converts dates
+                token - IEX Cloud API token
         """
+        if token and type(token) != str:
+            raise ValueError("token must be str")
         self.symbols = symbols
         self.symbols_list = ','.join(symbols)
         self.date_format = validate_date_format(date_format)
         self.output_format = validate_output_format(output_format)
+        self.token = token
 
-    def _get(self, _type, params={}):
+    def _request(self, types, params=None):
         request_url = BASE_URL + '/stock/market/batch'
+        params = dict(params or {})
         params.update({'symbols': self.symbols_list,
-                       'types': _type})
+                       'types': ','.join(types)})
+        if self.token:
+            params['token'] = self.token
         response = requests.get(request_url, params=params)
         # Check the response
         if response.status_code != 200:
             raise Exception(f"{response.status_code}: {response.content.decode('utf-8')}")
+        return response.json()
+
+    def _parse(self, _type, result):
+        # Symbols IEX has no data for are missing or null
+        result = {symbol: v for symbol, v in result.items() if v and v.get(_type)}
 
-        if self.output_format == 'json':
-            return response.json()
-        result = response.json()
         if _type in ['delayed_quote',
                      'price']:
             for symbol, v in result.items():
@@ -70,27 +79,28 @@ class Batch:
             result = result.set_index('symbol') \
                            .apply(lambda x: x.apply(pd.Series).stack()) \
                            .reset_index() \
-                           .drop('level_1', 1)
+                           .drop('level_1', axis=1)
 
         # Nested result
         elif _type in ['company',
                        'quote',
                        'stats']:
             for symbol, item in result.items():
-                item.update({'symbol': symbol})
+                item[_type].update({'symbol': symbol})
             result = pd.DataFrame.from_dict([v[_type] for k, v in result.items()])
 
         # Nested multi-line
-        elif _type in ['earnings', 'financials']:
+        elif _type in ['earnings', 'financials', 'balance-sheet']:
+            key = 'balancesheet' if _type == 'balance-sheet' else _type
             result_set = []
             for symbol, rows in result.items():
-                for row in rows[_type][_type]:
+                for row in rows[_type].get(key) or []:
                     row.update({'symbol': symbol})
                     result_set.append(row)
             result = pd.DataFrame.from_dict(result_set)
 
         # Nested result list
-        elif _type in ['book', 'chart']:
+        elif _type in ['book', 'chart', 'dividends']:
             result_set = []
             for symbol, rowset in result.items():
                 for row in rowset[_type]:
@@ -99,14 +109,17 @@ class Batch:
             result = pd.DataFrame.from_dict(result_set)
 
         # Convert columns with unix timestamps
-        if self.date_format:
+        if self.date_format in ['datetime', 'isoformat']:
             date_field_conv = [x for x in result.columns if x in DATE_FIELDS]
             if date_field_conv:
                 if self.date_format == 'datetime':
                     date_apply_func = timestamp_to_datetime
                 elif self.date_format == 'isoformat':
                     date_apply_func = timestamp_to_isoformat
-                result[date_field_conv] = result[date_field_conv].applymap(date_apply_func)
+                result[date_field_conv] = result[date_field_conv].apply(lambda x: x.map(date_apply_func))
+
+        if result.empty:
+            return result
 
         # Move symbol to first column
         cols = ['symbol'] + [x for x in result.columns if x != 'symbol']
@@ -114,6 +127,27 @@ class Batch:
 
         return result
 
+    def _get(self, _type, params=None):
+        result = self._request([_type], params)
+        if self.output_format == 'json':
+            return result
+        return self._parse(_type, result)
+
+    def get(self, types, params=None):
+        """
+            Fetch several types in one request.
+            Returns a dict of type --> result.
+
+            Args:
+                types - list of types e.g. ['quote', 'stats']
+                params - parameters shared by the types e.g. range
+        """
+        result = self._request(types, params)
+        if self.output_format == 'json':
+            return {_type: {symbol: v.get(_type) for symbol, v in result.items() if v}
+                    for _type in types}
+        return {_type: self._parse(_type, result) for _type in types}
+
     def book(self):
         return self._get("book")
 
@@ -130,10 +164,17 @@ class Batch:
     def delayed_quote(self):
         return self._get("delayed_quote")
 
+    def balancesheet(self, period=None, last=1):
+        params = {'period': period,
+                  'last': last}
+        params = {k: v for k, v in params.items() if v}
+        return self._get("balance-sheet", params=params)
+
     def dividends(self, range):
-        if range not in DIVIDEND_RANGES:
-            err_msg = f"Invalid range: '{range}'. Valid ranges are {', '.join(DIVIDEND_RANGES)}"
+        if range not in RANGES:
+            err_msg = f"Invalid range: '{range}'. Valid ranges are {', '.join(RANGES)}"
             raise ValueError(err_msg)
+        return self._get("dividends", params={'range': range})
 
     def earnings(self):
         return self._get('earnings')
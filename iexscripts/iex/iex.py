@@ -11,8 +11,12 @@ import numpy
 import pandas
 from iex import reference
 from iex import Stock
+from iex import Batch
 from iexscripts.constants import IEX_TOKEN
 
+#Most symbols the IEX batch endpoint accepts per request
+BATCH_SIZE = 100
+
 class Iex:
 
     def __init__(self):
@@ -62,17 +66,40 @@ class Iex:
         
         return symbols
     
+    def get_batch(self, ref_symbols, ref_types, params=None):
+        """
+        Get several data types for many symbols from the IEX batch endpoint
+        Symbols are split into requests of BATCH_SIZE
+        @params:
+            ref_symbols - Required  : symbols ([Str])
+            ref_types   - Required  : data types e.g. ["quote","stats"] ([Str])
+            params      - Optional  : parameters shared by the types e.g. range (Dict)
+        """
+    
+        frames = { ref_type: [] for ref_type in ref_types }
+        for idx_min in range(0, len(ref_symbols), BATCH_SIZE):
+            batch = Batch( ref_symbols[idx_min:idx_min+BATCH_SIZE], token=IEX_TOKEN )
+            for ref_type, frame in batch.get(ref_types, params).items():
+                if not frame.empty:
+                    frames[ref_type].append( frame )
+    
+        return { ref_type: pandas.concat(frames[ref_type], ignore_index=True, sort=False) if frames[ref_type] else pandas.DataFrame()
+                 for ref_type in ref_types }
+    
     def get_company(self, ref_symbol):
         """
         Get company information from IEX
         @params:
-            ref_symbol  - Required  : symbols ([Str])
+            ref_symbol  - Required  : symbol or symbols (Str or [Str])
         """
     
-        stock = Stock( ref_symbol )
-        company = stock.company_table(token=IEX_TOKEN)
+        if isinstance(ref_symbol, list):
+            company = self.get_batch(ref_symbol, ["company"])["company"]
+        else:
+            stock = Stock( ref_symbol )
+            company = stock.company_table(token=IEX_TOKEN)
         #Remove unnecesary data
-        company.drop(["website","CEO","primarySicCode","employees","address","address2","state","city","zip","country","phone"], axis=1, errors='ignore', inplace=True)
+        company.drop(["website","CEO","primarySicCode","employees","address","address2","state","city","zip","country","phone","tags"], axis=1, errors='ignore', inplace=True)
         #Reorder dataframe
         if not company.empty:
             company = self.set_column_sequence(company, ["symbol","companyName","exchange","industry","description","securityName","issueType","sector"])
@@ -112,6 +139,27 @@ class Iex:
     
         stock = Stock( ref_symbol )
         quote = stock.quote_table(token=IEX_TOKEN)
+    
+        return self.format_quotes(quote)
+    
+    def get_quotes(self, ref_symbols):
+        """
+        Get quotes for many symbols from IEX in batches
+        @params:
+            ref_symbols - Required  : symbols ([Str])
+        """
+    
+        quotes = self.get_batch(ref_symbols, ["quote"])["quote"]
+    
+        return self.format_quotes(quotes)
+    
+    def format_quotes(self, quote):
+        """
+        Keep the quote fields stored in MongoDB with closeTime as a YYYY-MM-DD date
+        @params:
+            quote       - Required  : quotes from IEX (Pandas.DataFrame)
+        """
+    
         #Remove unnecesary data
         quote = quote.loc[:, quote.columns.isin(["symbol","close","closeTime","marketCap","peRatio"])]
     
@@ -122,15 +170,19 @@ class Iex:
             #if (quote['symbol'] != 'SPY').any() and quote.isnull().values.any():
             #    return pandas.DataFrame()
     
-            if quote[['close','closeTime']].isnull().values.any():
+            if not {"close","closeTime"}.issubset(quote.columns):
+                return pandas.DataFrame()
+            quote = quote.dropna(subset=["close","closeTime"])
+            if quote.empty:
                 return pandas.DataFrame()
             
             #Change date format
-            date = pandas.Timestamp(quote["closeTime"].iloc[0], unit='ms').strftime('%Y-%m-%d')
-            quote.drop(["closeTime"], axis=1, errors='ignore', inplace=True)
+            date = pandas.to_datetime(quote["closeTime"], unit='ms').dt.strftime('%Y-%m-%d')
+            quote = quote.drop(["closeTime"], axis=1)
             quote["date"] = date
             #Reorder dataframe
             quote = self.set_column_sequence(quote, ["symbol","date","close","marketCap","peRatio"])
+            quote.reset_index(drop=True, inplace=True)
     
         return quote
     
@@ -138,21 +190,23 @@ class Iex:
         """
         Get dividends from IEX
         @params:
-            ref_symbol  - Required  : symbol (Str)
+            ref_symbol  - Required  : symbol or symbols (Str or [Str])
             ref_range   - Optional  : date range (Str)
         """
     
-        stock = Stock( ref_symbol )
-        dividends = stock.dividends_table(ref_range, token=IEX_TOKEN)
+        if isinstance(ref_symbol, list):
+            dividends = self.get_batch(ref_symbol, ["dividends"], {"range": ref_range})["dividends"]
+        else:
+            stock = Stock( ref_symbol )
+            dividends = stock.dividends_table(ref_range, token=IEX_TOKEN)
         #print( ref_symbol )
         #print( dividends )
         #Remove unnecesary data
         dividends.drop(["recordDate","declaredDate","flag"], axis=1, errors='ignore', inplace=True)
         #Add symbol name column
         if not dividends.empty:
-            dividends_len = len( dividends.index )
-            dividends_arr = [ref_symbol] * dividends_len
-            dividends.insert(loc=0, column='symbol', value=dividends_arr)
+            if "symbol" not in dividends.columns:
+                dividends.insert(loc=0, column='symbol', value=ref_symbol)
             #Reorder dataframe
             dividends = self.set_column_sequence(dividends, ["symbol","exDate","paymentDate","amount"])
     
@@ -202,18 +256,20 @@ class Iex:
         """
         Get financials from IEX
         @params:
-            ref_symbol  - Required  : symbol (Str)
+            ref_symbol  - Required  : symbol or symbols (Str or [Str])
         """
     
-        stock = Stock( ref_symbol )
-        balancesheet = stock.balancesheet_table(last=1, period="quarter", token=IEX_TOKEN)
+        if isinstance(ref_symbol, list):
+            balancesheet = self.get_batch(ref_symbol, ["balance-sheet"], {"period": "quarter", "last": 1})["balance-sheet"]
+        else:
+            stock = Stock( ref_symbol )
+            balancesheet = stock.balancesheet_table(last=1, period="quarter", token=IEX_TOKEN)
         #Remove unnecesary data
-        balancesheet = balancesheet.loc[:, balancesheet.columns.isin(["reportDate","shareholderEquity"])]
+        balancesheet = balancesheet.loc[:, balancesheet.columns.isin(["symbol","reportDate","shareholderEquity"])]
         #Add symbol name
         if not balancesheet.empty:
-            balancesheet_len = len( balancesheet.index )
-            balancesheet_arr = [ref_symbol] * balancesheet_len
-            balancesheet.insert(loc=0, column='symbol', value=balancesheet_arr)
+            if "symbol" not in balancesheet.columns:
+                balancesheet.insert(loc=0, column='symbol', value=ref_symbol)
             #Reorder dataframe
             balancesheet = self.set_column_sequence(balancesheet, ["symbol","reportDate"])
     
@@ -223,22 +279,23 @@ class Iex:
         """
         Get stats from IEX
         @params:
-            ref_symbol  - Required  : symbol (Str)
+            ref_symbol  - Required  : symbol or symbols (Str or [Str])
         """
     
-        stock = Stock( ref_symbol )
-        stats = stock.stats_table(token=IEX_TOKEN)
+        if isinstance(ref_symbol, list):
+            stats = self.get_batch(ref_symbol, ["stats"])["stats"]
+        else:
+            stock = Stock( ref_symbol )
+            stats = stock.stats_table(token=IEX_TOKEN)
         #Remove unnecesary data
-        stats = stats.loc[:, stats.columns.isin(["sharesOutstanding"])]
+        stats = stats.loc[:, stats.columns.isin(["symbol","sharesOutstanding"])]
         #Add symbol and date
         if not stats.empty:
-            stats_len = len( stats.index )
-            stats_arr = [ref_symbol] * stats_len
-            stats.insert(loc=0, column='symbol', value=stats_arr)
+            if "symbol" not in stats.columns:
+                stats.insert(loc=0, column='symbol', value=ref_symbol)
             #Get current date
             currDate = datetime.datetime.now().strftime("%Y-%m-%d")
-            stats_arr = [currDate] * stats_len
-            stats.insert(loc=0, column='date', value=stats_arr)
+            stats.insert(loc=0, column='date', value=currDate)
             #Reorder dataframe
             stats = self.set_column_sequence(stats, ["symbol","date","sharesOutstanding"])
     
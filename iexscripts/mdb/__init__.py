@@ -1,7 +1,10 @@
 from mdb.algo import Algo
+from mdb.checkpoint import Checkpoint
 from mdb.delete import Delete
 from mdb.export import Export
+from mdb.index import Index
 from mdb.insert import Insert
 from mdb.mdb import Mdb
+from mdb.migrate import Migrate
 from mdb.portfolio_management import PortfolioManagement
 from mdb.query import Query
@@ -16,11 +16,23 @@ import bson
 from pymongo import ASCENDING, DESCENDING
 import numpy
 import pandas
+from concurrent.futures import ThreadPoolExecutor
 from mdb.query import Query
+from mdb.dates import shift_date
+
+#Number of queries calculate_top_stocks runs at the same time
+#Keep at or below the MongoClient maxPoolSize
+ALGO_WORKERS = 8
 
 class Algo:
-    def __init__(self):
-        pass
+    def __init__(self, mirror = None, workers = ALGO_WORKERS):
+        """
+        @params:
+            mirror      - Optional  : read prices and performance from a local Mirror (Mirror)
+            workers     - Optional  : number of concurrent queries (Int)
+        """
+        self.mirror = mirror
+        self.workers = workers
 
     def calculate_top_stocks_old(self, ref_date):
         """
@@ -29,7 +41,7 @@ class Algo:
             ref_date    - Required  : date YYYY-MM-DD (Str)
         """
     
-        mdb_query = Query()
+        mdb_query = Query(self.mirror)
         #Get ranked stock list for given date
         symbols = mdb_query.get_active_companies().tolist()
         print( "Query earnings" )
@@ -125,11 +137,22 @@ class Algo:
             ref_date    - Required  : date YYYY-MM-DD (Str)
         """
     
-        mdb_query = Query()
+        mdb_query = Query(self.mirror)
         #Get ranked stock list for given date
         symbols = mdb_query.get_active_companies().tolist()
-        print( "Query balance sheets" )
-        balancesheets = mdb_query.get_balancesheets(symbols, ref_date, "latest")
+        #Balance sheets, prices and company data are independent
+        # so issue all the queries at once and merge at the end
+        #Every balance sheet and quote field is read, the stock list stores them all
+        print( "Query balance sheets, prices and company data" )
+        query_num = 100
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            balancesheets_future = executor.submit( mdb_query.get_balancesheets, symbols, ref_date, "latest" )
+            company_future = executor.submit( mdb_query.get_company, symbols, ["companyName"] )
+            prices_futures = [ executor.submit( mdb_query.get_quotes, symbols[idx_min:idx_min+query_num], ref_date, "latest" )
+                               for idx_min in range(0, len(symbols), query_num) ]
+            balancesheets = balancesheets_future.result()
+            company = company_future.result()
+            prices_splits = [ future.result() for future in prices_futures ]
         #earnings = earnings[["EPSReportDate","actualEPS","fiscalEndDate","fiscalPeriod","symbol"]]
         #print( earnings )
         #Get financials within 6 months
@@ -140,25 +163,13 @@ class Algo:
         #financials = financials[["symbol","reportDate","netIncome","shareholderEquity"]]
         #print( financials )
         #Get prices for inception date
-        print( "Query prices" )
-        idx_min = 0
-        query_num = 100
-        prices = pandas.DataFrame()
-        while idx_min < len(symbols):
-            idx_max = idx_min + query_num
-            if idx_max > len(symbols):
-                idx_max = len(symbols)
-            symbols_split = symbols[idx_min:idx_max]
-            prices_split = mdb_query.get_quotes(symbols_split, ref_date, "latest")
-            prices = prices.append(prices_split, ignore_index=True, sort=False)
-            idx_min = idx_min + query_num
+        prices = pandas.concat( prices_splits, axis=0, ignore_index=True, sort=False ) if prices_splits else pandas.DataFrame(columns=["symbol","date"])
         #Get prices within 7 days
-        fiveDaysBeforeDate = (pandas.Timestamp(ref_date) + pandas.DateOffset(days=-7)).strftime('%Y-%m-%d')
+        fiveDaysBeforeDate = shift_date(ref_date, -7)
         prices = prices[ prices['date'] >= fiveDaysBeforeDate ]
         prices.reset_index(drop=True, inplace=True)
         #print( prices )
         #Get company data
-        company = mdb_query.get_company( symbols )
         company = company[['symbol','companyName']]
         #Merge dataframes together
         print( "Merge dataframes" )
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Storage backends behind Mdb.db, MongoDB or an embedded SQLite file
+"""
+
+import json
+import datetime
+import threading
+from types import SimpleNamespace
+import bson
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+class MongoBackend:
+    #Supports aggregation pipelines such as $group and $lookup
+    aggregation = True
+
+    def database(self):
+        """
+        Return the diywealth database on the process wide MongoClient
+        """
+
+        from mdb.mdb import get_client
+        return get_client().diywealth
+
+    def bulk_update(self, collection, requests):
+        """
+        Apply updates in one unordered bulk write
+        Returns the number of documents inserted by upserts and modified
+        @params:
+            collection  - Required  : collection from database()
+            requests    - Required  : (filter, update, upsert) tuples ([Tuple])
+        """
+
+        result = collection.bulk_write( [ UpdateOne( query, update, upsert=upsert ) for query, update, upsert in requests ],
+                                        ordered=False )
+
+        return result.upserted_count, result.modified_count
+
+class SqliteBackend:
+    #Latest per key uses SQL window functions instead of $group
+    aggregation = False
+
+    def __init__(self, path = "output/diywealth.sqlite"):
+        """
+        Collections stored as JSON documents in an SQLite file through peewee
+        Needs SQLite 3.25 or later for window functions
+        All threads share one connection, serialised by a lock, so ":memory:" is visible to worker threads
+        @params:
+            path        - Optional  : database file, ":memory:" for in memory (Str)
+        """
+
+        from peewee import SqliteDatabase
+        self.path = path
+        #peewee opens a connection per thread unless thread_safe is off
+        self._sql = SqliteDatabase(path, pragmas={ "journal_mode": "wal", "synchronous": "normal" },
+                                   thread_safe=False, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._database = SqliteDocuments(self)
+
+    def database(self):
+        return self._database
+
+    def bulk_update(self, collection, requests):
+        """
+        Apply updates in one transaction, see SqliteCollection.bulk_update
+        Returns the number of documents inserted by upserts and modified
+        @params:
+            collection  - Required  : collection from database()
+            requests    - Required  : (filter, update, upsert) tuples ([Tuple])
+        """
+
+        result = collection.bulk_update( requests )
+
+        return result.upserted_count, result.modified_count
+
+    def execute(self, sql, params = ()):
+        """
+        Run a statement and return all rows
+        @params:
+            sql         - Required  : SQL statement (Str)
+            params      - Optional  : bound parameters (Tuple)
+        """
+
+        with self._lock:
+            with self._sql.atomic():
+                return self._sql.execute_sql(sql, params).fetchall()
+
+class SqliteDocuments:
+    def __init__(self, backend):
+        """
+        Database object handing out SqliteCollection by attribute or name
+        """
+
+        self._backend = backend
+        self._collections = {}
+
+    def __getitem__(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = SqliteCollection(self._backend, name)
+            self._collections[name] = collection
+        return collection
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+def _encode(value):
+    """
+    JSON encoding of values pymongo would store natively
+    """
+
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, bson.ObjectId):
+        return str(value)
+    #numpy scalars
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError("Cannot store " + type(value).__name__)
+
+def _dumps(doc):
+    #SQLite JSON has no NaN, store missing numbers as null
+    clean = { k: (None if isinstance(v, float) and v != v else v) for k, v in doc.items() }
+    return json.dumps(clean, default=_encode)
+
+def _param(value):
+    """
+    Bound parameter compared against a json_extract value
+    """
+
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (datetime.datetime, bson.ObjectId)) or hasattr(value, "item"):
+        return _encode(value)
+    return value
+
+def _path(field):
+    return "json_extract(doc, '$." + field.replace("'", "''") + "')"
+
+def translate_filter(query):
+    """
+    Return SQL WHERE clause and parameters for a MongoDB filter
+    Supports equality, $in, $nin, $ne, $gt, $gte, $lt, $lte, $exists, $type string, $or and $and
+    @params:
+        query       - Required  : MongoDB filter (Dict)
+    """
+
+    clauses = []
+    params = []
+    for field, condition in query.items():
+        if field in ["$or", "$and"]:
+            parts = [ translate_filter(sub) for sub in condition ]
+            joiner = " OR " if field == "$or" else " AND "
+            clauses.append( "(" + joiner.join( "(" + sql + ")" for sql, p in parts ) + ")" )
+            for sql, p in parts:
+                params += p
+            continue
+        column = _path(field)
+        if not isinstance(condition, dict):
+            condition = { "$eq": condition }
+        for op, value in condition.items():
+            if op in ["$eq", "$ne"] and value is None:
+                clauses.append( column + (" IS NULL" if op == "$eq" else " IS NOT NULL") )
+            elif op == "$eq":
+                clauses.append( column + " = ?" )
+                params.append( _param(value) )
+            elif op == "$ne":
+                clauses.append( "(" + column + " IS NULL OR " + column + " != ?)" )
+                params.append( _param(value) )
+            elif op in ["$in", "$nin"]:
+                if len(value) == 0:
+                    clauses.append( "0" if op == "$in" else "1" )
+                    continue
+                marks = ", ".join( "?" * len(value) )
+                if op == "$in":
+                    clauses.append( column + " IN (" + marks + ")" )
+                else:
+                    clauses.append( "(" + column + " IS NULL OR " + column + " NOT IN (" + marks + "))" )
+                params += [ _param(v) for v in value ]
+            elif op in ["$gt", "$gte", "$lt", "$lte"]:
+                sign = { "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<=" }[op]
+                clauses.append( column + " " + sign + " ?" )
+                params.append( _param(value) )
+            elif op == "$exists":
+                clauses.append( "json_type(doc, '$." + field + "') IS " + ("NOT NULL" if value else "NULL") )
+            elif op == "$type" and value == "string":
+                clauses.append( "json_type(doc, '$." + field + "') = 'text'" )
+            else:
+                raise NotImplementedError("Unsupported operator for SQLite backend: " + op)
+
+    if not clauses:
+        return "1", []
+
+    return " AND ".join(clauses), params
+
+def _order_by(sort):
+    return ", ".join( _path(field) + (" DESC" if direction == DESCENDING else " ASC") for field, direction in sort )
+
+def _project(doc, projection):
+    """
+    Apply a MongoDB inclusion or exclusion projection to a document
+    """
+
+    if not projection:
+        return doc
+    include = [ f for f, v in projection.items() if v and f != "_id" ]
+    if include:
+        result = { f: doc[f] for f in include if f in doc }
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+
+    return { f: v for f, v in doc.items() if projection.get(f, 1) }
+
+class SqliteCursor:
+    def __init__(self, collection, query, projection):
+        """
+        Lazy find, run when iterated like a pymongo cursor
+        """
+
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key, direction = ASCENDING):
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __iter__(self):
+        where, params = translate_filter(self._query)
+        sql = "SELECT doc FROM " + self._collection.table + " WHERE " + where
+        if self._sort:
+            sql += " ORDER BY " + _order_by(self._sort)
+        if self._limit:
+            sql += " LIMIT " + str(int(self._limit))
+        for row in self._collection.execute(sql, params):
+            yield _project( json.loads(row[0]), self._projection )
+
+class SqliteCollection:
+    def __init__(self, backend, name):
+        """
+        One table (id, doc) per collection, doc holds the JSON document
+        """
+
+        self._backend = backend
+        self.name = name
+        self.table = '"' + name + '"'
+        self._backend.execute("CREATE TABLE IF NOT EXISTS " + self.table + " (id INTEGER PRIMARY KEY, doc TEXT NOT NULL)")
+        self._index_unique_keys()
+
+    def _index_unique_keys(self):
+        """
+        Index the natural key so bulk_update finds documents without a table scan
+        The plain index is replaced by the unique one when Index().ensure_indexes() runs
+        """
+
+        from mdb.index import INDEXES, UNIQUE_KEYS
+
+        for keys in INDEXES.get(self.name, []):
+            if [ field for field, direction in keys ] != UNIQUE_KEYS.get(self.name):
+                continue
+            unique = self.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (self._index_name(keys, True),))
+            if not unique:
+                self.create_indexes( [IndexModel( keys )] )
+
+    def execute(self, sql, params = ()):
+        return self._backend.execute(sql, params)
+
+    def find(self, query = {}, projection = None):
+        return SqliteCursor(self, query, projection)
+
+    def find_one(self, query = {}, projection = None, sort = None):
+        cursor = self.find(query, projection).limit(1)
+        if sort is not None:
+            cursor.sort(sort)
+        for doc in cursor:
+            return doc
+        return None
+
+    def find_latest(self, match, date_field, key = "symbol", projection = None):
+        """
+        Latest document per key with a ROW_NUMBER window
+        @params:
+            match       - Required  : MongoDB filter (Dict)
+            date_field  - Required  : field ordering the documents (Str)
+            key         - Optional  : field to group documents by (Str)
+            projection  - Optional  : MongoDB projection (Dict)
+        """
+
+        where, params = translate_filter(match)
+        sql = ("SELECT doc FROM (SELECT doc, ROW_NUMBER() OVER (PARTITION BY " + _path(key) +
+               " ORDER BY " + _path(date_field) + " DESC) AS rn FROM " + self.table + " WHERE " + where +
+               ") WHERE rn = 1 ORDER BY " + _path(key))
+        return [ _project( json.loads(row[0]), projection ) for row in self.execute(sql, params) ]
+
+    def distinct(self, key, query = {}):
+        where, params = translate_filter(query)
+        sql = "SELECT DISTINCT " + _path(key) + " FROM " + self.table + " WHERE " + where
+        return [ row[0] for row in self.execute(sql, params) if row[0] is not None ]
+
+    def count_documents(self, query = {}):
+        where, params = translate_filter(query)
+        return self.execute("SELECT COUNT(*) FROM " + self.table + " WHERE " + where, params)[0][0]
+
+    def insert_one(self, doc):
+        return SimpleNamespace( inserted_id=self.insert_many([doc]).inserted_ids[0] )
+
+    def insert_many(self, docs, ordered = True):
+        ids = []
+        rows = []
+        for doc in docs:
+            #Same side effect as pymongo, the caller's document gets an _id
+            if "_id" not in doc:
+                doc["_id"] = bson.ObjectId()
+            ids.append( doc["_id"] )
+            rows.append( (_dumps(doc),) )
+        with self._backend._lock:
+            with self._backend._sql.atomic():
+                self._backend._sql.cursor().executemany("INSERT INTO " + self.table + " (doc) VALUES (?)", rows)
+
+        return SimpleNamespace( inserted_ids=ids )
+
+    def bulk_update(self, requests):
+        """
+        Apply (filter, update, upsert) tuples, only a $set of constant values is supported
+        Upserts copy the equality conditions of the filter into the new document
+        """
+
+        matched = 0
+        upserted = 0
+        with self._backend._lock:
+            with self._backend._sql.atomic():
+                for query, update, upsert in requests:
+                    if not isinstance(update, dict) or list(update.keys()) != ["$set"]:
+                        raise NotImplementedError("SQLite backend only supports {$set: {...}} updates")
+                    where, params = translate_filter(query)
+                    rows = self._backend._sql.execute_sql("SELECT id, doc FROM " + self.table + " WHERE " + where + " LIMIT 1", params).fetchall()
+                    if rows:
+                        doc = json.loads(rows[0][1])
+                        doc.update( update["$set"] )
+                        self._backend._sql.execute_sql("UPDATE " + self.table + " SET doc = ? WHERE id = ?", (_dumps(doc), rows[0][0]))
+                        matched += 1
+                    elif upsert:
+                        doc = { field: value for field, value in query.items() if not isinstance(value, dict) and not field.startswith("$") }
+                        doc.update( update["$set"] )
+                        doc["_id"] = bson.ObjectId()
+                        self._backend._sql.execute_sql("INSERT INTO " + self.table + " (doc) VALUES (?)", (_dumps(doc),))
+                        upserted += 1
+
+        return SimpleNamespace( matched_count=matched, modified_count=matched, upserted_count=upserted )
+
+    def delete_many(self, query):
+        where, params = translate_filter(query)
+        count = self.count_documents(query)
+        self.execute("DELETE FROM " + self.table + " WHERE " + where, params)
+
+        return SimpleNamespace( deleted_count=count )
+
+    def update_many(self, query, update):
+        """
+        Only $set of constant values is supported
+        """
+
+        if not isinstance(update, dict) or list(update.keys()) != ["$set"]:
+            raise NotImplementedError("SQLite backend only supports {$set: {...}} updates")
+        where, params = translate_filter(query)
+        count = self.count_documents(query)
+        sets = ", ".join( "'$." + field + "', json(?)" for field in update["$set"] )
+        values = [ json.dumps(value, default=_encode) for value in update["$set"].values() ]
+        self.execute("UPDATE " + self.table + " SET doc = json_set(doc, " + sets + ") WHERE " + where, values + params)
+
+        return SimpleNamespace( modified_count=count )
+
+    def find_duplicates(self, keys):
+        """
+        SQL equivalent of the Delete.delete_duplicates $group, one entry per duplicated key
+        Each entry is { "_id": { key: value }, "keep": largest _id, "count": documents }
+        @params:
+            keys        - Required  : fields identifying a document ([Str])
+        """
+
+        columns = ", ".join( _path(key) for key in keys )
+        sql = ("SELECT " + columns + ", MAX(" + _path("_id") + "), COUNT(*) FROM " + self.table +
+               " GROUP BY " + columns + " HAVING COUNT(*) > 1")
+
+        return [ { "_id": dict( zip( keys, row[:len(keys)] ) ), "keep": row[len(keys)], "count": row[-1] }
+                 for row in self.execute(sql) ]
+
+    def _index_name(self, keys, unique = False):
+        name = self.name + "_" + "_".join( field + "_" + str(direction) for field, direction in keys ).replace("-", "m").replace(".", "_")
+        if unique:
+            name += "_unique"
+        return name
+
+    def create_indexes(self, models):
+        """
+        Create expression indexes for pymongo IndexModel objects
+        A unique index replaces the plain index on the same keys
+        Duplicate keys raise OperationFailure with code 11000 like MongoDB
+        """
+
+        from peewee import IntegrityError
+
+        names = []
+        for model in models:
+            keys = list(model.document["key"].items())
+            unique = model.document.get("unique", False)
+            name = self._index_name(keys, unique)
+            columns = ", ".join( _path(field) + (" DESC" if direction == DESCENDING else "") for field, direction in keys )
+            try:
+                self.execute("CREATE " + ("UNIQUE " if unique else "") + "INDEX IF NOT EXISTS \"" + name + "\" ON " + self.table + " (" + columns + ")")
+            except IntegrityError as e:
+                raise OperationFailure( "E11000 duplicate key error creating " + name + ": " + str(e), code=11000 )
+            if unique:
+                self.drop_index( keys )
+            names.append( name )
+
+        return names
+
+    def drop_index(self, keys):
+        """
+        Drop the plain index on a list of (field, direction) pairs
+        @params:
+            keys        - Required  : index keys ([(Str, Int)])
+        """
+
+        self.execute("DROP INDEX IF EXISTS \"" + self._index_name(keys) + "\"")
+
+    def aggregate(self, pipeline, **kwargs):
+        #Query and Delete use find_latest, find_duplicates and a client side join instead
+        raise NotImplementedError("SQLite backend does not run aggregation pipelines, use the find_* equivalents")
+
+#Backend used by every Mdb object, MongoDB unless changed
+_backend = MongoBackend()
+
+def get_backend():
+    return _backend
+
+def use_backend(backend):
+    """
+    Store data in another backend for the rest of the process
+    e.g. use_backend(SqliteBackend("output/diywealth.sqlite"))
+    @params:
+        backend     - Required  : MongoBackend or SqliteBackend
+    """
+
+    global _backend
+    _backend = backend
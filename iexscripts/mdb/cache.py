@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+In-process cache of Query results
+"""
+
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+import pandas
+
+#Derived results to drop when a source collection changes
+DERIVED = {
+    "iex_symbols": ["universe"],
+    "iex_company": ["universe"],
+}
+
+#Default memory the cached results may hold, in bytes
+MAX_BYTES = 512 * 1024 * 1024
+
+def result_size(value):
+    """
+    Return the memory held by a cached result in bytes
+    @params:
+        value       - Required  : cached value (DataFrame, Series or other)
+    """
+
+    if isinstance(value, pandas.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pandas.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    return sys.getsizeof(value)
+
+class QueryCache:
+    def __init__(self, max_entries = 256, ttl = 3600, max_bytes = MAX_BYTES):
+        """
+        Size bounded LRU cache of query results with a time to live
+        Results larger than max_bytes on their own are not cached
+        Disabled until enable() is called
+        @params:
+            max_entries - Optional  : maximum number of cached results (Int)
+            ttl         - Optional  : seconds before a result expires (Float)
+            max_bytes   - Optional  : maximum memory held by the cached results (Int)
+        """
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enable(self, max_entries = None, ttl = None, max_bytes = None):
+        """
+        Turn the cache on
+        @params:
+            max_entries - Optional  : maximum number of cached results (Int)
+            ttl         - Optional  : seconds before a result expires (Float)
+            max_bytes   - Optional  : maximum memory held by the cached results (Int)
+        """
+
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if ttl is not None:
+            self.ttl = ttl
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.enabled = True
+
+    def disable(self):
+        """
+        Turn the cache off and drop all entries
+        """
+
+        self.enabled = False
+        self.invalidate()
+
+    def make_key(self, collection, *parts):
+        """
+        Return a hashable key for a query on a collection
+        @params:
+            collection  - Required  : collection name (Str)
+            parts       - Optional  : filter, projection, sort etc.
+        """
+
+        return (collection, json.dumps(parts, sort_keys=True, default=str))
+
+    def get(self, key):
+        """
+        Return cached value or None if missing or expired
+        @params:
+            key         - Required  : key from make_key (Tuple)
+        """
+
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, value = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            #Mark as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used entries if full
+        @params:
+            key         - Required  : key from make_key (Tuple)
+            value       - Required  : value to cache
+        """
+
+        if not self.enabled:
+            return
+
+        size = result_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        """
+        Remove an entry, the lock must be held
+        @params:
+            key         - Required  : key from make_key (Tuple)
+        """
+
+        expires, size, value = self._entries.pop(key)
+        self.bytes -= size
+
+    def invalidate(self, collection = None):
+        """
+        Drop cached results for a collection, or everything
+        @params:
+            collection  - Optional  : collection name, None for all (Str)
+        """
+
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+                self.bytes = 0
+                return
+            collections = [collection] + DERIVED.get(collection, [])
+            for key in [ k for k in self._entries if k[0] in collections ]:
+                self._drop(key)
+
+#Process wide cache shared by every Query object
+query_cache = QueryCache()
+
+def enable_query_cache(max_entries = None, ttl = None, max_bytes = None):
+    """
+    Cache Query results for the rest of the process
+    @params:
+        max_entries - Optional  : maximum number of cached results (Int)
+        ttl         - Optional  : seconds before a result expires (Float)
+        max_bytes   - Optional  : maximum memory held by the cached results (Int)
+    """
+
+    query_cache.enable(max_entries, ttl, max_bytes)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Journal of the steps and symbols a job has finished, so a crashed run can resume
+"""
+
+import datetime
+import pandas
+from mdb.mdb import Mdb
+from mdb.cache import query_cache
+from mdb.ingest import write_documents
+
+#One document per job and step, keyed by UNIQUE_KEYS
+CHECKPOINTS = "job_checkpoints"
+
+class Checkpoint(Mdb):
+    def __init__(self, job, resume = False, runID = None):
+        """
+        Progress journal of one run of an entry script
+        Without resume the journal of the job is cleared and every step starts from scratch
+        With resume only steps and symbols journaled under the same runID are skipped
+        @params:
+            job         - Required  : job name e.g. daily (Str)
+            resume      - Optional  : skip steps and symbols an earlier attempt of this run finished (Bool)
+            runID       - Optional  : run identifier, defaults to today's date YYYY-MM-DD (Str)
+        """
+
+        #Inherit all methods and properties from Mdb
+        super().__init__()
+        self.job = job
+        self.resume = resume
+        self.runID = runID if runID is not None else datetime.date.today().strftime("%Y-%m-%d")
+        self._step = None
+        self._started = None
+        self._completed = set()
+        if not resume:
+            self.db[CHECKPOINTS].delete_many( { "job": self.job } )
+            query_cache.invalidate(CHECKPOINTS)
+
+    def _save(self, status, error = None):
+        doc = { "job": self.job,
+                "step": self._step,
+                "runID": self.runID,
+                "status": status,
+                "started": self._started,
+                "updated": datetime.datetime.now(),
+                "completed": sorted(self._completed),
+                "error": error }
+        write_documents( self.db, CHECKPOINTS, [doc] )
+
+    def run(self, step, function, *args, **kwargs):
+        """
+        Run one step of the job unless an earlier attempt of this run finished it
+        The step is marked failed if it raises, the exception is not caught
+        @params:
+            step        - Required  : step name e.g. insert_quotes (Str)
+            function    - Required  : function running the step
+            args        - Optional  : arguments of function
+        """
+
+        self._step = step
+        self._started = datetime.datetime.now()
+        self._completed = set()
+        previous = self.db[CHECKPOINTS].find_one( { "job": self.job, "step": step } )
+        #Journal entries left by a different run are stale and ignored
+        if self.resume and previous is not None and previous.get("runID") == self.runID:
+            if previous["status"] == "complete":
+                print( "Skipping " + step + ", finished at " + str(previous["updated"]) )
+                return None
+            self._started = previous.get("started", self._started)
+            self._completed = set( previous.get("completed", []) )
+            print( "Resuming " + step + " after " + str(len(self._completed)) + " completed symbols" )
+        self._save("running")
+
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self._save("failed", type(e).__name__ + ": " + str(e))
+            raise
+        self._save("complete")
+        self._step = None
+
+        return result
+
+    def completed(self):
+        """
+        Return the symbols the current step has already written
+        """
+
+        return set(self._completed)
+
+    def complete(self, items):
+        """
+        Record symbols whose data has been written
+        @params:
+            items       - Required  : symbols ([Str])
+        """
+
+        if self._step is None or not items:
+            return
+        self._completed.update(items)
+        self._save("running")
+
+    def status(self):
+        """
+        Return the journal of every step of the current run
+        """
+
+        results = self.db[CHECKPOINTS].find( { "job": self.job, "runID": self.runID }, { "_id": 0, "completed": 0 } )
+
+        return pandas.DataFrame( list(results) )
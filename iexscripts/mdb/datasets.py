@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Specifications of the time-keyed datasets served by Query
+"""
+
+from collections import namedtuple
+from pymongo import ASCENDING, DESCENDING
+from mdb.mirror import UPDATED_FIELD
+
+#collection - MongoDB collection
+#key        - field identifying the series, e.g. symbol
+#date_field - field the series is ordered by
+#lookback   - days before ref_date searched by "latest", None for no limit
+#drop       - columns removed from results when all fields are requested
+Dataset = namedtuple("Dataset", ["collection", "key", "date_field", "lookback", "drop"])
+
+DATASETS = {
+    "chart": Dataset("iex_charts", "symbol", "date", 10,
+                     ["_id",UPDATED_FIELD,"open","uClose","uHigh","uLow","uOpen","uVolume"]),
+    "quotes": Dataset("iex_quotes", "symbol", "date", 10, ["_id",UPDATED_FIELD]),
+    "dividends": Dataset("iex_dividends", "symbol", "exDate", None, ["_id"]),
+    "earnings": Dataset("iex_earnings", "symbol", "fiscalEndDate", None, ["_id"]),
+    "financials": Dataset("iex_financials", "symbol", "reportDate", None, ["_id"]),
+    "balancesheets": Dataset("iex_balancesheets", "symbol", "reportDate", None, ["_id",UPDATED_FIELD]),
+    "stats": Dataset("iex_stats", "symbol", "date", None, ["_id"]),
+}
+
+#Query modes understood by Query.get_dataset
+#after   - on or after ref_date
+#on      - exactly ref_date
+#between - from ref_date to end_date inclusive
+#latest  - most recent on or before ref_date, within the dataset lookback
+#asof    - most recent on or before ref_date, however old
+WHEN = ["after", "on", "between", "latest", "asof"]
+
+#Longest $in list sent to MongoDB in one query
+MAX_IN = 1000
+
+def latest_pipeline(match, date_field, key = "symbol", projection = None):
+    """
+    Return the aggregation pipeline selecting the latest document per key
+    Sorting on (key, date_field) lets MongoDB walk the compound index and
+    keep only the first document per key instead of the whole history
+    @params:
+        match       - Required  : MongoDB filter (Dict)
+        date_field  - Required  : field ordering the documents (Str)
+        key         - Optional  : field to group documents by (Str)
+        projection  - Optional  : MongoDB projection, None for whole documents (Dict)
+    """
+
+    if projection is None:
+        group = { "_id": "$" + key,
+                  "doc": { "$first": "$$ROOT" } }
+        reshape = { "$replaceRoot": { "newRoot": "$doc" } }
+    else:
+        group = { "_id": "$" + key,
+                  key: { "$first": "$" + key } }
+        for field in projection:
+            if field != "_id":
+                group[field] = { "$first": "$" + field }
+        reshape = { "$project": { "_id": 0 } }
+
+    return [ { "$match": match },
+             { "$sort": { key: ASCENDING, date_field: DESCENDING } },
+             { "$group": group },
+             reshape,
+             { "$sort": { key: ASCENDING } } ]
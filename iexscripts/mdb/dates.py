@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Native BSON dates stored alongside the YYYY-MM-DD string fields
+"""
+
+import datetime
+
+#Native copy of a string date field is stored as <field>Dt
+NATIVE_SUFFIX = "Dt"
+
+#String date fields given a native copy, per collection
+NATIVE_DATES = {
+    "iex_symbols": ["date"],
+    "iex_charts": ["date"],
+    "iex_quotes": ["date"],
+    "iex_stats": ["date"],
+    "iex_dividends": ["exDate","paymentDate"],
+    "iex_earnings": ["fiscalEndDate","EPSReportDate"],
+    "iex_financials": ["reportDate"],
+    "iex_balancesheets": ["reportDate"],
+    "pf_info": ["inceptionDate"],
+    "pf_transactions": ["date"],
+    "pf_holdings": ["lastUpdated"],
+    "pf_performance": ["date"],
+    "stock_list": ["date"],
+}
+
+#Whether Query filters and sorts on the native fields, see enable_native_reads
+_native_reads = False
+
+def native_field(field):
+    return field + NATIVE_SUFFIX
+
+def to_native(value):
+    """
+    Return YYYY-MM-DD string as a datetime, None if it is not a date
+    @params:
+        value       - Required  : date YYYY-MM-DD (Str)
+    """
+
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.strptime(value[:10], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+def shift_date(date, days = 1):
+    """
+    Return the date a number of days after a YYYY-MM-DD date
+    @params:
+        date        - Required  : date YYYY-MM-DD (Str)
+        days        - Optional  : days to add, negative to subtract (Int)
+    """
+
+    return (datetime.date.fromisoformat(date[:10]) + datetime.timedelta(days=days)).isoformat()
+
+def add_native_dates(docs, collection):
+    """
+    Add the native date fields to documents about to be written
+    @params:
+        docs        - Required  : document or list of documents ([Dict])
+        collection  - Required  : collection written to (Str)
+    """
+
+    fields = NATIVE_DATES.get(collection, [])
+    for doc in ([docs] if isinstance(docs, dict) else docs):
+        for field in fields:
+            if field in doc:
+                doc[native_field(field)] = to_native(doc[field])
+
+    return docs
+
+def enable_native_reads(enabled = True):
+    """
+    Make Query filter and sort on native dates
+    Documents without a native copy would drop out of the results, so reads are only
+    enabled once Migrate.check_native_dates reports nothing missing
+    Returns whether native reads are enabled
+    @params:
+        enabled     - Optional  : read native fields (Bool)
+    """
+
+    global _native_reads
+    if enabled:
+        from mdb.migrate import Migrate
+        report = Migrate().check_native_dates()
+        missing = report[report["missing"] > 0] if not report.empty else report
+        if not missing.empty:
+            print( "WARNING native reads not enabled, documents without native dates in " +
+                   ", ".join( missing["collection"] + "." + missing["field"] ) + ", run diyw_migrate.py first" )
+            return _native_reads
+    _native_reads = enabled
+
+    return _native_reads
+
+def native_reads():
+    return _native_reads
+
+def native_query(query, collection):
+    """
+    Return a MongoDB filter with string date conditions moved to native fields
+    @params:
+        query       - Required  : MongoDB filter (Dict)
+        collection  - Required  : collection name (Str)
+    """
+
+    fields = NATIVE_DATES.get(collection, [])
+    result = {}
+    for field, condition in query.items():
+        if field not in fields:
+            result[field] = condition
+        elif isinstance(condition, dict):
+            result[native_field(field)] = { op: ([to_native(v) for v in value] if isinstance(value, list) else to_native(value))
+                                            for op, value in condition.items() }
+        else:
+            result[native_field(field)] = to_native(condition)
+
+    return result
+
+def native_sort(sort, collection):
+    """
+    Return a sort specification on native date fields
+    @params:
+        sort        - Required  : sort specification ([(Str, Int)])
+        collection  - Required  : collection name (Str)
+    """
+
+    if sort is None:
+        return None
+    fields = NATIVE_DATES.get(collection, [])
+
+    return [ (native_field(field) if field in fields else field, direction) for field, direction in sort ]
+
+def strip_native_dates(frame, collection):
+    """
+    Drop the native copies from a query result, callers use the string fields
+    @params:
+        frame       - Required  : query result (DataFrame)
+        collection  - Required  : collection name (Str)
+    """
+
+    columns = [ native_field(f) for f in NATIVE_DATES.get(collection, []) if native_field(f) in frame.columns ]
+    if columns:
+        frame = frame.drop(columns, axis=1)
+
+    return frame
@@ -18,6 +18,11 @@ import numpy
 import pandas
 from iexscripts.utils import printProgressBar
 from mdb.mdb import Mdb
+from mdb.cache import query_cache
+from mdb.materialize import cursor_to_dataframe
+from mdb.datasets import MAX_IN
+from mdb.index import UNIQUE_KEYS
+from mdb.mirror import MIRRORED, record_delete
 from mdb.query import Query
 
 class Delete(Mdb):
@@ -25,85 +30,57 @@ class Delete(Mdb):
         #Inherit all methods and properties from Mdb
         super().__init__()
 
-    def delete_duplicate_charts(self, ref_date = "1990-01-01", when = "on"):
+    def delete_duplicates(self, collections = None, dry_run = False):
         """
-        Delete duplicates prices in MongoDB
+        Delete documents sharing a UNIQUE_KEYS key, keeping the last inserted
+        One aggregation per collection finds the duplicated keys, then their extra documents are read per key
+        Run before Index().ensure_indexes() can create the unique indexes
         @params:
-            ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : on, latest (Str)
-        """
-    
-        mdb_query = Query()
-        mdb_symbols = mdb_query.get_symbols()
-        #mdb_symbols = mdb_symbols.iloc[ 999: , : ]
-        mdb_symbols.reset_index(drop=True, inplace=True)
-        #mdb_symbols = ["A"]
-        #print( mdb_symbols )
-        printProgressBar(0, len(mdb_symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        for index, symbol in mdb_symbols.iterrows():
-            #if index > 10:
-            #    break
-            #print( symbol )
-            query = { "symbol": { "$in": [symbol["symbol"]] },
-                        "date": { "$gte": "2017-01-01" } }
-            results = self.db.iex_charts.find( query ).sort("date", DESCENDING)
-            chart = pandas.DataFrame()
-            for doc in results:
-                chart = chart.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
-            duplicates = chart[chart.duplicated(['date'])]
-            #print( duplicates )
-        
-            # Remove all duplicates in one go    
-            #if not duplicates.empty:
-            #    self.db.iex_charts.delete_many({"_id":{"$in":duplicates['_id'].tolist()}})
-            # Remove duplicates if they exist
-            if not duplicates.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Deleting duplicates for " + symbol["symbol"] + "      ", length = 50)
-                self.db.iex_charts.delete_many({"_id":{"$in":duplicates['_id'].tolist()}})
-            else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No duplicates for " + symbol["symbol"] + "      ", length = 50)
-    
-    def delete_duplicate_balancesheets(self, ref_date = "1990-01-01", when = "on"):
-        """
-        Delete duplicates prices in MongoDB
-        @params:
-            ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : on, latest (Str)
+            collections - Optional  : collections to clean, None for all with a key ([Str])
+            dry_run     - Optional  : only report the duplicates (Bool)
         """
-    
-        mdb_query = Query()
-        mdb_symbols = mdb_query.get_symbols()
-        #mdb_symbols = mdb_symbols.iloc[ 999: , : ]
-        mdb_symbols.reset_index(drop=True, inplace=True)
-        #mdb_symbols = ["A"]
-        #print( mdb_symbols )
-        printProgressBar(0, len(mdb_symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        for index, symbol in mdb_symbols.iterrows():
-            #if index > 10:
-            #    break
-            #print( symbol )
-            query = { "symbol": { "$in": [symbol["symbol"]] },
-                        "reportDate": { "$gte": ref_date } }
-            results = self.db.iex_balancesheets.find( query ).sort("reportDate", DESCENDING)
-            balancesheets = pandas.DataFrame()
-            for doc in results:
-                balancesheets = balancesheets.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
-            duplicates = balancesheets[balancesheets.duplicated(['reportDate'])]
-            print( duplicates )
-        
-            # Remove all duplicates in one go    
-            #if not duplicates.empty:
-            #    self.db.iex_charts.delete_many({"_id":{"$in":duplicates['_id'].tolist()}})
-            # Remove duplicates if they exist
-            if not duplicates.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Deleting duplicates for " + symbol["symbol"] + "      ", length = 50)
-                #self.db.iex_balancesheets.delete_many({"_id":{"$in":duplicates['_id'].tolist()}})
+
+        if collections is None:
+            collections = list(UNIQUE_KEYS.keys())
+
+        report = []
+        for collection in collections:
+            keys = UNIQUE_KEYS[collection]
+            #Only count per key, ids are collected for the duplicated keys alone
+            #A missing key groups with null as in the unique index, $group would otherwise leave it out of _id
+            pipeline = [ { "$group": { "_id": { key: { "$ifNull": [ "$" + key, None ] } for key in keys },
+                                       "keep": { "$max": "$_id" },
+                                       "count": { "$sum": 1 } } },
+                         { "$match": { "count": { "$gt": 1 } } } ]
+            if self.backend.aggregation:
+                groups = list( self.db[collection].aggregate( pipeline, allowDiskUse=True ) )
             else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No duplicates for " + symbol["symbol"] + "      ", length = 50)
+                groups = self.db[collection].find_duplicates( keys )
+            #Dates of the deleted documents tell the mirror which months to rebuild
+            date_field = MIRRORED.get(collection)
+            projection = { "_id": 1 }
+            if date_field is not None:
+                projection[date_field] = 1
+            duplicates = []
+            dates = []
+            for group in groups:
+                #Every key is matched, None selects documents missing the field
+                query = { key: group["_id"].get(key) for key in keys }
+                query["_id"] = { "$ne": group["keep"] }
+                for doc in self.db[collection].find( query, projection ):
+                    duplicates.append( doc["_id"] )
+                    if doc.get(date_field) is not None:
+                        dates.append( doc[date_field] )
+            report.append( { "collection": collection, "duplicates": len(duplicates) } )
+            print( str(len(duplicates)) + " duplicates in " + collection )
+            if duplicates and not dry_run:
+                for idx_min in range(0, len(duplicates), MAX_IN):
+                    self.db[collection].delete_many({"_id":{"$in":duplicates[idx_min:idx_min+MAX_IN]}})
+                if dates:
+                    record_delete( self.db, collection, min(dates), max(dates) )
+                query_cache.invalidate(collection)
+
+        return pandas.DataFrame(report)
     
     def delete_dividends(self, ref_date = "1990-01-01", when = "after"):
         """
@@ -116,11 +93,10 @@ class Delete(Mdb):
         query = { "type": "dividend",
                   "date": { "$gte": ref_date } }
         results = self.db.pf_transactions.find( query )
-        transactions = pandas.DataFrame()
-        for doc in results:
-            transactions = transactions.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        transactions = cursor_to_dataframe( results )
         if not transactions.empty:
             self.db.pf_transactions.delete_many({"_id":{"$in":transactions['_id'].tolist()}})
+            query_cache.invalidate("pf_transactions")
     
     def delete_performance(self, ref_date = "1990-01-01", when = "after"):
         """
@@ -132,13 +108,15 @@ class Delete(Mdb):
     
         query = { "date": { "$gte": ref_date } }
         results = self.db.pf_performance.find( query )
-        performances = pandas.DataFrame()
-        for doc in results:
-            performances = performances.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        performances = cursor_to_dataframe( results )
         if not performances.empty:
             self.db.pf_performance.delete_many({"_id":{"$in":performances['_id'].tolist()}})
+            record_delete( self.db, "pf_performance", first=ref_date )
+            query_cache.invalidate("pf_performance")
     
     #Delete prices before 2018 from MongoDB because it was full
     def delete_prices(self):
         query = { "date": { "$lt": "2018-06-20" } }
         self.db.iex_charts.delete_many( query )
+        record_delete( self.db, "iex_charts", last="2018-06-19" )
+        query_cache.invalidate("iex_charts")
@@ -16,13 +16,17 @@ import datetime
 from mdb.query import Query
 
 class Export:
-    def __init__(self):
-        pass
+    def __init__(self, mirror = None):
+        """
+        @params:
+            mirror      - Optional  : read prices and performance from a local Mirror (Mirror)
+        """
+        self.mirror = mirror
 
     #Export latest stock lists
     def export_stock_list(self):
         print( "Exporting stock list to json" )
-        mdb_query = Query()
+        mdb_query = Query(self.mirror)
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
         #currDate = "2019-05-01"
         latestStockList = mdb_query.get_stock_list(currDate, "latest")
@@ -33,15 +37,23 @@ class Export:
     #Export latest performance
     def export_performance(self):
         print( "Exporting performance tables to json" )
-        mdb_query = Query()
+        mdb_query = Query(self.mirror)
         #Start date
         startDate = "2018-07-02"
         #Get list of portfolios
-        portfolios = mdb_query.get_portfolios(startDate)["portfolioID"].tolist()
+        portfolios = mdb_query.get_portfolios(startDate, [])["portfolioID"].tolist()
         #Export SPY performance
-        spy_charts = mdb_query.get_chart(["SPY"]).sort_values(by="date", ascending=True, axis="index")
-        spy_charts.reset_index(drop=True, inplace=True)
-        spy_quotes = mdb_query.get_quotes(["SPY"]).sort_values(by="date", ascending=True, axis="index")
+        #Stream the SPY history a year at a time, keeping only
+        # the last close before startDate and everything after it
+        spy_before = []
+        spy_after = []
+        for spy_chunk in mdb_query.iter_chart(["SPY"], fields=["close"], ascending=True, window="year"):
+            before = spy_chunk[spy_chunk.date < startDate]
+            if not before.empty:
+                spy_before = [before.tail(1)]
+            spy_after.append( spy_chunk[spy_chunk.date >= startDate] )
+        spy_charts = pandas.concat( spy_before + spy_after, axis=0, ignore_index=True, sort=False )
+        spy_quotes = mdb_query.get_quotes(["SPY"], fields=["close"]).sort_values(by="date", ascending=True, axis="index")
         spy_quotes.reset_index(drop=True, inplace=True)
         spy_quotes = spy_quotes[spy_quotes.date > spy_charts.date.iloc[-1]]
         spy_charts = spy_charts.append( spy_quotes, ignore_index=True, sort=False )
@@ -58,11 +70,11 @@ class Export:
         #spy_charts = spy_charts[["date","return"]]
         #spy_return.to_json(path_or_buf="output/json/spy_performance.json", orient="records")
         #Get list of portfolios
-        portfolios = mdb_query.get_portfolios(startDate)["portfolioID"].tolist()
+        portfolios = mdb_query.get_portfolios(startDate, [])["portfolioID"].tolist()
         #Loop through portfolios
         for portfolio in portfolios:
             #Get portfolio performance data
-            perf_table = mdb_query.get_performance([portfolio], startDate).sort_values(by="date", ascending=True, axis="index")
+            perf_table = mdb_query.get_performance([portfolio], startDate, ["percentReturn"]).sort_values(by="date", ascending=True, axis="index")
             #print( perf_table )
             perf_dates = perf_table["date"].tolist()
             perf_dates.insert(0, spy_charts["date"].iloc[0])
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Declarative index catalog for the DIYWealth collections
+"""
+
+import datetime
+import pandas
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from mdb.mdb import Mdb
+from mdb.instrument import plan_stages
+from mdb.datasets import DATASETS, latest_pipeline
+from mdb.dates import NATIVE_DATES, native_field, shift_date
+from mdb.mirror import MIRRORED, MIRROR_DELETES, UPDATED_FIELD
+
+#Indexes required by the Query, Insert and Delete access paths
+#Keyed by collection, each entry is a list of (field, direction) pairs
+INDEXES = {
+    "iex_symbols": [
+        [("symbol", ASCENDING), ("date", DESCENDING)],
+    ],
+    "iex_company": [
+        [("symbol", ASCENDING)],
+    ],
+    "iex_charts": [
+        [("symbol", ASCENDING), ("date", DESCENDING)],
+        [("date", DESCENDING)],
+    ],
+    "iex_quotes": [
+        [("symbol", ASCENDING), ("date", DESCENDING)],
+        [("date", DESCENDING)],
+    ],
+    "iex_stats": [
+        [("symbol", ASCENDING), ("date", DESCENDING)],
+    ],
+    "iex_dividends": [
+        [("symbol", ASCENDING), ("exDate", DESCENDING)],
+    ],
+    "iex_earnings": [
+        [("symbol", ASCENDING), ("fiscalEndDate", DESCENDING)],
+        [("symbol", ASCENDING), ("EPSReportDate", DESCENDING)],
+    ],
+    "iex_financials": [
+        [("symbol", ASCENDING), ("reportDate", DESCENDING)],
+    ],
+    "iex_balancesheets": [
+        [("symbol", ASCENDING), ("reportDate", DESCENDING)],
+        [("reportDate", DESCENDING)],
+    ],
+    "pf_info": [
+        [("portfolioID", ASCENDING)],
+    ],
+    "pf_transactions": [
+        [("portfolioID", ASCENDING), ("date", ASCENDING)],
+        [("type", ASCENDING), ("date", ASCENDING)],
+    ],
+    "pf_holdings": [
+        [("portfolioID", ASCENDING), ("lastUpdated", DESCENDING)],
+        [("portfolioID", ASCENDING), ("symbol", ASCENDING), ("lastUpdated", DESCENDING)],
+    ],
+    "pf_performance": [
+        [("portfolioID", ASCENDING), ("date", DESCENDING)],
+        [("date", DESCENDING)],
+    ],
+    "stock_list": [
+        [("date", DESCENDING), ("symbol", ASCENDING)],
+    ],
+    "job_checkpoints": [
+        [("job", ASCENDING), ("step", ASCENDING)],
+    ],
+    MIRROR_DELETES: [
+        [("collection", ASCENDING), (UPDATED_FIELD, ASCENDING)],
+    ],
+}
+
+#Natural key of each collection, the catalog index on exactly these fields is unique
+#Insert writes upsert on them so reruns replace documents instead of duplicating them
+#pf_transactions has no natural key, two identical trades on a day are allowed
+#iex_dividends has none either, a regular and a special dividend can share an exDate
+UNIQUE_KEYS = {
+    "iex_symbols": ["symbol", "date"],
+    "iex_company": ["symbol"],
+    "iex_charts": ["symbol", "date"],
+    "iex_quotes": ["symbol", "date"],
+    "iex_stats": ["symbol", "date"],
+    "iex_earnings": ["symbol", "fiscalEndDate"],
+    "iex_financials": ["symbol", "reportDate"],
+    "iex_balancesheets": ["symbol", "reportDate"],
+    "pf_info": ["portfolioID"],
+    "pf_holdings": ["portfolioID", "symbol", "lastUpdated"],
+    "pf_performance": ["portfolioID", "date"],
+    "stock_list": ["date", "symbol"],
+    "job_checkpoints": ["job", "step"],
+}
+
+#Native date copies of every index on a string date field, see mdb/dates.py
+for collection, fields in NATIVE_DATES.items():
+    for keys in list(INDEXES.get(collection, [])):
+        if any( field in fields for field, direction in keys ):
+            INDEXES[collection].append( [ (native_field(field) if field in fields else field, direction) for field, direction in keys ] )
+
+#Write times of the mirrored collections, read by every incremental Mirror.sync
+for collection in MIRRORED:
+    INDEXES[collection].append( [(UPDATED_FIELD, ASCENDING)] )
+
+#Plan stages that indicate the query is not index backed
+BAD_STAGES = ["COLLSCAN", "SORT"]
+
+class Index(Mdb):
+    def __init__(self):
+        #Inherit all methods and properties from Mdb
+        super().__init__()
+
+    def ensure_indexes(self, collections = None):
+        """
+        Create any catalog indexes missing from MongoDB
+        Indexes on a UNIQUE_KEYS entry are rebuilt as unique if they were created without it
+        @params:
+            collections - Optional  : collections to index, None for all ([Str])
+        """
+
+        if collections is None:
+            collections = list(INDEXES.keys())
+
+        for collection in collections:
+            names = []
+            for keys in INDEXES[collection]:
+                unique = [ field for field, direction in keys ] == UNIQUE_KEYS.get(collection)
+                model = IndexModel( keys, unique=unique )
+                try:
+                    names += self.db[collection].create_indexes( [model] )
+                except OperationFailure as e:
+                    #IndexOptionsConflict or IndexKeySpecsConflict, same keys created before without unique
+                    if e.code in [85, 86]:
+                        self.db[collection].drop_index( keys )
+                        names += self.db[collection].create_indexes( [model] )
+                    #DuplicateKey
+                    elif e.code == 11000:
+                        print( "WARNING " + collection + " has duplicate " + ", ".join(UNIQUE_KEYS[collection]) + ", run Delete().delete_duplicates() first" )
+                    else:
+                        raise
+            print( "Indexes on " + collection + ": " + ", ".join(names) )
+
+    def canonical_queries(self, ref_symbol, ref_date, portfolioID):
+        """
+        Return the representative query issued by each Query method
+        Each entry is (name, collection, filter, sort) for finds
+        or (name, collection, pipeline, None) for aggregations
+        @params:
+            ref_symbol  - Required  : symbol list ([Str])
+            ref_date    - Required  : date YYYY-MM-DD (Str)
+            portfolioID - Required  : portfolio ID (Str)
+        """
+
+        #Same pipeline as Query._latest_group
+        def latest(match, key, date_field):
+            return latest_pipeline( match, date_field, key )
+
+        symbols = { "$in": ref_symbol }
+
+        queries = [
+            ("get_symbols", "iex_symbols", latest({}, "symbol", "date"), None),
+            ("get_company", "iex_company", { "symbol": symbols }, [("symbol", ASCENDING)]),
+        ]
+        for name, dataset in DATASETS.items():
+            collection, date_field = dataset.collection, dataset.date_field
+            name = "get_" + name
+            queries.append( (name + " after", collection,
+                             { "symbol": symbols, date_field: { "$gte": ref_date } },
+                             [(date_field, DESCENDING)]) )
+            latest_dates = { "$lte": ref_date }
+            if dataset.lookback is not None:
+                latest_dates["$gte"] = shift_date(ref_date, -dataset.lookback)
+            queries.append( (name + " latest", collection,
+                             latest({ "symbol": symbols, date_field: latest_dates }, "symbol", date_field),
+                             None) )
+        queries += [
+            ("get_portfolios", "pf_info", { "inceptionDate": { "$lte": ref_date } }, [("portfolioID", ASCENDING)]),
+            ("get_transactions", "pf_transactions", { "portfolioID": portfolioID, "date": { "$gte": ref_date } }, None),
+            ("get_holdings on", "pf_holdings",
+             latest({ "portfolioID": portfolioID, "lastUpdated": { "$lte": ref_date } }, "symbol", "lastUpdated"),
+             None),
+            ("get_holdings after", "pf_holdings", { "portfolioID": portfolioID, "lastUpdated": { "$gte": ref_date } }, None),
+            ("get_performance", "pf_performance",
+             { "portfolioID": { "$in": [portfolioID] }, "date": { "$gte": ref_date } },
+             [("date", DESCENDING)]),
+            ("get_stock_list on", "stock_list", { "date": ref_date }, None),
+            ("get_stock_list latest", "stock_list", latest({ "date": { "$lte": ref_date } }, "symbol", "date"), None),
+        ]
+        #Same finds as Mirror.sync, written since the start of ref_date
+        high_water = datetime.datetime.fromisoformat(ref_date)
+        for collection, date_field in MIRRORED.items():
+            queries += [
+                ("Mirror.sync copy", collection, {}, [(date_field, ASCENDING)]),
+                ("Mirror.sync update", collection, { UPDATED_FIELD: { "$gte": high_water } }, [(UPDATED_FIELD, ASCENDING)]),
+                ("Mirror.sync deletes", MIRROR_DELETES, { "collection": collection, UPDATED_FIELD: { "$gte": high_water } }, None),
+            ]
+
+        return queries
+
+    def check_indexes(self, ref_date = None):
+        """
+        Explain every canonical query and report COLLSCANs and in-memory SORTs
+        @params:
+            ref_date    - Optional  : date YYYY-MM-DD, default today (Str)
+        """
+
+        if not self.backend.aggregation:
+            print( "Query plans can only be checked on MongoDB" )
+            return pandas.DataFrame()
+
+        if ref_date is None:
+            ref_date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+        #Representative arguments taken from the data itself
+        ref_symbol = self.db.iex_company.distinct("symbol")[:100]
+        portfolio = self.db.pf_info.find_one({}, {"portfolioID": 1})
+        portfolioID = portfolio["portfolioID"] if portfolio else ""
+
+        report = []
+        for name, collection, query, sort in self.canonical_queries(ref_symbol, ref_date, portfolioID):
+            if isinstance(query, list):
+                explain = self.db.command( "aggregate", collection, pipeline=query, explain=True )
+            else:
+                cursor = self.db[collection].find( query )
+                if sort is not None:
+                    cursor = cursor.sort( sort )
+                explain = cursor.explain()
+            stages = plan_stages( explain )
+            problems = [ stage for stage in stages if stage in BAD_STAGES ]
+            report.append( { "query": name,
+                             "collection": collection,
+                             "stages": " > ".join(stages),
+                             "indexed": len(problems) == 0 } )
+            if problems:
+                print( "WARNING " + name + " on " + collection + " uses " + ", ".join(problems) )
+
+        return pandas.DataFrame(report)
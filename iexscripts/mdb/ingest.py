@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Concurrent IEX fetches under a shared rate limit feeding a bulk writer
+"""
+
+import time
+import threading
+import itertools
+import datetime
+import numpy
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from mdb.backend import get_backend
+from mdb.cache import query_cache
+from mdb.dates import add_native_dates, shift_date
+from mdb.index import UNIQUE_KEYS
+from mdb.mirror import MIRRORED, UPDATED_FIELD
+
+#IEX Cloud allows 100 requests per second per IP, keep a margin
+RATE_LIMIT = 50
+
+#Number of IEX requests in flight at the same time
+INGEST_WORKERS = 16
+
+#Documents buffered before the writer flushes
+WRITE_BATCH = 1000
+
+#Symbols buffered before a journaling writer flushes, the most a crashed run repeats
+CHECKPOINT_ITEMS = 100
+
+#IEX chart ranges longer than 5d with the calendar days each is sure to cover
+CHART_SPANS = [("1m", 28), ("3m", 89), ("6m", 181), ("1y", 365), ("2y", 730), ("5y", 1826)]
+
+class RateLimiter:
+    def __init__(self, rate = RATE_LIMIT):
+        """
+        Spaces calls evenly so no more than rate start in any second
+        Thread safe, callers sleep outside the lock
+        @params:
+            rate        - Optional  : requests per second (Float)
+        """
+
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next request may start
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + 1.0 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+#Process wide limiter shared by every ingestion job
+rate_limiter = RateLimiter()
+
+def set_rate_limit(rate):
+    """
+    Change the number of IEX requests per second for the rest of the process
+    @params:
+        rate        - Required  : requests per second (Float)
+    """
+
+    rate_limiter.rate = rate
+
+def fetch_all(items, fetch, workers = INGEST_WORKERS, limiter = None):
+    """
+    Call fetch for every item on a pool of threads and yield (item, result) as they finish
+    At most twice the workers are queued so memory stays bounded
+    An exception raised by fetch is raised here and the queued calls are cancelled
+    @params:
+        items       - Required  : symbols or other arguments for fetch (List)
+        fetch       - Required  : function of one item, usually an Iex.get_* method
+        workers     - Optional  : number of concurrent requests (Int)
+        limiter     - Optional  : rate limiter, defaults to the process wide one (RateLimiter)
+    """
+
+    if limiter is None:
+        limiter = rate_limiter
+
+    def call(item):
+        limiter.wait()
+        return fetch(item)
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = { executor.submit(call, item): item for item in itertools.islice(items, 2 * workers) }
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    for queued in itertools.islice(items, 1):
+                        pending[executor.submit(call, queued)] = queued
+                    yield item, future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+def plan_chart_range(last_date, end_date, new_range = "1y"):
+    """
+    Return the cheapest IEX chart request covering the trading days after last_date
+    None if nothing is missing, YYYYMMDD for a single day, otherwise a range such as 5d or 3m
+    Weekdays are counted as trading days so holidays only ever make the request larger
+    @params:
+        last_date   - Required  : latest stored date YYYY-MM-DD, None if nothing stored (Str)
+        end_date    - Required  : last date wanted YYYY-MM-DD (Str)
+        new_range   - Optional  : range fetched when nothing is stored (Str)
+    """
+
+    if last_date is None:
+        return new_range
+
+    start = shift_date(last_date)
+    missing = numpy.busday_count( start, shift_date(end_date) )
+    if missing <= 0:
+        return None
+    if missing == 1:
+        return str( numpy.busday_offset( start, 0, roll="forward" ) ).replace("-", "")
+    if missing <= 5:
+        return "5d"
+
+    days = ( datetime.date.fromisoformat(end_date[:10]) - datetime.date.fromisoformat(last_date[:10]) ).days
+    for chart_range, span in CHART_SPANS:
+        if days <= span:
+            return chart_range
+
+    return CHART_SPANS[-1][0]
+
+def write_documents(db, collection, docs):
+    """
+    Upsert documents on the UNIQUE_KEYS of their collection, insert them if it has none
+    Documents of mirrored collections are stamped with their write time
+    Writes are unordered so one bad document does not stop the rest
+    Returns the number of documents inserted and updated
+    @params:
+        db          - Required  : database from Mdb.db
+        collection  - Required  : collection name (Str)
+        docs        - Required  : documents to write ([Dict])
+    """
+
+    if not docs:
+        return 0, 0
+
+    docs = add_native_dates( docs, collection )
+    #Write time lets the local mirror pick up late and corrected documents
+    if collection in MIRRORED:
+        updated = datetime.datetime.now()
+        for doc in docs:
+            doc[UPDATED_FIELD] = updated
+    keys = UNIQUE_KEYS.get(collection)
+    if keys is None:
+        db[collection].insert_many( docs, ordered=False )
+        inserted, updated = len(docs), 0
+    else:
+        requests = [ ( { key: doc.get(key) for key in keys },
+                       { "$set": { field: value for field, value in doc.items() if field != "_id" } },
+                       True )
+                     for doc in docs ]
+        inserted, updated = get_backend().bulk_update( db[collection], requests )
+    query_cache.invalidate(collection)
+
+    return inserted, updated
+
+class BulkWriter:
+    def __init__(self, db, collection, batch_size = WRITE_BATCH, on_flush = None):
+        """
+        Single writer buffering fetched rows and writing them in batches with write_documents
+        Use as a context manager so the last batch is flushed
+        @params:
+            db          - Required  : database from Mdb.db
+            collection  - Required  : collection name (Str)
+            batch_size  - Optional  : documents per write (Int)
+            on_flush    - Optional  : called with the items whose rows were just written e.g. Checkpoint.complete
+        """
+
+        self.db = db
+        self.collection = collection
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.inserted = 0
+        self.updated = 0
+        self._docs = []
+        self._items = []
+
+    def add(self, rows, items = ()):
+        """
+        Queue rows, flushing once a batch is full
+        @params:
+            rows        - Required  : rows to write (DataFrame or [Dict])
+            items       - Optional  : symbols the rows came from, passed to on_flush ([Str])
+        """
+
+        if isinstance(rows, list):
+            self._docs += rows
+        elif not rows.empty:
+            self._docs += rows.to_dict('records')
+        self._items += list(items)
+        if len(self._docs) >= self.batch_size:
+            self.flush()
+        elif self.on_flush is not None and len(self._items) >= CHECKPOINT_ITEMS:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the queued documents
+        """
+
+        docs, items = self._docs, self._items
+        self._docs, self._items = [], []
+        if docs:
+            inserted, updated = write_documents( self.db, self.collection, docs )
+            self.inserted += inserted
+            self.updated += updated
+        if items and self.on_flush is not None:
+            self.on_flush( items )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        #Rows already fetched are complete documents, keep them even if a later fetch failed
+        self.flush()
+        return False
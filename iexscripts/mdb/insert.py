@@ -11,62 +11,130 @@ import pandas
 import pymongo
 #from pymongo import MongoClient
 from pymongo import ASCENDING, DESCENDING
-from pymongo.errors import BulkWriteError
 import datetime
 from iexscripts.iex import Iex
+from iexscripts.iex.iex import BATCH_SIZE
 from iexscripts.utils import printProgressBar
 from mdb.mdb import Mdb
+from mdb.cache import query_cache
+from mdb.dates import shift_date
+from mdb.index import UNIQUE_KEYS
+from mdb.ingest import BulkWriter, fetch_all, plan_chart_range, write_documents, INGEST_WORKERS
+from mdb.ledger import Ledger, daily_positions, dividend_transactions, CASH
 from mdb.query import Query
 from mdb.algo import Algo
 
 class Insert(Mdb):
-    def __init__(self):
+    def __init__(self, workers = INGEST_WORKERS, checkpoint = None):
+        """
+        @params:
+            workers     - Optional  : number of concurrent IEX requests (Int)
+            checkpoint  - Optional  : journal of the symbols written, to resume a crashed run (Checkpoint)
+        """
         #Inherit all methods and properties from Mdb
         super().__init__()
+        self.workers = workers
+        self.checkpoint = checkpoint
+
+    def _latest_dates(self, frame, date_field):
+        """
+        Return the latest date in MongoDB per symbol
+        @params:
+            frame       - Required  : result of a "latest" query (DataFrame)
+            date_field  - Required  : date field (Str)
+        """
+
+        if frame.empty:
+            return {}
+
+        return dict( zip( frame['symbol'], frame[date_field] ) )
+
+    def _ingest(self, collection, symbols, fetch, label, latest = {}, date_field = None, batch = None):
+        """
+        Fetch symbols from IEX concurrently and bulk insert the rows newer than MongoDB
+        @params:
+            collection  - Required  : collection to insert into (Str)
+            symbols     - Required  : symbols to fetch ([Str])
+            fetch       - Required  : Iex method taking a symbol, or a list of symbols when batched
+            label       - Required  : name of the data for the progress bar (Str)
+            latest      - Optional  : latest date in MongoDB per symbol (Dict)
+            date_field  - Optional  : field compared against latest (Str)
+            batch       - Optional  : symbols per fetch call, None for one symbol at a time (Int)
+        """
+
+        on_flush = None
+        if self.checkpoint is not None:
+            #Skip symbols an interrupted run already wrote
+            completed = self.checkpoint.completed()
+            symbols = [ symbol for symbol in symbols if symbol not in completed ]
+            on_flush = self.checkpoint.complete
+        if not symbols:
+            print( "No symbols to update" )
+            return
+        if batch:
+            items = [ symbols[idx_min:idx_min+batch] for idx_min in range(0, len(symbols), batch) ]
+        else:
+            items = symbols
+        #Initial call to print 0% progress
+        printProgressBar(0, len(symbols), prefix = 'Progress:', suffix = '', length = 50)
+        done = 0
+        with BulkWriter( self.db, collection, on_flush=on_flush ) as writer:
+            for item, frame in fetch_all( items, fetch, self.workers ):
+                done += len(item) if batch else 1
+                name = item[0] + " to " + item[-1] if batch else item
+                #Select rows more recent than MongoDB
+                if not frame.empty and latest:
+                    previous = frame['symbol'].map(latest).fillna("")
+                    frame = frame.loc[ frame[date_field] > previous ]
+                #Rows repeating a natural key would overwrite each other in the upsert
+                if not frame.empty and date_field is not None and collection in UNIQUE_KEYS:
+                    frame = frame.drop_duplicates(subset=UNIQUE_KEYS[collection])
+                if not frame.empty:
+                    #Update progress bar
+                    printProgressBar(done, len(symbols), prefix = 'Progress:', suffix = "Inserting " + label + " for " + name + "      ", length = 50)
+                else:
+                    #Update progress bar
+                    printProgressBar(done, len(symbols), prefix = 'Progress:', suffix = "No new data for " + name + "      ", length = 50)
+                writer.add( frame, item if batch else [item] )
+        print( "Inserted " + str(writer.inserted) + " and updated " + str(writer.updated) + " documents in " + collection )
 
     #If new symbol exists then upload it
     def insert_symbols(self):
         print( "Insert new symbols" )
         mdb_query = Query()
         iex = Iex()
-        #Get all common stocks from IEX
-        symbols = iex.get_symbols(ref_type="cs")
-        #Get SPY (S&P500 exchange traded index) from IEX
-        symbols_spy = iex.get_symbols(ref_symbol="SPY")
-        #Reset indices (probably not necessary)
-        symbols.reset_index(drop=True, inplace=True)
-        symbols_spy.reset_index(drop=True, inplace=True)
-        #Append SPY to stocks
-        symbols = symbols.append(symbols_spy, ignore_index=True, sort=False)
+        #Get all common stocks and SPY (S&P500 exchange traded index) from IEX
+        symbols = iex.get_symbols()
+        symbols = symbols[ (symbols["type"] == "cs") | (symbols["symbol"] == "SPY") ]
+        #Exclude forbidden characters
+        symbols = symbols[ ~symbols["symbol"].str.contains("#", regex=False) ]
         symbols.reset_index(drop=True, inplace=True)
-        #Get symbols already in MongoDB
-        mdb_symbols = mdb_query.get_symbols()
-        #Initial call to print 0% progress
-        printProgressBar(0, len(symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        #Loop through symbols
-        for index, symbol in symbols.iterrows():
-            #Exclude forbidden characters
-            forbidden = ["#"]
-            if any( x in symbol["symbol"] for x in forbidden):
-                #Update progress bar
-                printProgressBar(index+1, len(symbols.index), prefix = 'Progress:', suffix = "Symbol contains forbidden character: " + symbol["symbol"] + "                     ", length = 50)
-                continue
-            #If MongoDB empty insert symbol
-            if mdb_symbols.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(symbols.index), prefix = 'Progress:', suffix = "Inserting new symbol: " + symbol["symbol"] + "                     ", length = 50)
-                self.db.iex_symbols.insert_one( symbol.to_dict() )
-            else:
-                #Is symbol already in MongoDB
-                mask = (mdb_symbols['iexId'] == symbol['iexId']) & (mdb_symbols['isEnabled'] == symbol['isEnabled']) & (mdb_symbols['name'] == symbol['name']) & (mdb_symbols['type'] == symbol['type']) 
-                #Insert if not in MongoDB
-                if mdb_symbols.loc[mask].empty:
-                    #Update progress bar
-                    printProgressBar(index+1, len(symbols.index), prefix = 'Progress:', suffix = "Inserting new symbol: " + symbol["symbol"] + "                     ", length = 50)
-                    self.db.iex_symbols.insert_one( symbol.to_dict() )
-                else:
-                    #Update progress bar
-                    printProgressBar(index+1, len(symbols.index), prefix = 'Progress:', suffix = "Symbol " + symbol["symbol"] + " already exists                     ", length = 50)
+        #Get latest entry of every symbol already in MongoDB, including disabled ones
+        keys = ["symbol","iexId","isEnabled","name","type"]
+        mdb_symbols = mdb_query.get_symbols( keys, enabled_only=False )
+        #Keep symbols whose entry differs from MongoDB
+        if mdb_symbols.empty:
+            new_symbols = symbols
+            stored = set()
+            was_enabled = set()
+        else:
+            mdb_symbols = mdb_symbols[keys].astype({ "symbol": str })
+            merged = symbols.merge( mdb_symbols, on=keys, how="left", indicator=True )
+            new_symbols = symbols[ (merged["_merge"] == "left_only").values ]
+            stored = set( mdb_symbols["symbol"] )
+            was_enabled = set( mdb_symbols.loc[ mdb_symbols["isEnabled"] != False, "symbol" ] )
+        #Summarise the changes
+        is_added = ~new_symbols["symbol"].isin(stored)
+        is_disabled = (new_symbols["isEnabled"] == False) & new_symbols["symbol"].isin(was_enabled)
+        added = new_symbols.loc[ is_added, "symbol" ].tolist()
+        disabled = new_symbols.loc[ is_disabled, "symbol" ].tolist()
+        changed = new_symbols.loc[ ~is_added & ~is_disabled, "symbol" ].tolist()
+        write_documents( self.db, "iex_symbols", new_symbols.to_dict('records') )
+        print( "Added " + str(len(added)) + ", changed " + str(len(changed)) + " and disabled " + str(len(disabled)) + " of " + str(len(symbols.index)) + " symbols" )
+        if changed:
+            print( "Changed: " + ", ".join(changed) )
+        if disabled:
+            print( "Disabled: " + ", ".join(disabled) )
     
     #If new company exists then upload them
     def insert_company(self):
@@ -74,36 +142,15 @@ class Insert(Mdb):
         mdb_query = Query()
         iex = Iex()
         #Get all symbols in MongoDB
-        mdb_symbols = mdb_query.get_symbols()
+        mdb_symbols = mdb_query.get_symbols( [] )
         #Get companies already in MongoDB
-        mdb_companies = mdb_query.get_company( mdb_symbols['symbol'].tolist() )
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        #Loop through symbols
-        for index, mdb_symbol in mdb_symbols.iterrows():
-            #Insert if no mdb company data exists
-            if mdb_companies.empty:
-                #Get company data from IEX
-                iex_company = iex.get_company( mdb_symbol["symbol"] )
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Inserting company for " + mdb_symbol["symbol"] + "      ", length = 50)
-                self.db.iex_company.insert_many( iex_company.to_dict('records') )
-                continue
-            #Skip company if already in MongoDB
-            if not mdb_companies[ mdb_companies['symbol'] == mdb_symbol['symbol'] ].empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol["symbol"] + "      ", length = 50)
-                continue
-            #Get company data from IEX
-            iex_company = iex.get_company( mdb_symbol["symbol"] )
-            #Insert if company data exists
-            if not iex_company.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Inserting company for " + mdb_symbol["symbol"] + "      ", length = 50)
-                self.db.iex_company.insert_many( iex_company.to_dict('records') )
-            else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No data for " + mdb_symbol["symbol"] + "      ", length = 50)
+        mdb_companies = mdb_query.get_company( mdb_symbols['symbol'].tolist(), [] )
+        #Only fetch companies not already in MongoDB
+        symbols = mdb_symbols['symbol'].tolist()
+        if not mdb_companies.empty:
+            stored = set( mdb_companies['symbol'] )
+            symbols = [ s for s in symbols if s not in stored ]
+        self._ingest( "iex_company", symbols, iex.get_company, "company", batch=BATCH_SIZE )
     
     #If new prices exist then upload them
     def insert_prices(self):
@@ -111,73 +158,17 @@ class Insert(Mdb):
         mdb_query = Query()
         iex = Iex()
         #Get all symbols in MongoDB
-        mdb_symbols_full = mdb_query.get_active_companies()
-        mdb_symbols_full = mdb_symbols_full[mdb_symbols_full == 'SPY']
+        mdb_symbols = mdb_query.get_active_companies()
+        mdb_symbols = mdb_symbols[mdb_symbols == 'SPY']
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = '', length = 50)
-        idx_min = 0
-        query_num = 100
-        #flag = False
-        while idx_min < len(mdb_symbols_full.index):
-            #if idx_min > 1:
-            #    break
-            idx_max = idx_min + query_num
-            if idx_max > len(mdb_symbols_full.index):
-                idx_max = len(mdb_symbols_full.index)
-            mdb_symbols = mdb_symbols_full.iloc[ idx_min:idx_max ]
-            mdb_symbols.reset_index(drop=True, inplace=True)
-            #Get latest price in MongoDB for each symbol up to 50 days ago
-            mdb_charts = mdb_query.get_chart( mdb_symbols.tolist(), currDate, "latest" )
-            #print( mdb_charts )
-            #break
-            #Loop through symbols
-            for index, mdb_symbol in mdb_symbols.iteritems():
-                #Get matching chart in MongoDB
-                mdb_chart = mdb_charts[ mdb_charts['symbol'] == mdb_symbol ]
-                #Get first date to insert
-                date = mdb_chart.date.iloc[0]
-                date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-                iex_chart = pandas.DataFrame()
-                while date <= currDate:
-                    #Get date in correct format for IEX query
-                    iex_date = (pandas.Timestamp(date)).strftime('%Y%m%d')
-                    #Get IEX chart
-                    iex_chart_day = iex.get_chart( mdb_symbol, ref_range=iex_date )
-                    iex_chart = iex_chart.append(iex_chart_day, ignore_index=True, sort=False)
-                    #Increment date
-                    date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-                #Get 1y of charts from IEX
-                #print( mdb_symbol )
-                #print( mdb_symbol["symbol"] )
-                #if mdb_symbol["symbol"] == "ZZZZZZZZZ":
-                #    flag = True
-                #if not flag:
-                #    continue
-                #iex_chart = iex.get_chart( mdb_symbol, ref_range='5d' )
-                #Get matching chart in MongoDB
-                #mdb_chart = mdb_charts[ mdb_charts['symbol'] == mdb_symbol ]
-                #Select charts more recent than MongoDB
-                #if not iex_chart.empty and not mdb_chart.empty:
-                #    mask = iex_chart['date'] > mdb_chart['date'].iloc[0]
-                #    iex_chart = iex_chart.loc[mask]
-                #Insert if charts exist
-                #print( iex_chart )
-                if not iex_chart.empty:
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "Inserting chart for " + mdb_symbol + "      ", length = 50)
-                    #Print write error if couldn't insert charts
-                    try:
-                        print( iex_chart )
-                        self.db.iex_charts.insert_many( iex_chart.to_dict('records') )
-                    except BulkWriteError as bwe:
-                        print( bwe.details )
-                        raise
-                else:
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
-            idx_min = idx_min + query_num
+        #Get latest chart in MongoDB for each symbol, however old, so long gaps still get the smallest range
+        mdb_charts = mdb_query.get_chart( mdb_symbols.tolist(), currDate, "asof", [] )
+        latest = self._latest_dates( mdb_charts, "date" )
+        #One IEX request per symbol covering all its missing days
+        plans = { symbol: plan_chart_range( latest.get(symbol), currDate ) for symbol in mdb_symbols.tolist() }
+        symbols = [ symbol for symbol, plan in plans.items() if plan is not None ]
+        self._ingest( "iex_charts", symbols, lambda symbol: iex.get_chart( symbol, ref_range=plans[symbol] ), "chart", latest, "date" )
     
     #If new quotes exist then upload them
     def insert_quotes(self):
@@ -185,112 +176,31 @@ class Insert(Mdb):
         mdb_query = Query()
         iex = Iex()
         #Get all symbols in MongoDB
-        mdb_symbols_full = mdb_query.get_active_companies()
+        mdb_symbols = mdb_query.get_active_companies()
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = '', length = 50)
-        idx_min = 0
-        query_num = 100
-        while idx_min < len(mdb_symbols_full.index):
-            idx_max = idx_min + query_num
-            if idx_max > len(mdb_symbols_full.index):
-                idx_max = len(mdb_symbols_full.index)
-            mdb_symbols = mdb_symbols_full.iloc[ idx_min:idx_max ]
-            mdb_symbols.reset_index(drop=True, inplace=True)
-            #Get latest price in MongoDB for each symbol up to 50 days ago
-            mdb_quotes = mdb_query.get_quotes( mdb_symbols.tolist(), currDate, "latest" )
-            #Loop through symbols
-            iex_quotes = pandas.DataFrame()
-            for index, mdb_symbol in mdb_symbols.iteritems():
-                #Get matching quote in MongoDB
-                if not mdb_quotes.empty:
-                    mdb_quote = mdb_quotes[ mdb_quotes['symbol'] == mdb_symbol ]
-                else:
-                    mdb_quote = mdb_quotes
-                #continue if already up to date
-                if not mdb_quote.empty and (mdb_quote['date'].iloc[0] == currDate):
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
-                    continue
-                #Get quote from IEX
-                iex_quote = iex.get_quote( mdb_symbol )
-                #Select quotes more recent than MongoDB
-                if not iex_quote.empty and not mdb_quote.empty:
-                    mask = iex_quote['date'] > mdb_quote['date'].iloc[0]
-                    iex_quote = iex_quote.loc[mask]
-                #Insert if quotes exist
-                if not iex_quote.empty:
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "Inserting quote for " + mdb_symbol + "      ", length = 50)
-                    #Append quote
-                    iex_quotes = iex_quotes.append(iex_quote, ignore_index=True, sort=False)
-                else:
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
-            #Bulk insert quotes
-            if not iex_quotes.empty:
-                self.db.iex_quotes.insert_many( iex_quotes.to_dict('records') )
-            idx_min = idx_min + query_num
+        #Get latest quote in MongoDB for each symbol
+        mdb_quotes = mdb_query.get_quotes( mdb_symbols.tolist(), currDate, "latest", [] )
+        latest = self._latest_dates( mdb_quotes, "date" )
+        #Skip symbols already up to date
+        symbols = [ s for s in mdb_symbols.tolist() if latest.get(s) != currDate ]
+        self._ingest( "iex_quotes", symbols, iex.get_quotes, "quote", latest, "date", BATCH_SIZE )
     
     #If new dividends exist then upload them
     def insert_dividends(self):
         print( "Insert new dividends" )
         mdb_query = Query()
         iex = Iex()
-        #Get all symbols in MongoDB
-        #mdb_symbols = mdb_query.get_active_companies()
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
-    
-        #Get existing portfolios
-        portfolios = mdb_query.get_portfolios(currDate)[["portfolioID","inceptionDate"]]
-        #Loop through portfolios
-        mdb_symbols = pandas.DataFrame()
-        for portfolio_index, portfolio_row in portfolios.iterrows():
-            #Get portfolioID and inceptionDate
-            portfolio = portfolio_row['portfolioID']
-            inceptionDate = portfolio_row['inceptionDate']
-            #Default to calculating holdings from inception
-            date = inceptionDate
-            #Get current holdings table
-            holdings = mdb_query.get_holdings(portfolio, inceptionDate, "after")
-            #print( holdings )
-            mdb_symbols = mdb_symbols.append(holdings, ignore_index=True, sort=False)
-            #print( mdb_symbols )
-        mdb_symbols = mdb_symbols[mdb_symbols['symbol'] != 'USD']
-        mdb_symbols = mdb_symbols['symbol'].unique().tolist()
-        #print( mdb_symbols )
-        #quit()
-    
+        #Get every symbol held by a portfolio
+        mdb_symbols = sorted( self.db["pf_holdings"].distinct( "symbol", { "symbol": { "$ne": CASH } } ) )
         #Get latest dividend in MongoDB for each symbol
-        mdb_dividends = mdb_query.get_dividends( mdb_symbols, currDate, "latest" )
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols), prefix = 'Progress:', suffix = '', length = 50)
-        #flag = False
-        #Loop through symbols
-        for index, mdb_symbol in enumerate(mdb_symbols):
-            #if mdb_symbol["symbol"] == "ZZZZZZZZZ":
-            #    flag = True
-            #if not flag:
-            #    continue
-            #Get 1m of dividends from IEX
-            iex_dividends = iex.get_dividends( mdb_symbol, ref_range='1m' )
-            #Get matching dividend in MongoDB
-            mdb_dividend = mdb_dividends[ mdb_dividends['symbol'] == mdb_symbol ]
-            #Select dividends more recent than MongoDB
-            if not mdb_dividend.empty and not iex_dividends.empty:
-                mask = iex_dividends['exDate'] > mdb_dividend['exDate'].iloc[0]
-                iex_dividends = iex_dividends.loc[mask]
-            #Insert if dividends exist
-            if not iex_dividends.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols), prefix = 'Progress:', suffix = "Inserting dividend for " + mdb_symbol + "      ", length = 50)
-                #print( iex_dividends )
-                self.db.iex_dividends.insert_many( iex_dividends.to_dict('records') )
-            else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
+        mdb_dividends = mdb_query.get_dividends( mdb_symbols, currDate, "latest", [] )
+        latest = self._latest_dates( mdb_dividends, "exDate" )
+        #Get 1m of dividends from IEX
+        fetch = lambda symbols: iex.get_dividends( symbols, ref_range='1m' )
+        self._ingest( "iex_dividends", mdb_symbols, fetch, "dividend", latest, "exDate", BATCH_SIZE )
     
     #If new earnings exist then upload them
     def insert_earnings(self):
@@ -302,27 +212,9 @@ class Insert(Mdb):
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
         #Get latest earnings in MongoDB for each symbol
-        mdb_earnings = mdb_query.get_earnings( mdb_symbols.tolist(), currDate, "latest" )
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        #Loop through symbols
-        for index, mdb_symbol in mdb_symbols.iteritems():
-            #Get earnings from IEX
-            iex_earnings = iex.get_earnings( mdb_symbol )
-            #Get matching earning in MongoDB
-            mdb_earning = mdb_earnings[ mdb_earnings['symbol'] == mdb_symbol ]
-            #Select earnings more recent than MongoDB
-            if not mdb_earning.empty and not iex_earnings.empty:
-                mask = iex_earnings['fiscalEndDate'] > mdb_earning['fiscalEndDate'].iloc[0]
-                iex_earnings = iex_earnings.loc[mask]
-            #Insert if earnings exist
-            if not iex_earnings.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Inserting earnings for " + mdb_symbol + "      ", length = 50)
-                self.db.iex_earnings.insert_many( iex_earnings.to_dict('records') )
-            else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
+        mdb_earnings = mdb_query.get_earnings( mdb_symbols.tolist(), currDate, "latest", fields=[] )
+        latest = self._latest_dates( mdb_earnings, "fiscalEndDate" )
+        self._ingest( "iex_earnings", mdb_symbols.tolist(), iex.get_earnings, "earnings", latest, "fiscalEndDate" )
     
     #If new financials exist then upload them
     def insert_financials(self):
@@ -334,27 +226,9 @@ class Insert(Mdb):
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
         #Get latest financials in MongoDB for each symbol
-        mdb_financials = mdb_query.get_financials( mdb_symbols.tolist(), currDate, "latest" )
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        #Loop through symbols
-        for index, mdb_symbol in mdb_symbols.iteritems():
-            #Get financials from IEX
-            iex_financials = iex.get_financials( mdb_symbol )
-            #Get matching financial in MongoDB
-            mdb_financial = mdb_financials[ mdb_financials['symbol'] == mdb_symbol ]
-            #Select financials more recent than MongoDB
-            if not mdb_financial.empty and not iex_financials.empty:
-                mask = iex_financials['reportDate'] > mdb_financial['reportDate'].iloc[0]
-                iex_financials = iex_financials.loc[mask]
-            #Insert if financials exist
-            if not iex_financials.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Inserting financials for " + mdb_symbol + "      ", length = 50)
-                self.db.iex_financials.insert_many( iex_financials.to_dict('records') )
-            else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
+        mdb_financials = mdb_query.get_financials( mdb_symbols.tolist(), currDate, "latest", [] )
+        latest = self._latest_dates( mdb_financials, "reportDate" )
+        self._ingest( "iex_financials", mdb_symbols.tolist(), iex.get_financials, "financials", latest, "reportDate" )
     
     #If new balancesheets exist then upload them
     def insert_balancesheets(self):
@@ -365,46 +239,13 @@ class Insert(Mdb):
         mdb_symbols = mdb_query.get_active_companies()
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
-        threeMonthsAgo = (pandas.Timestamp(currDate) + pandas.DateOffset(days=-120)).strftime('%Y-%m-%d')
+        threeMonthsAgo = shift_date(currDate, -120)
         #Get latest balancesheets in MongoDB for each symbol
-        mdb_balancesheets = mdb_query.get_balancesheets( mdb_symbols.tolist(), currDate, "latest" )
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols.index), prefix = 'Progress:', suffix = '', length = 50)
-        #flag = False
-        #Loop through symbols
-        for index, mdb_symbol in mdb_symbols.iteritems():
-            #if mdb_symbol == 'YETI':
-            #    flag = True
-            #if not flag:
-            #    continue
-            #Get matching balancesheet in MongoDB
-            if not mdb_balancesheets.empty:
-                mdb_balancesheet = mdb_balancesheets[ mdb_balancesheets['symbol'] == mdb_symbol ]
-            else:
-                mdb_balancesheet = mdb_balancesheets
-            #Skip is less than 3 months since most recent
-            if not mdb_balancesheet.empty: 
-                mask = mdb_balancesheet['reportDate'] > threeMonthsAgo
-                mdb_recent_balancesheet = mdb_balancesheet.loc[mask]
-                if not mdb_recent_balancesheet.empty:
-                    #Update progress bar
-                    printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Data too recent for " + mdb_symbol + "      ", length = 50)
-                    continue
-            #Get balancesheets from IEX
-            iex_balancesheets = iex.get_balancesheets( mdb_symbol )
-            #Select balancesheets more recent than MongoDB
-            if not mdb_balancesheet.empty and not iex_balancesheets.empty:
-                mdb_balancesheet = mdb_balancesheet.sort_values(by='reportDate', ascending=False, axis='index')
-                mask = iex_balancesheets['reportDate'] > mdb_balancesheet['reportDate'].iloc[0]
-                iex_balancesheets = iex_balancesheets.loc[mask]
-            #Insert if balancesheets exist
-            if not iex_balancesheets.empty:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "Inserting balancesheets for " + mdb_symbol + "      ", length = 50)
-                self.db.iex_balancesheets.insert_many( iex_balancesheets.to_dict('records') )
-            else:
-                #Update progress bar
-                printProgressBar(index+1, len(mdb_symbols.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
+        mdb_balancesheets = mdb_query.get_balancesheets( mdb_symbols.tolist(), currDate, "latest", [] )
+        latest = self._latest_dates( mdb_balancesheets, "reportDate" )
+        #Skip if less than 3 months since most recent
+        symbols = [ s for s in mdb_symbols.tolist() if not latest.get(s, "") > threeMonthsAgo ]
+        self._ingest( "iex_balancesheets", symbols, iex.get_balancesheets, "balancesheets", latest, "reportDate", BATCH_SIZE )
     
     #If new stats exist then upload them
     def insert_stats(self):
@@ -412,54 +253,13 @@ class Insert(Mdb):
         mdb_query = Query()
         iex = Iex()
         #Get all symbols in MongoDB
-        mdb_symbols_full = mdb_query.get_active_companies()
-        #mdb_symbols_full = mdb_symbols_full[mdb_symbols_full == 'A']
+        mdb_symbols = mdb_query.get_active_companies()
         #Get current date
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
-        #Initial call to print 0% progress
-        printProgressBar(0, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = '', length = 50)
-        idx_min = 0
-        query_num = 100
-        #flag = True
-        while idx_min < len(mdb_symbols_full.index):
-            #if idx_min > 1:
-            #    break
-            idx_max = idx_min + query_num
-            if idx_max > len(mdb_symbols_full.index):
-                idx_max = len(mdb_symbols_full.index)
-            mdb_symbols = mdb_symbols_full.iloc[ idx_min:idx_max ]
-            mdb_symbols.reset_index(drop=True, inplace=True)
-            #Get latest price in MongoDB for each symbol up to 50 days ago
-            mdb_stats = mdb_query.get_stats( mdb_symbols.tolist(), currDate, "latest" )
-            #Loop through symbols
-            for index, mdb_symbol in mdb_symbols.iteritems():
-                #Get stat from IEX
-                #print( mdb_symbol )
-                #print( mdb_symbol["symbol"] )
-                #if mdb_symbol == "BAH":
-                #    flag = False
-                #if flag:
-                #    continue
-                iex_stat = iex.get_stats( mdb_symbol )
-                #Get matching stat in MongoDB
-                if not mdb_stats.empty:
-                    mdb_stat = mdb_stats[ mdb_stats['symbol'] == mdb_symbol ]
-                else:
-                    mdb_stat = mdb_stats
-                #Select stats more recent than MongoDB
-                if not iex_stat.empty and not mdb_stat.empty:
-                    mask = iex_stat['date'] > mdb_stat['date'].iloc[0]
-                    iex_stat = iex_stat.loc[mask]
-                #Insert if stats exist
-                #print( iex_stat )
-                if not iex_stat.empty:
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "Inserting stat for " + mdb_symbol + "      ", length = 50)
-                    self.db.iex_stats.insert_many( iex_stat.to_dict('records') )
-                else:
-                    #Update progress bar
-                    printProgressBar(idx_min+index+1, len(mdb_symbols_full.index), prefix = 'Progress:', suffix = "No new data for " + mdb_symbol + "      ", length = 50)
-            idx_min = idx_min + query_num
+        #Get latest stat in MongoDB for each symbol
+        mdb_stats = mdb_query.get_stats( mdb_symbols.tolist(), currDate, "latest", [] )
+        latest = self._latest_dates( mdb_stats, "date" )
+        self._ingest( "iex_stats", mdb_symbols.tolist(), iex.get_stats, "stat", latest, "date", BATCH_SIZE )
     
     #TODO:
     #Keep track of corporate actions
@@ -475,160 +275,62 @@ class Insert(Mdb):
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
         #currDate = "2019-12-30"
         #Get existing portfolios
-        portfolios = mdb_query.get_portfolios(currDate)[["portfolioID","inceptionDate"]]
+        portfolios = mdb_query.get_portfolios(currDate, ["inceptionDate"])[["portfolioID","inceptionDate"]]
         #Loop through portfolios
         for portfolio_index, portfolio_row in portfolios.iterrows():
             #Get portfolioID and inceptionDate
             portfolio = portfolio_row['portfolioID']
             inceptionDate = portfolio_row['inceptionDate']
             print( 'Calculating holdings for ', portfolio )
-            #Default to calculating holdings from inception
-            date = inceptionDate
             #Get current holdings table
             holdings = mdb_query.get_holdings(portfolio, currDate, "on")
-            #print( holdings )
-            #If holdings exist then calculate holdings from next date
+            #If holdings exist then replay from the next date, otherwise from inception with no cash
             if not holdings.empty:
-                date = holdings['lastUpdated'].max()
-                date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-            #If no existing holdings create 0 dollar entry to create table
-            if holdings.empty:
-                holding_dict = { "portfolioID": portfolio,
-                                    "symbol": "USD",
-                                    "endOfDayQuantity": 0.0,
-                                    "lastUpdated": inceptionDate }
-                holdings = pandas.DataFrame.from_dict(holding_dict, orient='index').T
+                date = shift_date( holdings['lastUpdated'].max() )
+                ledger = Ledger( portfolio, dict( zip( holdings['symbol'], holdings['endOfDayQuantity'] ) ) )
+            else:
+                date = inceptionDate
+                ledger = Ledger( portfolio )
             #Get all new transactions
             transactions = mdb_query.get_transactions(portfolio, date, "after")
-    
-            #Loop through dates and update holdings table
-            while date <= currDate:
-    
-                #Insert dividends to transactions database and update transactions table
-                #Dividends will be ahead of time so will be ready to be added on the correct date
-    
-                #Get dividends for all holdings except USD
-                div_holdings = holdings[ ~holdings["symbol"].isin(["USD"]) ]
-                dividends = mdb_query.get_dividends(div_holdings["symbol"].unique().tolist(), date, "on")
-                #Get rid of any non-USD dividends
-                if not dividends.empty:
-                    dividends = dividends[ dividends['currency'] == 'USD' ]
-    
-                if not dividends.empty:
-                    #Get dividends with exDate = date
-                    div_date = dividends[ dividends.exDate == date ]
-                    #Loop through dividends
-                    for d_index, dividend in div_date.iterrows():
-                        #print( dividend )
-                        #Is dividend already in transactions?
-                        #If not insert it
-                        #Skip dividends with bad data entries
-                        if not dividend.amount:
-                            print( "Skipping dividend as amount is empty!" )
-                            continue
-                        if dividend.paymentDate == None:
-                            print( "Skipping dividend as paymentDate is None!" )
-                            continue
-                        transactions_paymentDate = transactions
-                        if not transactions.empty:
-                            transactions_paymentDate = transactions[ (transactions.date == dividend.paymentDate) & (transactions.symbol == dividend.symbol) & (transactions.type == 'dividend') ]
-                        holding_quantity = holdings[holdings["symbol"] == dividend.symbol]["endOfDayQuantity"]
-                        holding_quantity.reset_index(drop=True, inplace=True)
-                        if transactions_paymentDate.empty and (holding_quantity != 0).any():
-                            transaction_table = { "portfolioID": portfolio,
-                                                    "symbol": dividend.symbol,
-                                                    "type": "dividend",
-                                                    "date": dividend.paymentDate,
-                                                    "price": float(dividend.amount),
-                                                    "volume": holding_quantity.iloc[0],
-                                                    "commission": 0.0 }
-                            transactions = transactions.append( pandas.DataFrame.from_dict(transaction_table, orient='index').T, ignore_index=True, sort=False )
-                            insert_pf_transactions = True
-                            if insert_pf_transactions:
-                                print( "Inserting dividend: " + date )
-                                print( transaction_table )
-                                self.db.pf_transactions.insert_one( transaction_table )
-    
-                #Now attend to transactions on date
-                if transactions.empty:
-                    #Increment date
-                    date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-                    continue
-                transactions_date = transactions[transactions.date == date]
-                #Loop through transactions
-                for t_index, transaction in transactions_date.iterrows():
-                    print( "Inserting transaction:" )
-                    print( transaction )
-                    #Get any existing holding for the transaction symbol
-                    if transaction.type == "dividend":
-                        holding = holdings[holdings.symbol == "USD"]
-                    else:
-                        holding = holdings[holdings.symbol == transaction.symbol]
-                    holding.reset_index(drop=True, inplace=True)
-                    #print( holding )
-                    #Remove that holding from holdings table
-                    if not holding.empty:
-                        holdings = holdings[ ~holdings["symbol"].isin([holding['symbol'].iloc[0]]) ]
-                    #print( holdings )
-                    #Add any dividends to the holdings table
-                    if transaction.type == "dividend":
-                        holding["endOfDayQuantity"] = holding["endOfDayQuantity"] + (transaction.price * transaction.volume)
-                        holding["lastUpdated"] = date
-                        holdings = holdings.append( holding, ignore_index=True, sort=False )
-                    #Add any deposits to the holdings table
-                    if transaction.type == "deposit":
-                        holding["endOfDayQuantity"] = holding["endOfDayQuantity"] + (transaction.price * transaction.volume)
-                        holding["lastUpdated"] = date
-                        holdings = holdings.append( holding, ignore_index=True, sort=False )
-                    #Add any stocks purchased to the holdings table
-                    if transaction.type == "buy":
-                        holding_dict = {}
-                        if not holding.empty:
-                            holding_dict = { "portfolioID": transaction.portfolioID,
-                                             "symbol": transaction.symbol,
-                                             "endOfDayQuantity": holding["endOfDayQuantity"].iloc[0] + transaction.volume,
-                                             "lastUpdated": date }
-                        else:
-                            holding_dict = { "portfolioID": transaction.portfolioID,
-                                             "symbol": transaction.symbol,
-                                             "endOfDayQuantity": transaction.volume,
-                                             "lastUpdated": date }
-                        #print( holding_dict )
-                        holdings = holdings.append( pandas.DataFrame.from_dict(holding_dict, orient='index').T, ignore_index=True, sort=False )
-                        #Adjust cash entry accordingly
-                        cash = holdings[holdings.symbol == "USD"]
-                        holdings = holdings[ ~holdings["symbol"].isin(["USD"]) ]
-                        cash["endOfDayQuantity"] = cash["endOfDayQuantity"] - (transaction.price * transaction.volume)
-                        cash["lastUpdated"] = date
-                        holdings = holdings.append( cash, ignore_index=True, sort=False )
-                    #print( holdings )
-                    #Remove any stocks sold from the holdings table
-                    if transaction.type == "sell":
-                        if not holding.empty:
-                            holding["endOfDayQuantity"] = holding["endOfDayQuantity"] - transaction.volume
-                            holding["lastUpdated"] = date
-                            holdings = holdings.append( holding, ignore_index=True, sort=False )
-                        else:
-                            raise Exception("Trying to sell unowned stock!")
-                        #Adjust cash entry accordingly
-                        cash = holdings[holdings.symbol == "USD"]
-                        holdings = holdings[ ~holdings["symbol"].isin(["USD"]) ]
-                        cash["endOfDayQuantity"] = cash["endOfDayQuantity"] + (transaction.price * transaction.volume)
-                        cash["lastUpdated"] = date
-                        holdings = holdings.append( cash, ignore_index=True, sort=False )
-                    #print( holdings )
-                #Upload new holdings entries to MongoDB
-                holdings_date = holdings[holdings.lastUpdated == date]
-                if not holdings_date.empty:
-                    print( "New holdings:" )
-                    print( holdings_date )
-                    insert_holdings_tx = True
-                    if insert_holdings_tx:
-                        print( "Inserting holdings for " + portfolio )
-                        self.db.pf_holdings.insert_many( holdings_date.to_dict('records') )
-                #Increment date
-                date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-    
+            #A new portfolio gets its empty cash entry once it has transactions
+            if holdings.empty and not transactions.empty:
+                ledger.touch( CASH )
+
+            #Dividends are inserted ahead of their paymentDate so they are replayed on the correct date
+            #Load the dividends going ex on every symbol held during the replay at once
+            symbols = set(ledger.positions)
+            if not transactions.empty:
+                symbols.update( transactions.loc[ transactions["type"] == "buy", "symbol" ] )
+            symbols = sorted( symbols - {CASH} )
+            dividends = pandas.DataFrame()
+            if symbols and date <= currDate:
+                dividends = mdb_query.get_dividends(symbols, date, "between", None, currDate)
+            new_dividends = dividend_transactions(portfolio, dividends, transactions, ledger.positions)
+            if not new_dividends.empty:
+                transactions = pandas.concat( [transactions, new_dividends], ignore_index=True )
+
+            #Group transactions by date in the order they were entered
+            by_date = {}
+            if not transactions.empty:
+                for transaction in transactions.sort_values(by="date", kind="stable").to_dict('records'):
+                    by_date.setdefault( transaction['date'], [] ).append( transaction )
+
+            #Replay the dates with transactions, only positions they change get a holdings entry
+            rows = []
+            for day in sorted( day for day in set(by_date) | {date} if date <= day <= currDate ):
+                for transaction in by_date.get(day, []):
+                    ledger.apply( transaction )
+                rows += ledger.close( day )
+
+            #Upload dividends and new holdings entries to MongoDB, one write each per portfolio
+            if not new_dividends.empty:
+                print( "Inserting " + str(len(new_dividends)) + " dividends for " + portfolio )
+                write_documents( self.db, "pf_transactions", new_dividends.to_dict('records') )
+            if rows:
+                print( "Inserting " + str(len(rows)) + " holdings for " + portfolio )
+                write_documents( self.db, "pf_holdings", rows )
+
     #Insert portfolio performance table
     #Calculate portfolio value - close of day prices for holdings
     #Calculate portfolio return - (close of day holdings - (close of previous day holding + purchases))/(close of previous day holding + purchases)
@@ -639,7 +341,7 @@ class Insert(Mdb):
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
         #currDate = "2019-12-27"
         #Get existing portfolios
-        portfolios = mdb_query.get_portfolios(currDate)[["portfolioID","inceptionDate"]]
+        portfolios = mdb_query.get_portfolios(currDate, ["inceptionDate"])[["portfolioID","inceptionDate"]]
         #Loop through portfolios
         for portfolio_index, portfolio_row in portfolios.iterrows():
             #Get portfolioID and inceptionDate
@@ -660,15 +362,16 @@ class Insert(Mdb):
             #Get close value from last date and increment the date
             perf_tables = []
             prevCloseValue = 0
-            adjPrevCloseValue = 0
             if not performance.empty:
                 date = performance.iloc[0]["date"]
-                date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-                adjPrevCloseValue = performance.iloc[0]["closeValue"]
+                date = shift_date(date)
                 prevCloseValue = performance.iloc[0]["closeValue"]
             #print( date )
             #Get prices for symbols in portfolio after date
-            prices = mdb_query.get_quotes(symbols, date, "after")
+            dates = pandas.date_range(date, currDate).strftime('%Y-%m-%d').tolist()
+            prices = mdb_query.get_prices_asof(symbols, dates).dropna(subset=["close"])
+            #Only trading days are valued, a symbol without a quote that day uses its last close
+            prices = prices[ prices.date.isin( prices.loc[prices.priceDate == prices.date, "date"] ) ]
             #print( prices )
             #If there are no prices then can't calculate performance
             if prices.empty:
@@ -677,76 +380,51 @@ class Insert(Mdb):
             #Get any transactions after date
             transactions = mdb_query.get_transactions(portfolio, date, "after")
             #print( transactions )
-            #Loop through dates
-            while date <= currDate:
-                #print( date )
-                #Initialize portfolio close of day values
-                closeValue = 0
-                adjCloseValue = 0
-                #Get latest holding for each symbol on date
-                holdings_date = holdings[holdings.lastUpdated <= date]
-                holdings_date = holdings_date[holdings_date.groupby(['symbol'], sort=False)['lastUpdated'].transform(max) == holdings_date['lastUpdated']]
-                #Merge with stock prices
-                holdings_date = pandas.merge(holdings_date,prices[prices.date == date],how='left',left_on=["symbol"],right_on=["symbol"],sort=False)
-                #Remove stocks no longer held
-                holdings_date = holdings_date[ holdings_date['endOfDayQuantity'] != 0 ]
-                #print( holdings_date )
-                #Skip if only USD in holdings
-                if holdings_date[holdings_date.symbol != "USD"].empty:
-                    date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-                    continue
-                #Skip any day where there aren't prices for all stocks
-                if holdings_date[holdings_date.symbol != "USD"]['close'].isnull().values.any():
-                    date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
-                    continue
-                #Calculate portfolio close of day value from close of day stock prices
-                if not holdings_date.empty:
-                    for index, holding in holdings_date.iterrows():
-                        if holding.symbol == "USD":
-                            closeValue = closeValue + (holding.endOfDayQuantity)
-                        else:
-                            closeValue = closeValue + (holding.endOfDayQuantity * holding.close)
-                #Get any deposits or withdrawals
-                deposits = pandas.DataFrame()
-                withdrawals = pandas.DataFrame()
-                if not transactions.empty:
-                    deposits = transactions[(transactions.date == date) & (transactions.type == "deposit")]
-                    withdrawals = transactions[(transactions.date == date) & (transactions.type == "withdrawal")]
-                #print( deposits )
-                #print( withdrawals )
+            #Quantity of each holding on each date, stocks no longer held are NaN
+            positions = daily_positions(holdings, dates)
+            positions = positions.where( positions != 0 )
+            stocks = positions.drop( columns=[CASH], errors='ignore' )
+            #Close prices aligned with the stock positions
+            closes = prices.pivot( index="date", columns="symbol", values="close" )
+            closes = closes.reindex( index=stocks.index, columns=stocks.columns )
+            #Skip days with only USD in holdings and any day where there aren't prices for all stocks
+            valued = stocks.notna().any(axis=1) & ~( stocks.notna() & closes.isna() ).any(axis=1)
+            #Calculate portfolio close of day values from close of day stock prices
+            closeValues = (stocks * closes).sum(axis=1)
+            if CASH in positions.columns:
+                closeValues = closeValues + positions[CASH].fillna(0.0)
+            #Get any deposits or withdrawals on each date
+            deposits = pandas.Series(0.0, index=positions.index)
+            withdrawals = pandas.Series(0.0, index=positions.index)
+            if not transactions.empty:
+                amounts = transactions["volume"] * transactions["price"]
+                deposits = deposits.add( amounts[transactions.type == "deposit"].groupby(transactions.date).sum(), fill_value=0.0 ).reindex(positions.index)
+                withdrawals = withdrawals.add( amounts[transactions.type == "withdrawal"].groupby(transactions.date).sum(), fill_value=0.0 ).reindex(positions.index)
+            #Each day is relative to the close of the last day with a performance entry
+            for date, closeValue, deposit, withdrawal in zip( positions.index[valued], closeValues[valued], deposits[valued], withdrawals[valued] ):
                 #Adjust close or previous close for withdrawals/deposits
-                adjPrevCloseValue = prevCloseValue
-                adjCloseValue = closeValue
-                if not deposits.empty:
-                    for index, deposit in deposits.iterrows():
-                        adjPrevCloseValue = adjPrevCloseValue + (deposit.volume * deposit.price)
-                if not withdrawals.empty:
-                    for index, withdrawal in withdrawals.iterrows():
-                        adjCloseValue = adjCloseValue + (withdrawal.volume * withdrawal.price)
+                adjPrevCloseValue = prevCloseValue + deposit
+                adjCloseValue = closeValue + withdrawal
                 #If portfolio has no holdings or deposits yet then continue
                 if adjPrevCloseValue == 0:
-                    date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
                     continue
                 #Build portfolio performance table
                 perf_table = { "portfolioID": portfolio,
                                 "date": date,
-                                "prevCloseValue": prevCloseValue,
-                                "closeValue": closeValue,
-                                "adjPrevCloseValue": adjPrevCloseValue,
-                                "adjCloseValue": adjCloseValue,
+                                "prevCloseValue": float(prevCloseValue),
+                                "closeValue": float(closeValue),
+                                "adjPrevCloseValue": float(adjPrevCloseValue),
+                                "adjCloseValue": float(adjCloseValue),
                                 "percentReturn": 100.*((adjCloseValue-adjPrevCloseValue)/adjPrevCloseValue) }
                 perf_tables.append( perf_table )
-                #Reset previous close values
+                #Reset previous close value
                 prevCloseValue = closeValue
-                adjPrevCloseValue = closeValue
-                #Increment date
-                date = (pandas.Timestamp(date) + pandas.DateOffset(days=1)).strftime('%Y-%m-%d')
             #Insert performance table
             insert_pf_performance = True
             #print( perf_tables )
             if insert_pf_performance and len(perf_tables)>0:
                 #print( perf_tables )
-                self.db.pf_performance.insert_many( perf_tables )
+                write_documents( self.db, "pf_performance", perf_tables )
     
     #Store the top ranked stocks for the last week
     def insert_stock_list(self):
@@ -756,9 +434,10 @@ class Insert(Mdb):
         currDate = datetime.datetime.now().strftime("%Y-%m-%d")
         #Delete stock lists older than one week
         #No reason to keep them
-        weekBeforeDate = (pandas.Timestamp(currDate) + pandas.DateOffset(days=-7)).strftime('%Y-%m-%d')
+        weekBeforeDate = shift_date(currDate, -7)
         query = { "date": { "$lt": weekBeforeDate } }
         self.db.pf_stock_list.delete_many( query )
+        query_cache.invalidate("pf_stock_list")
         #Get ranked stock list for current date
         mdb_algo = Algo()
         merged = mdb_algo.calculate_top_stocks(currDate) 
@@ -768,4 +447,4 @@ class Insert(Mdb):
         latestStockList = mdb_query.get_stock_list(latestDate, "on")
         if latestStockList.empty and not merged.empty:
             print( "Inserting stock list" )
-            self.db.stock_list.insert_many( merged.to_dict('records') )
+            write_documents( self.db, "stock_list", merged.to_dict('records') )
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Timing of every database call and a log of slow queries
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import logging
+import threading
+import bson
+import pandas
+
+logger = logging.getLogger("diywealth.queries")
+
+#One document in SIZE_SAMPLE is encoded to estimate the bytes of a call
+SIZE_SAMPLE = 100
+
+#Calls kept with their filters and plans, the rest only add to the totals
+MAX_SLOWEST = 100
+
+def plan_stages(explain):
+    """
+    Return every stage name in the winning plans of an explain result
+    @params:
+        explain     - Required  : explain output (Dict)
+    """
+
+    stages = []
+
+    def walk_plan(plan):
+        if "queryPlan" in plan:
+            plan = plan["queryPlan"]
+        if "stage" in plan:
+            stages.append( plan["stage"] )
+        if "inputStage" in plan:
+            walk_plan( plan["inputStage"] )
+        for stage in plan.get("inputStages", []):
+            walk_plan( stage )
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "winningPlan" and isinstance(value, dict):
+                    walk_plan( value )
+                else:
+                    walk( value )
+        elif isinstance(node, list):
+            for value in node:
+                walk( value )
+
+    walk( explain )
+
+    return stages
+
+def _caller():
+    """
+    Return module.function of the outermost call into the module that issued the query
+    e.g. query.get_chart rather than query._find
+    """
+
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    filename = frame.f_code.co_filename
+    name = frame.f_code.co_name
+    frame = frame.f_back
+    while frame is not None and frame.f_code.co_filename == filename:
+        name = frame.f_code.co_name
+        frame = frame.f_back
+
+    return os.path.splitext(os.path.basename(filename))[0] + "." + name
+
+def _size(doc):
+    try:
+        return len(bson.encode(doc))
+    except Exception:
+        return 0
+
+def _sample_size(docs):
+    """
+    Estimate the encoded size of a list of documents from one in SIZE_SAMPLE
+    @params:
+        docs        - Required  : documents ([Dict])
+    """
+
+    sample = docs[::SIZE_SAMPLE]
+    if not sample:
+        return 0
+
+    return int( sum( _size(doc) for doc in sample ) * len(docs) / len(sample) )
+
+class QueryStats:
+    def __init__(self, slow_seconds = 1.0, explain_sample = 0.0):
+        """
+        Registry of database calls, disabled until enable() is called
+        @params:
+            slow_seconds    - Optional  : calls slower than this are logged with their plan (Float)
+            explain_sample  - Optional  : fraction of reads to explain (Float)
+        """
+
+        self.slow_seconds = slow_seconds
+        self.explain_sample = explain_sample
+        self.enabled = False
+        self.max_slowest = MAX_SLOWEST
+        #[calls, seconds, max_seconds, docs, bytes] per (caller, collection, operation)
+        self._totals = {}
+        #Min-heap of (seconds, sequence, entry) holding the slowest calls
+        self._slowest = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def enable(self, slow_seconds = None, explain_sample = None):
+        """
+        Start recording database calls
+        @params:
+            slow_seconds    - Optional  : calls slower than this are logged with their plan (Float)
+            explain_sample  - Optional  : fraction of reads to explain (Float)
+        """
+
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        if explain_sample is not None:
+            self.explain_sample = explain_sample
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
+            self._slowest = []
+            self._count = 0
+
+    def record(self, entry, explain = None):
+        """
+        Store one call, explaining it if slow or sampled
+        @params:
+            entry       - Required  : call details (Dict)
+            explain     - Optional  : function returning the explain output
+        """
+
+        slow = entry["seconds"] >= self.slow_seconds
+        if explain is not None and (slow or random.random() < self.explain_sample):
+            try:
+                entry["plan"] = " > ".join( plan_stages( explain() ) )
+            except Exception as e:
+                entry["plan"] = "unavailable: " + type(e).__name__
+
+        with self._lock:
+            key = ( entry["caller"], entry["collection"], entry["operation"] )
+            totals = self._totals.setdefault( key, [0, 0.0, 0.0, 0, 0] )
+            totals[0] += 1
+            totals[1] += entry["seconds"]
+            totals[2] = max( totals[2], entry["seconds"] )
+            totals[3] += entry["docs"] or 0
+            totals[4] += entry["bytes"] or 0
+            self._count += 1
+            item = ( entry["seconds"], self._count, entry )
+            if len(self._slowest) < self.max_slowest:
+                heapq.heappush( self._slowest, item )
+            elif item[0] > self._slowest[0][0]:
+                heapq.heapreplace( self._slowest, item )
+
+        logger.info( json.dumps( entry, default=str ) )
+        if slow:
+            logger.warning( "Slow query " + json.dumps( entry, default=str ) )
+
+    def records(self):
+        """
+        Return the slowest calls kept, at most max_slowest, slowest first
+        """
+
+        with self._lock:
+            entries = [ entry for seconds, count, entry in sorted( self._slowest, key=lambda item: item[:2], reverse=True ) ]
+
+        return pandas.DataFrame( entries )
+
+    def summary(self):
+        """
+        Return calls grouped by caller, collection and operation, slowest first
+        """
+
+        with self._lock:
+            rows = [ dict( zip( ["caller","collection","operation"], key ),
+                           **dict( zip( ["calls","seconds","max_seconds","docs","bytes"], totals ) ) )
+                     for key, totals in self._totals.items() ]
+        summary = pandas.DataFrame( rows )
+        if summary.empty:
+            return summary
+
+        return summary.sort_values(by="seconds", ascending=False).reset_index(drop=True)
+
+    def slowest(self, n = 10):
+        """
+        Return the n slowest calls with their filters and plans
+        @params:
+            n           - Optional  : number of calls, at most max_slowest (Int)
+        """
+
+        return self.records().head(n).reset_index(drop=True)
+
+#Process wide registry shared by every Mdb object
+query_stats = QueryStats()
+
+def enable_instrumentation(slow_seconds = None, explain_sample = None):
+    """
+    Record every database call for the rest of the process
+    Print query_stats.summary() at the end of a run to see where time went
+    @params:
+        slow_seconds    - Optional  : calls slower than this are logged with their plan (Float)
+        explain_sample  - Optional  : fraction of reads to explain (Float)
+    """
+
+    query_stats.enable(slow_seconds, explain_sample)
+
+class InstrumentedCursor:
+    def __init__(self, cursor, entry, explain):
+        """
+        Cursor proxy timing the reads, counting documents and estimating bytes from a sample
+        """
+
+        self._cursor = cursor
+        self._entry = entry
+        self._explain = explain
+
+    def sort(self, key, direction = None):
+        if direction is None:
+            self._cursor = self._cursor.sort(key)
+            self._entry["sort"] = key
+        else:
+            self._cursor = self._cursor.sort(key, direction)
+            self._entry["sort"] = [(key, direction)]
+        return self
+
+    def limit(self, limit):
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def batch_size(self, batch_size):
+        self._cursor = self._cursor.batch_size(batch_size)
+        return self
+
+    def explain(self):
+        return self._cursor.explain()
+
+    def __iter__(self):
+        #aggregate runs its first batch before returning the cursor
+        seconds = self._entry["seconds"]
+        docs = 0
+        sampled = 0
+        sampled_bytes = 0
+        iterator = iter(self._cursor)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    doc = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    break
+                seconds += time.perf_counter() - start
+                if docs % SIZE_SAMPLE == 0:
+                    sampled += 1
+                    sampled_bytes += _size(doc)
+                docs += 1
+                yield doc
+        finally:
+            nbytes = int( sampled_bytes * docs / sampled ) if sampled else 0
+            self._entry.update( { "seconds": seconds, "docs": docs, "bytes": nbytes } )
+            query_stats.record( self._entry, self._explain )
+
+class InstrumentedCollection:
+    def __init__(self, collection):
+        """
+        Collection proxy recording every call in query_stats
+        """
+
+        self._collection = collection
+        self.name = collection.name
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def _entry(self, operation, **details):
+        entry = { "time": time.time(),
+                  "caller": _caller(),
+                  "collection": self.name,
+                  "operation": operation,
+                  "seconds": 0.0,
+                  "docs": 0,
+                  "bytes": 0 }
+        entry.update(details)
+        return entry
+
+    def _timed(self, entry, call, docs = None):
+        start = time.perf_counter()
+        result = call()
+        entry["seconds"] = time.perf_counter() - start
+        if docs is not None:
+            entry["docs"] = docs(result)
+        query_stats.record( entry )
+        return result
+
+    def find(self, query = {}, projection = None, *args, **kwargs):
+        entry = self._entry( "find", filter=query, projection=projection )
+        cursor = self._collection.find( query, projection, *args, **kwargs )
+
+        #Only the winning plan is needed, queryPlanner does not run the query again
+        def explain():
+            command = { "find": self.name, "filter": query }
+            if projection is not None:
+                command["projection"] = projection
+            if entry.get("sort"):
+                sort = entry["sort"]
+                command["sort"] = { sort: 1 } if isinstance(sort, str) else dict(sort)
+            return self._collection.database.command( "explain", command, verbosity="queryPlanner" )
+
+        return InstrumentedCursor( cursor, entry, explain )
+
+    def aggregate(self, pipeline, **kwargs):
+        entry = self._entry( "aggregate", pipeline=pipeline )
+        start = time.perf_counter()
+        cursor = self._collection.aggregate( pipeline, **kwargs )
+        entry["seconds"] = time.perf_counter() - start
+
+        def explain():
+            return self._collection.database.command( "aggregate", self.name, pipeline=pipeline, explain=True )
+
+        return InstrumentedCursor( cursor, entry, explain )
+
+    def find_latest(self, match, date_field, key = "symbol", projection = None):
+        entry = self._entry( "find_latest", filter=match )
+        return self._timed( entry, lambda: self._collection.find_latest( match, date_field, key, projection ), len )
+
+    def find_one(self, query = {}, projection = None, *args, **kwargs):
+        entry = self._entry( "find_one", filter=query )
+        return self._timed( entry, lambda: self._collection.find_one( query, projection, *args, **kwargs ),
+                            lambda doc: 0 if doc is None else 1 )
+
+    def distinct(self, key, query = None, *args, **kwargs):
+        entry = self._entry( "distinct", filter=query, key=key )
+        if query is None:
+            return self._timed( entry, lambda: self._collection.distinct( key ), len )
+        return self._timed( entry, lambda: self._collection.distinct( key, query, *args, **kwargs ), len )
+
+    def count_documents(self, query, *args, **kwargs):
+        entry = self._entry( "count_documents", filter=query )
+        return self._timed( entry, lambda: self._collection.count_documents( query, *args, **kwargs ) )
+
+    def insert_one(self, doc, *args, **kwargs):
+        entry = self._entry( "insert_one", docs=1, bytes=_size(doc) )
+        return self._timed( entry, lambda: self._collection.insert_one( doc, *args, **kwargs ) )
+
+    def insert_many(self, docs, *args, **kwargs):
+        docs = list(docs)
+        entry = self._entry( "insert_many", docs=len(docs), bytes=_sample_size(docs) )
+        return self._timed( entry, lambda: self._collection.insert_many( docs, *args, **kwargs ) )
+
+    def bulk_write(self, requests, *args, **kwargs):
+        requests = list(requests)
+        entry = self._entry( "bulk_write", docs=len(requests) )
+        return self._timed( entry, lambda: self._collection.bulk_write( requests, *args, **kwargs ) )
+
+    def bulk_update(self, requests):
+        requests = list(requests)
+        entry = self._entry( "bulk_update", docs=len(requests) )
+        return self._timed( entry, lambda: self._collection.bulk_update( requests ) )
+
+    def delete_many(self, query, *args, **kwargs):
+        entry = self._entry( "delete_many", filter=query )
+        return self._timed( entry, lambda: self._collection.delete_many( query, *args, **kwargs ),
+                            lambda result: result.deleted_count )
+
+    def update_many(self, query, update, *args, **kwargs):
+        entry = self._entry( "update_many", filter=query )
+        return self._timed( entry, lambda: self._collection.update_many( query, update, *args, **kwargs ),
+                            lambda result: result.modified_count )
+
+class InstrumentedDatabase:
+    def __init__(self, database):
+        """
+        Database proxy handing out InstrumentedCollection objects
+        """
+
+        self._database = database
+
+    def __getitem__(self, name):
+        return InstrumentedCollection( self._database[name] )
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self._database, name)
+        if callable(attr) and not hasattr(attr, "find"):
+            return attr
+        return InstrumentedCollection( self._database[name] )
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Portfolio positions replayed from transactions, producing the pf_holdings rows
+"""
+
+import numpy
+import pandas
+
+#Cash is held as a position in this symbol
+CASH = "USD"
+
+class Ledger:
+    def __init__(self, portfolioID, positions = None):
+        """
+        End of day quantity of every symbol in a portfolio
+        Transactions are applied in order and close() returns the positions that changed
+        @params:
+            portfolioID - Required  : portfolio ID (Str)
+            positions   - Optional  : quantity per symbol to start from (Dict)
+        """
+
+        self.portfolioID = portfolioID
+        self.positions = dict(positions or {})
+        self._touched = []
+
+    def _add(self, symbol, quantity):
+        self.positions[symbol] = self.positions.get(symbol, 0.0) + quantity
+        if symbol not in self._touched:
+            self._touched.append(symbol)
+
+    def touch(self, symbol):
+        """
+        Report a position in the next close() even if it has not changed
+        @params:
+            symbol      - Required  : symbol (Str)
+        """
+
+        self._add(symbol, 0.0)
+
+    def apply(self, transaction):
+        """
+        Apply one transaction to the positions
+        @params:
+            transaction - Required  : pf_transactions document (Dict)
+        """
+
+        kind = transaction["type"]
+        symbol = transaction["symbol"]
+        amount = transaction["price"] * transaction["volume"]
+        if kind == "dividend":
+            self._add(CASH, amount)
+        elif kind == "deposit":
+            self._add(symbol, amount)
+        elif kind == "withdrawal":
+            self._add(symbol, -amount)
+        elif kind == "buy":
+            self._add(symbol, transaction["volume"])
+            self._add(CASH, -amount)
+        elif kind == "sell":
+            if symbol not in self.positions:
+                raise Exception("Trying to sell unowned stock!")
+            self._add(symbol, -transaction["volume"])
+            self._add(CASH, amount)
+        else:
+            raise Exception("Unknown transaction type " + str(kind))
+
+    def quantity(self, symbol):
+        return self.positions.get(symbol, 0.0)
+
+    def held(self):
+        """
+        Return the symbols with a non-zero position, excluding cash
+        """
+
+        return [ symbol for symbol, quantity in self.positions.items() if symbol != CASH and quantity != 0 ]
+
+    def close(self, date):
+        """
+        Return pf_holdings rows for the positions changed since the last close
+        @params:
+            date        - Required  : date YYYY-MM-DD (Str)
+        """
+
+        rows = [ { "portfolioID": self.portfolioID,
+                   "symbol": symbol,
+                   "endOfDayQuantity": self.positions[symbol],
+                   "lastUpdated": date } for symbol in self._touched ]
+        self._touched = []
+
+        return rows
+
+def daily_positions(holdings, dates):
+    """
+    Return the end of day quantity of every symbol on every date, dates x symbols
+    Each pf_holdings entry is carried forward until the next one for its symbol
+    Symbols not yet held are NaN
+    @params:
+        holdings    - Required  : pf_holdings entries (DataFrame)
+        dates       - Required  : dates YYYY-MM-DD, ascending ([Str])
+    """
+
+    holdings = holdings.drop_duplicates( subset=["lastUpdated","symbol"], keep="last" )
+    positions = holdings.pivot( index="lastUpdated", columns="symbol", values="endOfDayQuantity" ).astype(float)
+
+    return positions.reindex( positions.index.union(dates) ).ffill().reindex( dates )
+
+def dividend_transactions(portfolioID, dividends, transactions, positions):
+    """
+    Return the dividend transactions owed on the positions held at the start of each exDate
+    Dividends without a USD amount or a paymentDate and those already in transactions are dropped
+    @params:
+        portfolioID     - Required  : portfolio ID (Str)
+        dividends       - Required  : iex_dividends going ex in the replay window (DataFrame)
+        transactions    - Required  : pf_transactions from the start of the replay (DataFrame)
+        positions       - Required  : quantity per symbol before the replay (Dict)
+    """
+
+    columns = ["portfolioID","symbol","type","date","price","volume","commission"]
+    if dividends.empty:
+        return pandas.DataFrame( columns=columns )
+
+    #Quantity of each symbol after every day it was traded, dated before any trade to start from positions
+    trades = [ pandas.DataFrame( { "symbol": list(positions.keys()),
+                                   "date": "1900-01-01",
+                                   "quantity": list(positions.values()) } ) ]
+    if not transactions.empty:
+        traded = transactions[ transactions["type"].isin(["buy","sell"]) ]
+        sign = numpy.where( traded["type"] == "sell", -1.0, 1.0 )
+        trades.append( pandas.DataFrame( { "symbol": traded["symbol"],
+                                           "date": traded["date"],
+                                           "quantity": traded["volume"] * sign } ) )
+    trades = pandas.concat( trades, ignore_index=True )
+    trades = trades.groupby( ["symbol","date"], as_index=False, sort=True )["quantity"].sum()
+    trades["quantity"] = trades.groupby("symbol")["quantity"].cumsum()
+
+    #Skip dividends with bad data entries
+    dividends = dividends.assign( price=pandas.to_numeric( dividends["amount"], errors="coerce" ) )
+    dividends = dividends[ (dividends["currency"] == "USD") & (dividends["price"].fillna(0) != 0) & dividends["paymentDate"].notna() ]
+
+    #Join each dividend with the quantity held at the end of the day before its exDate
+    dividends = dividends.assign( asof=pandas.to_datetime(dividends["exDate"]) ).sort_values(by="asof", kind="mergesort")
+    trades = trades.assign( asof=pandas.to_datetime(trades["date"]) ).sort_values(by="asof", kind="mergesort")
+    owed = pandas.merge_asof( dividends, trades[["symbol","asof","quantity"]], on="asof", by="symbol",
+                              direction="backward", allow_exact_matches=False )
+    owed = owed[ owed["quantity"].notna() & (owed["quantity"] != 0) ]
+
+    #One dividend transaction per symbol and paymentDate
+    owed = owed.drop_duplicates( subset=["paymentDate","symbol"] )
+    if not transactions.empty:
+        paid = transactions.loc[ transactions["type"] == "dividend", ["date","symbol"] ]
+        owed = owed[ ~pandas.MultiIndex.from_frame( owed[["paymentDate","symbol"]] ).isin( pandas.MultiIndex.from_frame(paid) ) ]
+
+    return pandas.DataFrame( { "portfolioID": portfolioID,
+                               "symbol": owed["symbol"].values,
+                               "type": "dividend",
+                               "date": owed["paymentDate"].values,
+                               "price": owed["price"].values.astype(float),
+                               "volume": owed["quantity"].values,
+                               "commission": 0.0 }, columns=columns )
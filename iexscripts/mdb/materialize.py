@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Build pandas DataFrames from MongoDB cursors column by column
+"""
+
+import numpy
+import pandas
+
+#Number of documents requested from the server per round trip
+DEFAULT_BATCH_SIZE = 5000
+
+#Number of rows in each DataFrame yielded by iter_dataframes
+DEFAULT_CHUNK_SIZE = 50000
+
+#Date windows understood by iter_dataframes, as the YYYY-MM-DD prefix length
+WINDOWS = { "day": 10, "month": 7, "year": 4 }
+
+#Rows allocated for numeric columns before the first doubling
+INITIAL_CAPACITY = 1024
+
+def _to_float(value):
+    """
+    Same conversion as pandas.to_numeric with errors="coerce", NaN if not a number
+    """
+
+    if value is None:
+        return numpy.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+class _Columns:
+    def __init__(self, numeric = None):
+        """
+        Columns of the documents read so far, in the order they are first seen
+        Numeric fields fill float64 arrays grown by doubling, other fields Python lists
+        @params:
+            numeric     - Optional  : fields stored as float64 ([Str])
+        """
+
+        self.numeric = set(numeric or [])
+        self.columns = {}
+        self.n_rows = 0
+        self._capacity = 0
+
+    def _grow(self):
+        self._capacity = max( 2 * self._capacity, INITIAL_CAPACITY )
+        for key, column in self.columns.items():
+            if key in self.numeric:
+                grown = numpy.full( self._capacity, numpy.nan )
+                grown[:self.n_rows] = column[:self.n_rows]
+                self.columns[key] = grown
+
+    def append(self, doc):
+        """
+        Add one document, missing values are None or NaN
+        @params:
+            doc         - Required  : document to add (Dict)
+        """
+
+        n_rows = self.n_rows
+        if self.numeric and n_rows == self._capacity:
+            self._grow()
+        for key, value in doc.items():
+            column = self.columns.get(key)
+            if key in self.numeric:
+                if column is None:
+                    column = numpy.full( self._capacity, numpy.nan )
+                    self.columns[key] = column
+                column[n_rows] = _to_float(value)
+                continue
+            if column is None:
+                #New column, back fill rows already seen
+                column = [None] * n_rows
+                self.columns[key] = column
+            column.append(value)
+        #Pad columns missing from this document, numeric arrays are already NaN
+        if len(doc) != len(self.columns):
+            for key, column in self.columns.items():
+                if key not in self.numeric and len(column) <= n_rows:
+                    column.append(None)
+        self.n_rows = n_rows + 1
+
+    def frame(self):
+        if self.n_rows == 0:
+            return pandas.DataFrame()
+
+        return pandas.DataFrame( { key: (column[:self.n_rows] if key in self.numeric else column)
+                                   for key, column in self.columns.items() } )
+
+def cursor_to_dataframe(results, batch_size = DEFAULT_BATCH_SIZE, numeric = None):
+    """
+    Drain a cursor into columns and build a single DataFrame
+    Columns appear in the order they are first seen, missing values are None
+    Numeric fields are filled straight into float64 arrays, missing or unparseable values are NaN
+    @params:
+        results     - Required  : pymongo cursor or iterable of documents
+        batch_size  - Optional  : documents per server round trip (Int)
+        numeric     - Optional  : fields to read as float64, e.g. schemas.NUMERIC[collection] ([Str])
+    """
+
+    #Ask the server for large batches where the cursor supports it
+    if batch_size and hasattr(results, "batch_size"):
+        results = results.batch_size(batch_size)
+
+    columns = _Columns(numeric)
+    for doc in results:
+        columns.append(doc)
+
+    return columns.frame()
+
+def iter_dataframes(results, chunk_size = DEFAULT_CHUNK_SIZE, date_field = None, window = None, batch_size = DEFAULT_BATCH_SIZE, numeric = None):
+    """
+    Yield DataFrames of bounded size while the cursor is read
+    A chunk ends after chunk_size rows or when date_field leaves the current window
+    Windows need the cursor sorted by date_field
+    @params:
+        results     - Required  : pymongo cursor or iterable of documents
+        chunk_size  - Optional  : maximum rows per DataFrame, None for no limit (Int)
+        date_field  - Optional  : date field YYYY-MM-DD used by window (Str)
+        window      - Optional  : day, month, year, None for no window (Str)
+        batch_size  - Optional  : documents per server round trip (Int)
+        numeric     - Optional  : fields to read as float64 ([Str])
+    """
+
+    if window is not None:
+        if window not in WINDOWS:
+            raise ValueError("window not in [" + ", ".join(WINDOWS) + "]")
+        if date_field is None:
+            raise ValueError("window needs a date_field")
+        prefix = WINDOWS[window]
+
+    if batch_size and hasattr(results, "batch_size"):
+        results = results.batch_size(batch_size)
+
+    columns = _Columns(numeric)
+    current = None
+    for doc in results:
+        if window is not None:
+            value = doc.get(date_field)
+            value = value[:prefix] if isinstance(value, str) else value
+            if columns.n_rows > 0 and value != current:
+                yield columns.frame()
+                columns = _Columns(numeric)
+            current = value
+        columns.append(doc)
+        if chunk_size and columns.n_rows >= chunk_size:
+            yield columns.frame()
+            columns = _Columns(numeric)
+
+    if columns.n_rows > 0:
+        yield columns.frame()
@@ -3,6 +3,8 @@
 # Date: Feb 11th, 2019
 # Brief: Toolkit to access the IEX API and data stored in MongoDB.
 
+import os
+import threading
 import pymongo
 from pymongo import MongoClient
 from iexscripts.constants import (MDB_USER,
@@ -10,28 +12,106 @@ from iexscripts.constants import (MDB_USER,
                                   MDB_HOST,
                                   MDB_PORT,
                                   MDB_NAMESPACE)
+from mdb.backend import get_backend
+from mdb.instrument import query_stats, InstrumentedDatabase
+
+#MongoClient options shared by every Mdb instance
+#zstd and snappy can be added to compressors if the libraries are installed
+MDB_CLIENT_OPTIONS = {
+    'maxPoolSize': 20,
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 60000,
+    'connectTimeoutMS': 10000,
+    'serverSelectionTimeoutMS': 30000,
+    'socketTimeoutMS': 600000,
+    'compressors': 'zlib',
+}
+
+#One client per process, created on first use
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def _reset_client():
+    """
+    Forget the parent's client in a forked child
+    MongoClient is not fork safe so the child must open its own
+    """
+
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_client)
+
+def get_client():
+    """
+    Return the process wide MongoClient, creating it if needed
+    """
+
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            connection_params = {
+                'user': MDB_USER,
+                'password': MDB_PASSWORD,
+                'host': MDB_HOST,
+                'port': MDB_PORT,
+                'namespace': MDB_NAMESPACE,
+            }
+
+            _client = MongoClient(
+                'mongodb://{user}:{password}@{host}:'
+                '{port}/{namespace}'.format(**connection_params),
+                **MDB_CLIENT_OPTIONS
+            )
+            _client_pid = os.getpid()
+
+    return _client
+
+def close_client():
+    """
+    Close the process wide MongoClient
+    """
+
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+def configure_client(**options):
+    """
+    Change MongoClient options, e.g. configure_client(maxPoolSize=50)
+    The current client is closed and reopened with the new options on next use
+    @params:
+        options     - Optional  : MongoClient keyword options
+    """
+
+    MDB_CLIENT_OPTIONS.update(options)
+    close_client()
 
 class Mdb:
     def __init__(self):
         """
-        Return MongoDB database object
+        Return database object of the current backend, MongoDB by default
         """
 
-        connection_params = {
-            'user': MDB_USER,
-            'password': MDB_PASSWORD,
-            'host': MDB_HOST,
-            'port': MDB_PORT,
-            'namespace': MDB_NAMESPACE,
-        }
-
-        connection = MongoClient(
-            'mongodb://{user}:{password}@{host}:'
-            '{port}/{namespace}'.format(**connection_params)
-        )
-
-        self._db = connection.diywealth
+        self._backend = get_backend()
+        self._db = self._backend.database()
 
     @property
     def db(self):
+        #Record every call when instrumentation is enabled
+        if query_stats.enabled:
+            return InstrumentedDatabase(self._db)
         return self._db
+
+    @property
+    def backend(self):
+        return self._backend
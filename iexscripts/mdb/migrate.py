@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+One-off data migrations of the DIYWealth collections
+"""
+
+import pandas
+from mdb.mdb import Mdb
+from mdb.cache import query_cache
+from mdb.dates import NATIVE_DATES, native_field, to_native
+
+class Migrate(Mdb):
+    def __init__(self):
+        #Inherit all methods and properties from Mdb
+        super().__init__()
+
+    def migrate_native_dates(self, collections = None):
+        """
+        Add a native BSON date copy of every YYYY-MM-DD date field
+        Only documents without the copy are updated so it is safe to rerun
+        Needs MongoDB 4.2 or later for update pipelines, other backends convert the dates in Python
+        @params:
+            collections - Optional  : collections to migrate, None for all ([Str])
+        """
+
+        if collections is None:
+            collections = list(NATIVE_DATES.keys())
+
+        for collection in collections:
+            for field in NATIVE_DATES[collection]:
+                query = { field: { "$type": "string" },
+                          native_field(field): { "$exists": False } }
+                update = [ { "$set": { native_field(field): { "$dateFromString": { "dateString": { "$substrBytes": [ "$" + field, 0, 10 ] },
+                                                                                    "format": "%Y-%m-%d",
+                                                                                    "onError": None,
+                                                                                    "onNull": None } } } } ]
+                if self.backend.aggregation:
+                    modified = self.db[collection].update_many( query, update ).modified_count
+                else:
+                    modified = self._migrate_field( collection, field, query )
+                print( "Added " + native_field(field) + " to " + str(modified) + " documents of " + collection )
+            query_cache.invalidate(collection)
+
+    def _migrate_field(self, collection, field, query):
+        """
+        Python equivalent of the update pipeline for backends without one
+        Returns the number of documents updated
+        @params:
+            collection  - Required  : collection name (Str)
+            field       - Required  : string date field (Str)
+            query       - Required  : documents without the native copy (Dict)
+        """
+
+        requests = [ ( { "_id": doc["_id"] }, { "$set": { native_field(field): to_native(doc[field]) } }, False )
+                     for doc in self.db[collection].find( query, { "_id": 1, field: 1 } ) ]
+        if not requests:
+            return 0
+        inserted, modified = self.backend.bulk_update( self.db[collection], requests )
+
+        return modified
+
+    def check_native_dates(self, collections = None):
+        """
+        Count documents whose string dates have no native copy yet
+        Native reads are safe to enable when every count is zero
+        @params:
+            collections - Optional  : collections to check, None for all ([Str])
+        """
+
+        if collections is None:
+            collections = list(NATIVE_DATES.keys())
+
+        report = []
+        for collection in collections:
+            for field in NATIVE_DATES[collection]:
+                query = { field: { "$type": "string" },
+                          native_field(field): { "$exists": False } }
+                report.append( { "collection": collection,
+                                 "field": field,
+                                 "missing": self.db[collection].count_documents( query ) } )
+
+        return pandas.DataFrame(report)
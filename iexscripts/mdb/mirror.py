@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Local Parquet mirror of the price, balance sheet and performance collections
+"""
+
+import os
+import json
+import shutil
+import datetime
+import pandas
+from pymongo import ASCENDING, DESCENDING
+from mdb.materialize import cursor_to_dataframe, iter_dataframes
+from mdb.cache import query_cache
+from mdb.dates import NATIVE_DATES, native_field
+
+#Collections kept in the mirror and the date field they are partitioned by
+MIRRORED = {
+    "iex_quotes": "date",
+    "iex_charts": "date",
+    "iex_balancesheets": "reportDate",
+    "pf_performance": "date",
+}
+
+#Default location of the mirror, alongside the json output
+MIRROR_ROOT = "output/mirror"
+
+#Time write_documents last wrote a document of a MIRRORED collection, orders the syncs
+UPDATED_FIELD = "updated"
+
+#Writes stamped up to this long before a sync started are read again by the next one
+#Covers writes still in flight when the sync started and writers whose clocks run behind
+SYNC_MARGIN = datetime.timedelta(minutes=10)
+
+#Date ranges deleted from MIRRORED collections, the syncs rebuild the months they overlap
+MIRROR_DELETES = "mirror_deletes"
+
+def record_delete(db, collection, first = None, last = None):
+    """
+    Record that documents of a MIRRORED collection were deleted
+    The next sync of every mirror rebuilds its months overlapping the range
+    @params:
+        db          - Required  : database the documents were deleted from
+        collection  - Required  : collection name (Str)
+        first       - Optional  : earliest date deleted YYYY-MM-DD, None if unbounded (Str)
+        last        - Optional  : latest date deleted YYYY-MM-DD, None if unbounded (Str)
+    """
+
+    if collection not in MIRRORED:
+        return
+
+    db[MIRROR_DELETES].insert_one( { "collection": collection,
+                                     "first": first,
+                                     "last": last,
+                                     UPDATED_FIELD: datetime.datetime.now() } )
+
+def _internal_fields(collection):
+    """
+    Native date copies and write times are not mirrored
+    """
+
+    return [UPDATED_FIELD] + [ native_field(field) for field in NATIVE_DATES.get(collection, []) ]
+
+def _require_pyarrow():
+    """
+    The mirror is optional so only fail when it is actually used
+    """
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("The local mirror needs pyarrow: python3 -m pip install pyarrow")
+
+def filter_frame(frame, query):
+    """
+    Apply a simple MongoDB filter to a DataFrame
+    Supports equality, $in, $gt, $gte, $lt and $lte
+    @params:
+        frame       - Required  : documents (DataFrame)
+        query       - Required  : MongoDB filter (Dict)
+    """
+
+    if frame.empty:
+        return frame
+
+    mask = pandas.Series(True, index=frame.index)
+    for field, condition in query.items():
+        if field not in frame.columns:
+            return frame.iloc[0:0]
+        column = frame[field]
+        if isinstance(condition, dict):
+            for op, value in condition.items():
+                if op == "$in":
+                    mask &= column.isin(value)
+                elif op == "$gte":
+                    mask &= column >= value
+                elif op == "$gt":
+                    mask &= column > value
+                elif op == "$lte":
+                    mask &= column <= value
+                elif op == "$lt":
+                    mask &= column < value
+                else:
+                    raise ValueError("Unsupported operator in mirror query: " + op)
+        else:
+            mask &= column == condition
+
+    return frame[mask]
+
+class Mirror:
+    def __init__(self, root = MIRROR_ROOT):
+        """
+        Parquet copy of MIRRORED collections, one file per collection and month
+        @params:
+            root        - Optional  : mirror directory (Str)
+        """
+
+        self.root = root
+
+    def _collection_path(self, collection):
+        return os.path.join(self.root, collection)
+
+    def _partition_path(self, collection, month):
+        return os.path.join(self._collection_path(collection), "month=" + month, "part.parquet")
+
+    def _state_path(self, collection):
+        return os.path.join(self._collection_path(collection), "_state.json")
+
+    def high_water(self, collection):
+        """
+        Return the write time the next sync copies from, None if the collection needs a full copy
+        Mirrors from before write times were tracked have no such time
+        @params:
+            collection  - Required  : collection name (Str)
+        """
+
+        path = self._state_path(collection)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            high_water = json.load(f).get(UPDATED_FIELD)
+
+        return datetime.datetime.fromisoformat(high_water) if high_water else None
+
+    def months(self, collection):
+        """
+        Return the mirrored months YYYY-MM in ascending order
+        @params:
+            collection  - Required  : collection name (Str)
+        """
+
+        path = self._collection_path(collection)
+        if not os.path.isdir(path):
+            return []
+        return sorted( d[len("month="):] for d in os.listdir(path) if d.startswith("month=") )
+
+    def _rebuild_deleted(self, mdb, collection, high_water):
+        """
+        Copy again from MongoDB the mirrored months overlapping deletes recorded since the high-water mark
+        Returns the months rebuilt
+        @params:
+            mdb         - Required  : Mdb object to read from (Mdb)
+            collection  - Required  : collection name (Str)
+            high_water  - Required  : latest write time already mirrored (datetime)
+        """
+
+        date_field = MIRRORED[collection]
+        deletes = list( mdb.db[MIRROR_DELETES].find( { "collection": collection, UPDATED_FIELD: { "$gte": high_water } } ) )
+        months = [ month for month in self.months(collection)
+                   if any( ( delete.get("first") is None or month >= delete["first"][:7] ) and
+                           ( delete.get("last") is None or month <= delete["last"][:7] ) for delete in deletes ) ]
+        for month in months:
+            query = { date_field: { "$gte": month + "-01", "$lte": month + "-31" } }
+            results = mdb.db[collection].find( query, { "_id": 0 } ).sort(date_field, ASCENDING)
+            rows = cursor_to_dataframe( results )
+            path = self._partition_path(collection, month)
+            if rows.empty:
+                shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+                continue
+            rows = rows.drop( columns=_internal_fields(collection), errors='ignore' )
+            rows.to_parquet(path, index=False)
+        if months:
+            print( "Rebuilt " + str(len(months)) + " months of " + collection + " after deletes" )
+
+        return months
+
+    def sync(self, collections = None, mdb = None):
+        """
+        Copy documents written since the high-water mark from MongoDB
+        The next high-water mark is the start of the sync less SYNC_MARGIN, so a few documents are copied twice
+        Documents already mirrored are replaced on their UNIQUE_KEYS, whatever their date
+        Months overlapping deletes recorded by record_delete are copied again in full
+        A collection without a high-water mark is copied one month at a time
+        Native date copies and write times are not mirrored
+        @params:
+            collections - Optional  : collections to sync, None for all ([Str])
+            mdb         - Optional  : Mdb object to read from (Mdb)
+        """
+
+        _require_pyarrow()
+
+        if mdb is None:
+            from mdb.mdb import Mdb
+            mdb = Mdb()
+        if collections is None:
+            collections = list(MIRRORED.keys())
+
+        for collection in collections:
+            high_water = self.high_water(collection)
+            started = datetime.datetime.now()
+            if high_water is None:
+                #Nothing to compare write times against, copy everything
+                shutil.rmtree(self._collection_path(collection), ignore_errors=True)
+                self._copy(mdb, collection)
+            else:
+                self._rebuild_deleted(mdb, collection, high_water)
+                self._update(mdb, collection, high_water)
+            #Cached results of the collection predate the sync
+            query_cache.invalidate(collection)
+            os.makedirs(self._collection_path(collection), exist_ok=True)
+            with open(self._state_path(collection), "w") as f:
+                json.dump( { UPDATED_FIELD: (started - SYNC_MARGIN).isoformat() }, f )
+
+    def _copy(self, mdb, collection):
+        """
+        Copy a whole collection from MongoDB, holding one month in memory at a time
+        @params:
+            mdb         - Required  : Mdb object to read from (Mdb)
+            collection  - Required  : collection name (Str)
+        """
+
+        date_field = MIRRORED[collection]
+        results = mdb.db[collection].find( {}, { "_id": 0 } ).sort(date_field, ASCENDING)
+        count = 0
+        for rows in iter_dataframes( results, chunk_size=None, date_field=date_field, window="month" ):
+            month = rows[date_field].iloc[0]
+            if not isinstance(month, str):
+                continue
+            rows = rows.drop( columns=_internal_fields(collection), errors='ignore' )
+            path = self._partition_path(collection, month[:7])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rows.to_parquet(path, index=False)
+            count += len(rows.index)
+        print( "Mirrored " + str(count) + " documents of " + collection )
+
+    def _update(self, mdb, collection, high_water):
+        """
+        Merge the documents written since the high-water mark into the mirrored months
+        @params:
+            mdb         - Required  : Mdb object to read from (Mdb)
+            collection  - Required  : collection name (Str)
+            high_water  - Required  : latest write time already mirrored (datetime)
+        """
+
+        from mdb.index import UNIQUE_KEYS
+
+        date_field = MIRRORED[collection]
+        keys = UNIQUE_KEYS[collection]
+        #Documents on the high-water time itself are read again and replaced
+        query = { UPDATED_FIELD: { "$gte": high_water } }
+        results = mdb.db[collection].find( query, { "_id": 0 } ).sort(UPDATED_FIELD, ASCENDING)
+        new = cursor_to_dataframe( results )
+        if new.empty:
+            print( "Mirror of " + collection + " is up to date" )
+            return
+        new = new.drop( columns=_internal_fields(collection), errors='ignore' )
+        new["_month"] = new[date_field].str[:7]
+        for month, rows in new.groupby("_month", sort=True):
+            rows = rows.drop("_month", axis=1)
+            path = self._partition_path(collection, month)
+            if os.path.exists(path):
+                old = pandas.read_parquet(path)
+                #Replace documents rewritten since the last sync
+                rewritten = pandas.MultiIndex.from_frame( old[keys] ).isin( pandas.MultiIndex.from_frame( rows[keys] ) )
+                rows = pandas.concat( [old[~rewritten], rows], axis=0, ignore_index=True, sort=False )
+            rows = rows.sort_values(by=date_field, kind="mergesort")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rows.to_parquet(path, index=False)
+        print( "Mirrored " + str(len(new.index)) + " documents of " + collection )
+
+    def _query_months(self, collection, query):
+        """
+        Return the mirrored months overlapping the date range of a MongoDB filter, ascending
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Required  : MongoDB filter (Dict)
+        """
+
+        date_field = MIRRORED[collection]
+        condition = query.get(date_field)
+        first, last = None, None
+        if isinstance(condition, dict):
+            first = condition.get("$gte", condition.get("$gt"))
+            last = condition.get("$lte", condition.get("$lt"))
+        elif condition is not None:
+            first, last = condition, condition
+
+        return [ month for month in self.months(collection)
+                 if ( first is None or month >= first[:7] ) and ( last is None or month <= last[:7] ) ]
+
+    def read(self, collection, query = {}):
+        """
+        Return mirrored documents matching a MongoDB filter
+        Only the monthly partitions overlapping the date range are read
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Optional  : MongoDB filter (Dict)
+        """
+
+        _require_pyarrow()
+
+        frames = [ pandas.read_parquet( self._partition_path(collection, month) ) for month in self._query_months(collection, query) ]
+        if not frames:
+            return pandas.DataFrame()
+
+        frame = pandas.concat( frames, axis=0, ignore_index=True, sort=False )
+
+        return filter_frame( frame, query )
+
+    def find(self, collection, query, projection = None, sort = None):
+        """
+        Mirror equivalent of a MongoDB find
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Required  : MongoDB filter (Dict)
+            projection  - Optional  : MongoDB projection (Dict)
+            sort        - Optional  : sort specification ([(Str, Int)])
+        """
+
+        frame = self.read(collection, query)
+        if not frame.empty and sort is not None:
+            frame = frame.sort_values( by=[ field for field, direction in sort ],
+                                       ascending=[ direction == ASCENDING for field, direction in sort ],
+                                       kind="mergesort" )
+
+        return self._project( frame, projection )
+
+    def iter_find(self, collection, query, projection = None, sort = None):
+        """
+        Yield mirrored documents matching a MongoDB filter, reading one monthly partition at a time
+        Sorts not led by the partition date field need every month and read them all at once
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Required  : MongoDB filter (Dict)
+            projection  - Optional  : MongoDB projection (Dict)
+            sort        - Optional  : sort specification ([(Str, Int)])
+        """
+
+        _require_pyarrow()
+
+        date_field = MIRRORED[collection]
+        if sort and sort[0][0] != date_field:
+            yield from self.find(collection, query, projection, sort).to_dict("records")
+            return
+
+        months = self._query_months(collection, query)
+        if sort and sort[0][1] == DESCENDING:
+            months = months[::-1]
+        for month in months:
+            frame = filter_frame( pandas.read_parquet( self._partition_path(collection, month) ), query )
+            if frame.empty:
+                continue
+            if sort:
+                frame = frame.sort_values( by=[ field for field, direction in sort ],
+                                           ascending=[ direction == ASCENDING for field, direction in sort ],
+                                           kind="mergesort" )
+            yield from self._project( frame, projection ).to_dict("records")
+
+    def find_latest(self, collection, match, date_field, key = "symbol", projection = None):
+        """
+        Mirror equivalent of Query._latest
+        @params:
+            collection  - Required  : collection name (Str)
+            match       - Required  : MongoDB filter (Dict)
+            date_field  - Required  : field ordering the documents (Str)
+            key         - Optional  : field to group documents by (Str)
+            projection  - Optional  : MongoDB projection (Dict)
+        """
+
+        frame = self.read(collection, match)
+        if not frame.empty:
+            frame = frame.sort_values( by=[key, date_field], ascending=[True, False], kind="mergesort" )
+            frame = frame.drop_duplicates( subset=[key], keep="first" )
+
+        return self._project( frame, projection )
+
+    def _project(self, frame, projection):
+        if projection is not None and not frame.empty:
+            frame = frame.loc[:, [ f for f in frame.columns if projection.get(f) ]]
+        frame = frame.reset_index(drop=True)
+
+        return frame
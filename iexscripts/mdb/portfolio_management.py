@@ -18,6 +18,8 @@ import numpy
 import pandas
 from iexscripts.utils import printProgressBar
 from mdb.mdb import Mdb
+from mdb.cache import query_cache
+from mdb.dates import add_native_dates, shift_date
 from mdb.query import Query
 from mdb.algo import Algo
 
@@ -110,12 +112,13 @@ class PortfolioManagement(Mdb):
         insert_pf_info = True
         if insert_pf_info:
             print( "Inserting portfolio tables" )
-            self.db.pf_info.insert_many( portfolio_tables )
+            self.db.pf_info.insert_many( add_native_dates( portfolio_tables, "pf_info" ) )
+            query_cache.invalidate("pf_info")
     
     def insert_transactions(self):
         print( "Create portfolio transaction tables" )
         transactionDate = "2018-07-02"
-        dayBeforeDate = (pandas.Timestamp(transactionDate) + pandas.DateOffset(days=-1)).strftime('%Y-%m-%d')
+        dayBeforeDate = shift_date(transactionDate, -1)
         print( dayBeforeDate )
         #Get ranked stock list for current date
         mdb_algo = Algo()
@@ -159,7 +162,8 @@ class PortfolioManagement(Mdb):
             transaction_tables.append( transaction_table )
         insert_pf_transactions = True
         if insert_pf_transactions:
-            self.db.pf_transactions.insert_many( transaction_tables )
+            self.db.pf_transactions.insert_many( add_native_dates( transaction_tables, "pf_transactions" ) )
+            query_cache.invalidate("pf_transactions")
         #Build transaction tables which buy the stocks
         transaction_tables = []
         #Loop through portfolio dataframes
@@ -187,7 +191,8 @@ class PortfolioManagement(Mdb):
                 transaction_tables.append( transaction_table )
         insert_pf_transactions = True
         if insert_pf_transactions:
-            self.db.pf_transactions.insert_many( transaction_tables )
+            self.db.pf_transactions.insert_many( add_native_dates( transaction_tables, "pf_transactions" ) )
+            query_cache.invalidate("pf_transactions")
     
     def pf_sell_all(self, ref_date = "1990-01-01"):
         """
@@ -198,17 +203,22 @@ class PortfolioManagement(Mdb):
         mdb_query = Query()
         #Get link to MongoDB
         #Get date for stock prices
-        dayBeforeDate = (pandas.Timestamp(ref_date) + pandas.DateOffset(days=-1)).strftime('%Y-%m-%d')
+        dayBeforeDate = shift_date(ref_date, -1)
         #Get existing portfolios
         portfolios = mdb_query.get_portfolios(ref_date)[["portfolioID","inceptionDate"]]
+        #Get holdings tables
+        all_holdings = {}
+        for portfolio_index, portfolio_row in portfolios.iterrows():
+            all_holdings[portfolio_row['portfolioID']] = mdb_query.get_holdings(portfolio_row['portfolioID'], ref_date, "on")
+        #Get latest prices from dayBeforeDate for every holding in one read
+        symbols = [ symbol for holdings in all_holdings.values() if not holdings.empty for symbol in holdings['symbol'].tolist() ]
+        prices = mdb_query.get_prices_asof(symbols, [dayBeforeDate], dataset="chart")[["symbol","close"]]
         #Loop through portfolios
         for portfolio_index, portfolio_row in portfolios.iterrows():
             #Get portfolioID and inceptionDate
             portfolio = portfolio_row['portfolioID']
             #Get holdings table
-            holdings = mdb_query.get_holdings(portfolio, ref_date, "on")
-            #Get latest prices from dayBeforeDate
-            prices = mdb_query.get_chart(holdings['symbol'].tolist(), dayBeforeDate, 'latest')
+            holdings = all_holdings[portfolio]
             #Merge prices with holdings
             holdings = pandas.merge(holdings,prices,how='left',left_on=['symbol'],right_on=['symbol'],sort=False)
             #Remove USD
@@ -230,7 +240,8 @@ class PortfolioManagement(Mdb):
             insert_pf_transactions = True
             if insert_pf_transactions:
                 #print( transaction_tables )
-                self.db.pf_transactions.insert_many( transaction_tables )
+                self.db.pf_transactions.insert_many( add_native_dates( transaction_tables, "pf_transactions" ) )
+                query_cache.invalidate("pf_transactions")
     
     def pf_buy_all(self, ref_date = "1990-01-01"):
         """
@@ -241,7 +252,7 @@ class PortfolioManagement(Mdb):
         mdb_query = Query()
         #Get link to MongoDB
         #Get date for stock prices
-        dayBeforeDate = (pandas.Timestamp(ref_date) + pandas.DateOffset(days=-1)).strftime('%Y-%m-%d')
+        dayBeforeDate = shift_date(ref_date, -1)
         #Get ranked stock list for current date
         top_stocks_full = calculate_top_stocks(dayBeforeDate)
         #Get existing portfolios
@@ -272,4 +283,5 @@ class PortfolioManagement(Mdb):
                 transaction_tables.append( transaction_table )
             insert_pf_transactions = True
             if insert_pf_transactions:
-                self.db.pf_transactions.insert_many( transaction_tables )
+                self.db.pf_transactions.insert_many( add_native_dates( transaction_tables, "pf_transactions" ) )
+                query_cache.invalidate("pf_transactions")
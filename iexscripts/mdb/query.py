@@ -18,12 +18,273 @@ import numpy
 import pandas
 from iexscripts.utils import printProgressBar
 from mdb.mdb import Mdb
+from mdb.materialize import cursor_to_dataframe, iter_dataframes, DEFAULT_CHUNK_SIZE
+from mdb.cache import query_cache
+from mdb.instrument import logger
+from mdb.schemas import NUMERIC, apply_schema
+from mdb.dates import NATIVE_DATES, native_field, native_query, native_sort, native_reads, strip_native_dates, shift_date
+from mdb.mirror import MIRRORED, UPDATED_FIELD, filter_frame
+from mdb.datasets import DATASETS, WHEN, MAX_IN, latest_pipeline
+
+#Ways of finding the latest document per symbol, see Query.benchmark_latest
+LATEST_STRATEGIES = [ "group", "fanout" ]
+LATEST_STRATEGY = "group"
+
+#Screen applied by get_active_companies
+# forbidden_industry removes companies that do not compare well
+# e.g. Companies that have investments as assets
+UNIVERSE = {
+    "type": ["cs"],
+    "region": ["US"],
+    "currency": ["USD"],
+    "exchange": ["NAS","NYS"],
+    "forbidden_name": r"Class [B-F]",
+    "forbidden_symbol": r"[#.\-]",
+    "forbidden_industry": ['Investment Managers','Real Estate Investment Trusts','Regional Banks','Financial Conglomerates','Major Banks','Investment Banks/Brokers','Savings Banks','Investment Trusts/Mutual Funds','Financial Publishing/Services'],
+}
+#Always part of the universe, whatever the screen says
+UNIVERSE_BENCHMARK = "SPY"
+
+#Oldest price in days get_prices_asof will use for a date
+ASOF_STALENESS = 10
 
 class Query(Mdb):
-    def __init__(self):
+    def __init__(self, mirror = None, parse_dates = False, categories = False):
+        """
+        Query MongoDB, or a local Mirror for the collections it holds
+        Results keep YYYY-MM-DD string dates unless parse_dates is set, see mdb/schemas.py
+        @params:
+            mirror      - Optional  : local Parquet mirror to read from (Mirror)
+            parse_dates - Optional  : return dates as datetime64 (Bool)
+            categories  - Optional  : return symbol and portfolioID as categories (Bool)
+        """
         #Inherit all methods and properties from Mdb
         super().__init__()
+        self.latest_strategy = LATEST_STRATEGY
+        self.mirror = mirror
+        self.parse_dates = parse_dates
+        self.categories = categories
 
+    def _projection(self, fields, required = []):
+        """
+        Return MongoDB projection for the requested fields
+        @params:
+            fields      - Optional  : fields to return, None for all ([Str])
+            required    - Optional  : fields always returned ([Str])
+        """
+
+        if fields is None:
+            return None
+
+        projection = { "_id": 0 }
+        for field in list(required) + list(fields):
+            projection[field] = 1
+
+        return projection
+
+    def _find(self, collection, query, projection = None, sort = None):
+        """
+        Return DataFrame of matching documents, using the query cache if enabled
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Required  : MongoDB filter (Dict)
+            projection  - Optional  : MongoDB projection (Dict)
+            sort        - Optional  : sort specification ([(Str, Int)])
+        """
+    
+        if self.mirror is not None and collection in MIRRORED:
+            return self._typed( self.mirror.find(collection, query, projection, sort), collection )
+    
+        key = query_cache.make_key(collection, "find", query, projection, sort)
+        frame = query_cache.get(key)
+        if frame is None:
+            results = self._cursor( collection, query, projection, sort )
+            frame = self._materialize( results, collection )
+            query_cache.put(key, frame)
+    
+        #Callers modify the frame in place so never hand out the cached copy
+        if query_cache.enabled:
+            frame = frame.copy()
+    
+        return self._typed( frame, collection )
+    
+    def _find_latest(self, collection, match, date_field, key = "symbol", projection = None):
+        """
+        Return DataFrame of the latest document per key, using the query cache if enabled
+        @params:
+            collection  - Required  : collection name (Str)
+            match       - Required  : MongoDB filter (Dict)
+            date_field  - Required  : field ordering the documents (Str)
+            key         - Optional  : field to group documents by (Str)
+            projection  - Optional  : MongoDB projection (Dict)
+        """
+    
+        if self.mirror is not None and collection in MIRRORED:
+            return self._typed( self.mirror.find_latest(collection, match, date_field, key, projection), collection )
+    
+        cache_key = query_cache.make_key(collection, "latest", match, date_field, key, projection)
+        frame = query_cache.get(cache_key)
+        if frame is None:
+            if native_reads() and date_field in NATIVE_DATES.get(collection, []):
+                results = self._latest( collection, native_query(match, collection), native_field(date_field), key, projection )
+            else:
+                results = self._latest( collection, match, date_field, key, projection )
+            frame = self._materialize( results, collection )
+            query_cache.put(cache_key, frame)
+    
+        if query_cache.enabled:
+            frame = frame.copy()
+    
+        return self._typed( frame, collection )
+    
+    def _iter_find(self, collection, query, projection = None, sort = None, chunk_size = DEFAULT_CHUNK_SIZE, date_field = None, window = None):
+        """
+        Yield DataFrames of matching documents as the cursor is read
+        Streams bypass the query cache
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Required  : MongoDB filter (Dict)
+            projection  - Optional  : MongoDB projection (Dict)
+            sort        - Optional  : sort specification ([(Str, Int)])
+            chunk_size  - Optional  : maximum rows per DataFrame (Int)
+            date_field  - Optional  : date field used by window (Str)
+            window      - Optional  : day, month, year (Str)
+        """
+    
+        if self.mirror is not None and collection in MIRRORED:
+            results = self.mirror.iter_find(collection, query, projection, sort)
+        else:
+            results = self._cursor( collection, query, projection, sort )
+    
+        for frame in iter_dataframes( results, chunk_size, date_field, window, numeric=NUMERIC.get(collection) ):
+            yield self._typed( strip_native_dates( frame, collection ), collection )
+    
+    def _cursor(self, collection, query, projection = None, sort = None):
+        """
+        Return MongoDB cursor, filtering and sorting on native dates if enabled
+        @params:
+            collection  - Required  : collection name (Str)
+            query       - Required  : MongoDB filter (Dict)
+            projection  - Optional  : MongoDB projection (Dict)
+            sort        - Optional  : sort specification ([(Str, Int)])
+        """
+    
+        if native_reads():
+            query = native_query( query, collection )
+            sort = native_sort( sort, collection )
+    
+        results = self.db[collection].find( query, projection )
+        if sort is not None:
+            results = results.sort( sort )
+    
+        return results
+    
+    def _materialize(self, results, collection):
+        """
+        Return typed DataFrame of a cursor without the native date copies
+        @params:
+            results     - Required  : pymongo cursor
+            collection  - Required  : collection name (Str)
+        """
+    
+        return apply_schema( strip_native_dates( cursor_to_dataframe( results, numeric=NUMERIC.get(collection) ), collection ), collection )
+    
+    def _typed(self, frame, collection):
+        """
+        Apply the date and category options of this Query to a result
+        Cached results only hold the numeric types so every Query can share them
+        @params:
+            frame       - Required  : query result (DataFrame)
+            collection  - Required  : collection name (Str)
+        """
+    
+        return apply_schema( frame, collection, self.parse_dates, self.categories )
+    
+    def _latest(self, collection, match, date_field, key = "symbol", projection = None, strategy = None):
+        """
+        Return the most recent document for each key from MongoDB
+        @params:
+            collection  - Required  : collection name (Str)
+            match       - Required  : MongoDB filter (Dict)
+            date_field  - Required  : field ordering the documents (Str)
+            key         - Optional  : field to group documents by (Str)
+            projection  - Optional  : MongoDB projection (Dict)
+            strategy    - Optional  : group, fanout (Str)
+        """
+    
+        #Backends without aggregation pipelines use SQL window functions
+        if not self.backend.aggregation:
+            return self.db[collection].find_latest( match, date_field, key, projection )
+    
+        if strategy is None:
+            strategy = self.latest_strategy
+    
+        if strategy == "group":
+            return self._latest_group(collection, match, date_field, key, projection)
+        elif strategy == "fanout":
+            return self._latest_fanout(collection, match, date_field, key, projection)
+        else:
+            sys.exit("strategy not in [group, fanout]")
+    
+    def _latest_group(self, collection, match, date_field, key, projection):
+        """
+        Latest document per key with a single $sort/$group $first aggregation, see latest_pipeline
+        """
+    
+        pipeline = latest_pipeline( match, date_field, key, projection )
+    
+        return self.db[collection].aggregate( pipeline, allowDiskUse=True )
+    
+    def _latest_fanout(self, collection, match, date_field, key, projection):
+        """
+        Latest document per key with one index backed find_one per key
+        """
+    
+        #Use the requested keys if given, otherwise ask MongoDB
+        if isinstance(match.get(key), dict) and "$in" in match[key]:
+            keys = match[key]["$in"]
+        else:
+            keys = self.db[collection].distinct( key, match )
+    
+        docs = []
+        for value in sorted(set(keys)):
+            query = dict(match)
+            query[key] = value
+            doc = self.db[collection].find_one( query, projection, sort=[(date_field, DESCENDING)] )
+            if doc is not None:
+                docs.append( doc )
+    
+        return docs
+    
+    def benchmark_latest(self, collection, match, date_field, key = "symbol", repeat = 3):
+        """
+        Time each latest-per-key strategy and use the fastest from now on
+        Return the best time in seconds per strategy, also logged to diywealth.queries
+        @params:
+            collection  - Required  : collection name (Str)
+            match       - Required  : MongoDB filter (Dict)
+            date_field  - Required  : field ordering the documents (Str)
+            key         - Optional  : field to group documents by (Str)
+            repeat      - Optional  : timing repetitions per strategy (Int)
+        """
+    
+        timings = {}
+        for strategy in LATEST_STRATEGIES:
+            best = None
+            for i in range(repeat):
+                start = time.perf_counter()
+                list( self._latest(collection, match, date_field, key, strategy=strategy) )
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            timings[strategy] = best
+            logger.info( "Latest strategy " + strategy + ": " + "{0:.3f}".format(best) + "s" )
+    
+        self.latest_strategy = min(timings, key=timings.get)
+        logger.info( "Latest strategy in use: " + self.latest_strategy )
+    
+        return timings
+    
     def is_new_symbol(self, symbol):
         """
         Is symbol already in MongoDB?
@@ -49,496 +310,433 @@ class Query(Mdb):
     
         return not entry_match
     
-    def get_symbols(self):
+    def get_symbols(self, fields = None, enabled_only = True):
         """
-        Return symbols from MongoDB
+        Return the latest entry of each symbol from MongoDB
+        @params:
+            fields          - Optional  : fields to return, None for all ([Str])
+            enabled_only    - Optional  : drop symbols IEX has disabled (Bool)
         """
     
-        results = self.db.iex_symbols.aggregate([
-            { "$sort": { "date": DESCENDING } },
-            { "$group": {
-                "_id": "$symbol",
-                "symbols": { "$push": "$$ROOT" }
-                }
-            },
-            { "$replaceRoot": {
-                "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                }
-            },
-            { "$sort": { "symbol": ASCENDING } }
-        ])
+        projection = self._projection(fields, ["symbol","isEnabled"])
     
-        symbols = pandas.DataFrame()
-        for doc in results:
-            symbols = symbols.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        symbols = self._find_latest( "iex_symbols", {}, "date", projection=projection )
     
         if not symbols.empty:
-            symbols.drop("_id", axis=1, inplace=True)
-            symbols = symbols[symbols.isEnabled != False]
+            symbols.drop("_id", axis=1, errors='ignore', inplace=True)
+            if enabled_only:
+                symbols = symbols[symbols.isEnabled != False]
             symbols.reset_index(drop=True, inplace=True)
     
         return symbols
     
-    def get_company(self, symbol):
+    def get_company(self, symbol, fields = None):
         """
         Return company information from MongoDB
         @params:
             symbol  - Required  : symbol list ([Str])
+            fields  - Optional  : fields to return, None for all ([Str])
         """
     
         query = { "symbol": { "$in": symbol } }
     
-        results = self.db.iex_company.find( query ).sort("symbol", ASCENDING)
+        projection = self._projection(fields, ["symbol"])
     
-        company = pandas.DataFrame()
-        for doc in results:
-            company = company.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        company = self._find( "iex_company", query, projection, [("symbol", ASCENDING)] )
     
         company.drop("_id", axis=1, errors='ignore', inplace=True)
         company.reset_index(drop=True, inplace=True)
     
         return company
     
-    def get_active_companies(self):
-    
-        symbols = self.get_symbols()
-        companies = self.get_company( symbols["symbol"].tolist() )
-        symbols = pandas.merge( symbols, companies, how='inner', left_on=['symbol','type'], right_on=['symbol','issueType'], sort=False)
-        symbols_spy = symbols[ symbols['symbol'] == 'SPY' ]
-        #type="cs"
-        symbols = symbols[ symbols.type.isin( ['cs'] ) ]
-        #region="US"
-        symbols = symbols[ symbols.region.isin( ['US'] ) ]
-        #currency="USD"
-        symbols = symbols[ symbols.currency.isin( ['USD'] ) ]
-        #isEnabled=True
-        symbols = symbols[ symbols['isEnabled'] == True ]
-        #exchange not in NASDAQ or NYSE
-        symbols = symbols[ symbols.exchange_x.isin( ['NAS','NYS'] ) ]
-        #Class B etc. not in securityName
-        forbidden = [ 'Class B', 'Class C', 'Class D', 'Class E', 'Class F' ]
-        symbols = symbols[ symbols.apply( lambda x: not any( s in x['securityName'] for s in forbidden ), axis=1 ) ]
-        forbidden = [ "#", ".", "-" ]
-        symbols = symbols[ symbols.apply( lambda x: not any( s in x['symbol'] for s in forbidden ), axis=1 ) ]
-        #Remove American Depositary Shares
-        #Not in IEX anymore?
-        #ads_str = 'American Depositary Shares'
-        #symbols = symbols[ symbols.apply( lambda x: ads_str not in x['name'], axis=1 ) ]
-        #symbols = symbols[ symbols.apply( lambda x: ads_str not in x['companyName'], axis=1 ) ]
-        #symbols = symbols[ symbols.apply( lambda x: ads_str not in x['securityName'], axis=1 ) ]
-        #Remove industries that do not compare well
-        # e.g. Companies that have investments as assets
-        forbidden_industry = ['Investment Managers','Real Estate Investment Trusts','Regional Banks','Financial Conglomerates','Major Banks','Investment Banks/Brokers','Savings Banks','Investment Trusts/Mutual Funds','Financial Publishing/Services']
-        symbols = symbols[ ~symbols.industry.isin( forbidden_industry ) ]
-        symbols = symbols.append(symbols_spy, ignore_index=True, sort=False)
-        symbols.reset_index(drop=True, inplace=True)
-        
-        return symbols['symbol']
-    
-    def get_chart(self, ref_symbol, ref_date = "1990-01-01", when = "after"):
+    def get_active_companies(self, ref_date = None):
         """
-        Return company charts from MongoDB
+        Return the symbols of the investable universe, SPY last
+        The snapshot for each date is kept in the query cache if enabled
         @params:
-            ref_symbol  - Required  : symbol list ([Str])
-            ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, on, latest (Str)
+            ref_date    - Optional  : date YYYY-MM-DD, default today (Str)
         """
     
-        query = []
+        if ref_date is None:
+            ref_date = datetime.datetime.now().strftime("%Y-%m-%d")
     
-        #No more than 10 days ago
-        gte_date = (pandas.Timestamp(ref_date) + pandas.DateOffset(days=-10)).strftime('%Y-%m-%d')
+        cache_key = query_cache.make_key("universe", ref_date)
+        universe = query_cache.get(cache_key)
+        if universe is None:
+            universe = self._screen_universe(ref_date)
+            query_cache.put(cache_key, universe)
     
-        if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        "date": { "$gte": ref_date } }
-        elif when == "on":
-            query = { "symbol": { "$in": ref_symbol },
-                        "date": ref_date }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        "date": { "$lte": ref_date } } },
-                        { "$match": { "date": { "$gte": gte_date } } },
-                        { "$sort": { "date": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
-            #query = { "symbol": { "$in": ref_symbol },
-            #          "date": { "$lte": ref_date },
-            #          "date": { "$gte": gte_date } }
-        else:
-            sys.exit("when not in [after, on, latest]!")
+        return universe.copy()
     
-        results = []
+    def _screen_universe(self, ref_date):
+        """
+        Join latest symbols with companies and apply the UNIVERSE screen
+        @params:
+            ref_date    - Required  : date YYYY-MM-DD (Str)
+        """
     
-        if when == "after" or when == "on":
-            results = self.db.iex_charts.find( query ).sort("date", DESCENDING)
+        #Simple predicates are applied by MongoDB, the benchmark is exempt
+        screen = { "type": { "$in": UNIVERSE["type"] },
+                    "region": { "$in": UNIVERSE["region"] },
+                    "currency": { "$in": UNIVERSE["currency"] },
+                    "exchange": { "$in": UNIVERSE["exchange"] },
+                    "isEnabled": True }
+        date_match = { "date": { "$lte": ref_date } }
+        date_field = "date"
+        if native_reads():
+            date_match = native_query( date_match, "iex_symbols" )
+            date_field = native_field( date_field )
+        pipeline = [
+                    { "$match": date_match },
+                    { "$sort": { "symbol": ASCENDING, date_field: DESCENDING } },
+                    { "$group": { "_id": "$symbol",
+                                    "symbol": { "$first": "$symbol" },
+                                    "type": { "$first": "$type" },
+                                    "region": { "$first": "$region" },
+                                    "currency": { "$first": "$currency" },
+                                    "exchange": { "$first": "$exchange" },
+                                    "isEnabled": { "$first": "$isEnabled" } } },
+                    { "$match": { "isEnabled": { "$ne": False },
+                                    "$or": [ { "symbol": UNIVERSE_BENCHMARK }, screen ] } },
+                    { "$lookup": { "from": "iex_company",
+                                    "localField": "symbol",
+                                    "foreignField": "symbol",
+                                    "as": "company" } },
+                    { "$unwind": "$company" },
+                    { "$match": { "$expr": { "$eq": [ "$type", "$company.issueType" ] } } },
+                    { "$match": { "$or": [ { "symbol": UNIVERSE_BENCHMARK },
+                                             { "company.industry": { "$nin": UNIVERSE["forbidden_industry"] } } ] } },
+                    { "$project": { "_id": 0, "symbol": 1, "securityName": "$company.securityName" } },
+                    { "$sort": { "symbol": ASCENDING } }
+                ]
+        if self.backend.aggregation:
+            symbols = cursor_to_dataframe( self.db.iex_symbols.aggregate( pipeline, allowDiskUse=True ) )
         else:
-            results = self.db.iex_charts.aggregate( query )
-            #results = self.db.iex_charts.find( query )
+            symbols = self._join_universe( date_match, date_field, screen )
+        if symbols.empty:
+            return pandas.Series([], name="symbol", dtype=object)
+    
+        #String rules as vectorized regexes
+        # Class B etc. not in securityName, no #, . or - in symbol
+        benchmark = symbols["symbol"] == UNIVERSE_BENCHMARK
+        keep = ~symbols["securityName"].astype(str).str.contains(UNIVERSE["forbidden_name"], regex=True, na=False)
+        keep &= ~symbols["symbol"].str.contains(UNIVERSE["forbidden_symbol"], regex=True, na=False)
+        #Remove American Depositary Shares
+        #Not in IEX anymore?
+        #ads_str = 'American Depositary Shares'
+        symbols = pandas.concat( [ symbols[keep & ~benchmark], symbols[benchmark] ], axis=0, ignore_index=True, sort=False )
     
-        chart = pandas.DataFrame()
-        for doc in results:
-            #chart = chart.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
-            chart = pandas.concat( [chart,pandas.DataFrame.from_dict(doc, orient='index').T], axis=0, ignore_index=True, sort=False )
+        return symbols['symbol']
     
-        #if when == "latest":
-        #    chart = chart.loc[chart.groupby("symbol").date.idxmax(),:]
-        #    chart.sort_values("symbol", axis=0, ascending=True, inplace=True)
+    def _join_universe(self, date_match, date_field, screen):
+        """
+        Client side equivalent of the universe pipeline for backends without $lookup
+        @params:
+            date_match  - Required  : filter on the symbol date (Dict)
+            date_field  - Required  : symbol date field (Str)
+            screen      - Required  : simple predicates of the screen (Dict)
+        """
     
-        chart.drop(["_id","open","uClose","uHigh","uLow","uOpen","uVolume"], axis=1, errors='ignore', inplace=True)
-        chart.reset_index(drop=True, inplace=True)
+        projection = self._projection(["type","region","currency","exchange"], ["symbol","isEnabled"])
+        symbols = cursor_to_dataframe( self._latest( "iex_symbols", date_match, date_field, "symbol", projection ) )
+        companies = cursor_to_dataframe( self.db.iex_company.find( {}, { "_id": 0, "symbol": 1, "issueType": 1, "securityName": 1, "industry": 1 } ) )
+        if symbols.empty or companies.empty:
+            return pandas.DataFrame()
+    
+        symbols = symbols[ symbols.isEnabled != False ]
+        screened = symbols.index.isin( filter_frame( symbols, screen ).index )
+        symbols = symbols[ (symbols.symbol == UNIVERSE_BENCHMARK) | screened ]
+        symbols = pandas.merge( symbols, companies, how='inner', left_on=['symbol','type'], right_on=['symbol','issueType'], sort=False )
+        symbols = symbols[ (symbols.symbol == UNIVERSE_BENCHMARK) | ~symbols.industry.isin( UNIVERSE["forbidden_industry"] ) ]
+        symbols = symbols[["symbol","securityName"]].sort_values(by="symbol")
+        symbols.reset_index(drop=True, inplace=True)
     
-        return chart
+        return symbols
     
-    def get_quotes(self, ref_symbol, ref_date = "1990-01-01", when = "after"):
+    def get_dataset(self, name, ref_symbol, ref_date, when = "after", fields = None, end_date = None, date_field = None):
         """
-        Return company quotes from MongoDB
+        Return documents of a time-keyed dataset from MongoDB
         @params:
+            name        - Required  : dataset name in DATASETS (Str)
             ref_symbol  - Required  : symbol list ([Str])
-            ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, on, latest (Str)
+            ref_date    - Required  : date YYYY-MM-DD (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
+            date_field  - Optional  : override the dataset date field (Str)
         """
     
-        query = []
+        dataset = DATASETS[name]
+        if date_field is None:
+            date_field = dataset.date_field
     
-        #No more than 10 days ago
-        gte_date = (pandas.Timestamp(ref_date) + pandas.DateOffset(days=-10)).strftime('%Y-%m-%d')
+        if when not in WHEN:
+            sys.exit("when not in [" + ", ".join(WHEN) + "]!")
+        if when == "between" and end_date is None:
+            sys.exit("end_date required for between!")
+    
+        projection = self._projection(fields, [dataset.key, date_field])
     
         if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        "date": { "$gte": ref_date } }
+            date_query = { "$gte": ref_date }
         elif when == "on":
-            query = { "symbol": { "$in": ref_symbol },
-                        "date": ref_date }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        "date": { "$lte": ref_date } } },
-                        { "$match": { "date": { "$gte": gte_date } } },
-                        { "$sort": { "date": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
-            #query = { "symbol": { "$in": ref_symbol },
-            #          "date": { "$lte": ref_date },
-            #          "date": { "$gte": gte_date } }
+            date_query = ref_date
+        elif when == "between":
+            date_query = { "$gte": ref_date, "$lte": end_date }
+        elif when == "latest" and dataset.lookback is not None:
+            gte_date = shift_date(ref_date, -dataset.lookback)
+            date_query = { "$lte": ref_date, "$gte": gte_date }
         else:
-            sys.exit("when not in [after, on, latest]!")
-    
-        results = []
+            date_query = { "$lte": ref_date }
+    
+        #Split long symbol lists so each query stays a reasonable size
+        frames = []
+        for idx_min in range(0, max(len(ref_symbol), 1), MAX_IN):
+            query = { dataset.key: { "$in": list(ref_symbol[idx_min:idx_min+MAX_IN]) },
+                        date_field: date_query }
+            if when in ["latest", "asof"]:
+                frames.append( self._find_latest( dataset.collection, query, date_field, dataset.key, projection ) )
+            else:
+                frames.append( self._find( dataset.collection, query, projection, [(date_field, DESCENDING)] ) )
     
-        if when == "after" or when == "on":
-            results = self.db.iex_quotes.find( query ).sort("date", DESCENDING)
+        if len(frames) == 1:
+            result = frames[0]
         else:
-            results = self.db.iex_quotes.aggregate( query )
-            #results = self.db.iex_quotes.find( query )
+            result = pandas.concat( frames, axis=0, ignore_index=True, sort=False )
+            if not result.empty:
+                if when in ["latest", "asof"]:
+                    result = result.sort_values(by=dataset.key, ascending=True, kind="mergesort")
+                else:
+                    result = result.sort_values(by=date_field, ascending=False, kind="mergesort")
     
-        quote = pandas.DataFrame()
-        for doc in results:
-            quote = pandas.concat( [quote,pandas.DataFrame.from_dict(doc, orient='index').T], axis=0, ignore_index=True, sort=False )
-    
-        quote.drop(["_id"], axis=1, errors='ignore', inplace=True)
-        quote.reset_index(drop=True, inplace=True)
+        result = result.drop(dataset.drop, axis=1, errors='ignore')
+        result.reset_index(drop=True, inplace=True)
     
-        return quote
+        return result
     
-    def get_dividends(self, ref_symbol, ref_date = "1900-01-01", when = "after"):
+    def iter_dataset(self, name, ref_symbol, ref_date, when = "after", fields = None, end_date = None, ascending = False, chunk_size = DEFAULT_CHUNK_SIZE, window = None):
         """
-        Return company dividends from MongoDB
+        Yield DataFrame chunks of a time-keyed dataset from MongoDB
+        Chunks are ordered by date within each group of MAX_IN symbols
         @params:
+            name        - Required  : dataset name in DATASETS (Str)
             ref_symbol  - Required  : symbol list ([Str])
-            ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, on, latest (Str)
+            ref_date    - Required  : date YYYY-MM-DD (Str)
+            when        - Optional  : after, on, between (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
+            ascending   - Optional  : oldest first (Bool)
+            chunk_size  - Optional  : maximum rows per chunk, None for no limit (Int)
+            window      - Optional  : day, month, year, None for no window (Str)
         """
     
-        query = []
+        dataset = DATASETS[name]
+        date_field = dataset.date_field
+    
+        if when not in ["after", "on", "between"]:
+            sys.exit("when not in [after, on, between]!")
+        if when == "between" and end_date is None:
+            sys.exit("end_date required for between!")
+    
+        projection = self._projection(fields, [dataset.key, date_field])
     
         if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        "exDate": { "$gte": ref_date } }
+            date_query = { "$gte": ref_date }
         elif when == "on":
-            query = { "symbol": { "$in": ref_symbol },
-                        "exDate": ref_date }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        "exDate": { "$lte": ref_date } } },
-                        { "$sort": { "exDate": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
+            date_query = ref_date
         else:
-            sys.exit("when not in [after, latest]")
+            date_query = { "$gte": ref_date, "$lte": end_date }
     
-        results = []
+        sort = [(date_field, ASCENDING if ascending else DESCENDING)]
+        for idx_min in range(0, len(ref_symbol), MAX_IN):
+            query = { dataset.key: { "$in": list(ref_symbol[idx_min:idx_min+MAX_IN]) },
+                        date_field: date_query }
+            for frame in self._iter_find( dataset.collection, query, projection, sort, chunk_size, date_field, window ):
+                frame = frame.drop(dataset.drop, axis=1, errors='ignore')
+                yield frame
     
-        if when == "after" or when == "on":
-            results = self.db.iex_dividends.find( query ).sort("exDate", DESCENDING)
-        else:
-            results = self.db.iex_dividends.aggregate( query )
-    
-        dividends = pandas.DataFrame()
-        for doc in results:
-            dividends = dividends.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
-    
-        dividends.drop("_id", axis=1, errors='ignore', inplace=True)
-        dividends.reset_index(drop=True, inplace=True)
-    
-        return dividends
-    
-    def get_earnings(self, ref_symbol, ref_date = "1900-01-01", when = "after", date_type = "fiscalEndDate"):
+    def get_chart(self, ref_symbol, ref_date = "1990-01-01", when = "after", fields = None, end_date = None):
         """
-        Return company earnings from MongoDB
+        Return company charts from MongoDB
         @params:
             ref_symbol  - Required  : symbol list ([Str])
             ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, latest (Str)
-            date_type   - Optional  : fiscalEndDate, EPSReportDate (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
         """
     
-        query = []
+        return self.get_dataset("chart", ref_symbol, ref_date, when, fields, end_date)
     
-        if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        date_type: { "$gte": ref_date } }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        date_type: { "$lte": ref_date } } },
-                        { "$sort": { date_type: DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
-        else:
-            sys.exit("when not in [after, latest]")
+    def get_quotes(self, ref_symbol, ref_date = "1990-01-01", when = "after", fields = None, end_date = None):
+        """
+        Return company quotes from MongoDB
+        @params:
+            ref_symbol  - Required  : symbol list ([Str])
+            ref_date    - Optional  : date YYYY-MM-DD (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
+        """
     
-        results = []
+        return self.get_dataset("quotes", ref_symbol, ref_date, when, fields, end_date)
     
-        if when == "after":
-            results = self.db.iex_earnings.find( query ).sort(date_type, DESCENDING)
-        else:
-            results = self.db.iex_earnings.aggregate( query )
+    def get_dividends(self, ref_symbol, ref_date = "1900-01-01", when = "after", fields = None, end_date = None):
+        """
+        Return company dividends from MongoDB
+        @params:
+            ref_symbol  - Required  : symbol list ([Str])
+            ref_date    - Optional  : date YYYY-MM-DD (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
+        """
     
-        earnings = pandas.DataFrame()
-        for doc in results:
-            earnings = earnings.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        return self.get_dataset("dividends", ref_symbol, ref_date, when, fields, end_date)
     
-        earnings.drop("_id", axis=1, errors='ignore', inplace=True)
-        earnings.reset_index(drop=True, inplace=True)
+    def get_earnings(self, ref_symbol, ref_date = "1900-01-01", when = "after", date_type = "fiscalEndDate", fields = None, end_date = None):
+        """
+        Return company earnings from MongoDB
+        @params:
+            ref_symbol  - Required  : symbol list ([Str])
+            ref_date    - Optional  : date YYYY-MM-DD (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            date_type   - Optional  : fiscalEndDate, EPSReportDate (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
+        """
     
-        return earnings
+        return self.get_dataset("earnings", ref_symbol, ref_date, when, fields, end_date, date_type)
     
-    def get_financials(self, ref_symbol, ref_date = "1900-01-01", when = "after"):
+    def get_financials(self, ref_symbol, ref_date = "1900-01-01", when = "after", fields = None, end_date = None):
         """
         Return company financials from MongoDB
         @params:
             ref_symbol  - Required  : symbol list ([Str])
             ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, latest (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
         """
     
-        query = []
-    
-        if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        "reportDate": { "$gte": ref_date } }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        "reportDate": { "$lte": ref_date } } },
-                        { "$sort": { "reportDate": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
-        else:
-            sys.exit("when not in [after, latest]")
-    
-        results = []
-    
-        if when == "after":
-            results = self.db.iex_financials.find( query ).sort("reportDate", DESCENDING)
-        else:
-            results = self.db.iex_financials.aggregate( query )
-    
-        financials = pandas.DataFrame()
-        for doc in results:
-            financials = financials.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
-    
-        financials.drop("_id", axis=1, errors='ignore', inplace=True)
-        financials.reset_index(drop=True, inplace=True)
+        return self.get_dataset("financials", ref_symbol, ref_date, when, fields, end_date)
     
-        return financials
-    
-    def get_balancesheets(self, ref_symbol, ref_date = "1900-01-01", when = "after"):
+    def get_balancesheets(self, ref_symbol, ref_date = "1900-01-01", when = "after", fields = None, end_date = None):
         """
         Return company balance sheet from MongoDB
         @params:
             ref_symbol  - Required  : symbol list ([Str])
             ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, latest (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
         """
     
-        query = []
-    
-        if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        "reportDate": { "$gte": ref_date } }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        "reportDate": { "$lte": ref_date } } },
-                        { "$sort": { "reportDate": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
-        else:
-            sys.exit("when not in [after, latest]")
-    
-        results = []
-    
-        if when == "after":
-            results = self.db.iex_balancesheets.find( query ).sort("reportDate", DESCENDING)
-        else:
-            results = self.db.iex_balancesheets.aggregate( query )
-    
-        balancesheet = pandas.DataFrame()
-        for doc in results:
-            balancesheet = balancesheet.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
-    
-        balancesheet.drop("_id", axis=1, errors='ignore', inplace=True)
-        balancesheet.reset_index(drop=True, inplace=True)
+        return self.get_dataset("balancesheets", ref_symbol, ref_date, when, fields, end_date)
     
-        return balancesheet
-    
-    def get_stats(self, ref_symbol, ref_date = "1900-01-01", when = "after"):
+    def get_stats(self, ref_symbol, ref_date = "1900-01-01", when = "after", fields = None, end_date = None):
         """
-        Return company balance sheet from MongoDB
+        Return company stats from MongoDB
         @params:
             ref_symbol  - Required  : symbol list ([Str])
             ref_date    - Optional  : date YYYY-MM-DD (Str)
-            when        - Optional  : after, latest (Str)
+            when        - Optional  : after, on, between, latest, asof (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
+            end_date    - Optional  : last date YYYY-MM-DD for between (Str)
         """
     
-        query = []
-    
-        if when == "after":
-            query = { "symbol": { "$in": ref_symbol },
-                        "date": { "$gte": ref_date } }
-        elif when == "latest":
-            query = [
-                        { "$match": { "symbol": { "$in": ref_symbol },
-                                        "date": { "$lte": ref_date } } },
-                        { "$sort": { "date": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
-        else:
-            sys.exit("when not in [after, latest]")
+        return self.get_dataset("stats", ref_symbol, ref_date, when, fields, end_date)
     
-        results = []
+    def iter_chart(self, ref_symbol, ref_date = "1990-01-01", when = "after", fields = None, end_date = None, ascending = False, chunk_size = DEFAULT_CHUNK_SIZE, window = None):
+        """
+        Yield company charts from MongoDB in chunks, see iter_dataset
+        """
     
-        if when == "after":
-            results = self.db.iex_stats.find( query ).sort("date", DESCENDING)
-        else:
-            results = self.db.iex_stats.aggregate( query )
+        return self.iter_dataset("chart", ref_symbol, ref_date, when, fields, end_date, ascending, chunk_size, window)
     
-        stats = pandas.DataFrame()
-        for doc in results:
-            stats = stats.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+    def iter_quotes(self, ref_symbol, ref_date = "1990-01-01", when = "after", fields = None, end_date = None, ascending = False, chunk_size = DEFAULT_CHUNK_SIZE, window = None):
+        """
+        Yield company quotes from MongoDB in chunks, see iter_dataset
+        """
     
-        stats.drop("_id", axis=1, errors='ignore', inplace=True)
-        stats.reset_index(drop=True, inplace=True)
+        return self.iter_dataset("quotes", ref_symbol, ref_date, when, fields, end_date, ascending, chunk_size, window)
     
-        return stats
+    def get_prices_asof(self, symbols, dates, max_staleness = ASOF_STALENESS, dataset = "quotes", field = "close"):
+        """
+        Return the latest price on or before each date for each symbol
+        The covering date range is read once and resolved with an as-of join
+        Prices older than max_staleness days are left as NaN
+        @params:
+            symbols         - Required  : symbol list ([Str])
+            dates           - Required  : dates YYYY-MM-DD ([Str])
+            max_staleness   - Optional  : oldest usable price in days (Int)
+            dataset         - Optional  : chart, quotes (Str)
+            field           - Optional  : price field (Str)
+        """
     
-    def get_portfolios(self, date):
+        symbols = list(dict.fromkeys(symbols))
+        dates = sorted(set(dates))
+        #One row per (symbol, date) pair
+        pairs = pandas.DataFrame( { "symbol": numpy.repeat(symbols, len(dates)),
+                                    "date": numpy.tile(dates, len(symbols)) } )
+        if pairs.empty:
+            return pandas.DataFrame( columns=["symbol","date","priceDate",field] )
+    
+        date_field = DATASETS[dataset].date_field
+        prices = self.get_dataset( dataset, symbols, shift_date(dates[0], -max_staleness), "between", [field], dates[-1] )
+        if prices.empty:
+            pairs["priceDate"] = None
+            pairs[field] = numpy.nan
+            return pairs
+    
+        prices = prices[["symbol",date_field,field]].rename(columns={date_field: "priceDate"})
+        #Categorical symbols from Query(categories=True) cannot be joined to the plain pairs
+        prices["symbol"] = prices["symbol"].astype(pairs["symbol"].dtype)
+        prices = prices.dropna(subset=[field])
+        #merge_asof needs a sorted datetime key
+        prices["asof"] = pandas.to_datetime(prices["priceDate"])
+        pairs["asof"] = pandas.to_datetime(pairs["date"])
+        prices = prices.sort_values(by="asof", kind="mergesort")
+        pairs = pairs.sort_values(by="asof", kind="mergesort")
+        prices = pandas.merge_asof( pairs, prices, on="asof", by="symbol", direction="backward",
+                                    tolerance=pandas.Timedelta(days=max_staleness) )
+        prices = prices.drop("asof", axis=1).sort_values(by=["symbol","date"], kind="mergesort")
+        prices.reset_index(drop=True, inplace=True)
+    
+        return prices
+    
+    def get_portfolios(self, date, fields = None):
         """
         Return portfolio information from MongoDB
         @params:
             date    - Required  : date YYYY-MM-DD (Str)
+            fields  - Optional  : fields to return, None for all ([Str])
         """
     
         query = { "inceptionDate": { "$lte": date } }
     
-        results = self.db.pf_info.find( query ).sort("portfolioID", ASCENDING)
+        projection = self._projection(fields, ["portfolioID"])
     
-        portfolios = pandas.DataFrame()
-        for doc in results:
-            portfolios = portfolios.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        portfolios = self._find( "pf_info", query, projection, [("portfolioID", ASCENDING)] )
     
-        portfolios.drop("_id", axis=1, inplace=True)
+        portfolios.drop("_id", axis=1, errors='ignore', inplace=True)
     
         return portfolios
     
-    def get_transactions(self, portfolioID, date, when = "on"):
+    def get_transactions(self, portfolioID, date, when = "on", fields = None):
         """
         Return portfolio transactions from MongoDB
         @params:
             portfolioID - Required  : portfolio ID (Str)
             date        - Required  : date YYYY-MM-DD (Str)
             when        - Optional  : on, after (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
         """
     
         query = {}
     
+        projection = self._projection(fields, ["portfolioID","date"])
+    
         if when == "on":
             query = { "portfolioID": portfolioID,
                         "date": date }
@@ -548,131 +746,114 @@ class Query(Mdb):
         else:
             sys.exit("when not in [on, after]")
     
-        results = self.db.pf_transactions.find( query )
-    
-        transactions = pandas.DataFrame()
-        for doc in results:
-            transactions = transactions.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        transactions = self._find( "pf_transactions", query, projection )
     
         if not transactions.empty:
-            transactions.drop("_id", axis=1, inplace=True)
+            transactions.drop("_id", axis=1, errors='ignore', inplace=True)
     
         return transactions
     
-    def get_holdings(self, portfolioID, date = " 1990-01-01", when = "on"):
+    def get_holdings(self, portfolioID, date = " 1990-01-01", when = "on", fields = None):
         """
         Return portfolio holdings from MongoDB
         @params:
             portfolioID - Required  : portfolio ID (Str)
             date        - Optional  : date YYYY-MM-DD (Str)
             when        - Optional  : on, after (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
         """
     
         query = []
     
+        projection = self._projection(fields, ["portfolioID","symbol","lastUpdated"])
+    
         if when == "on":
-            query = [
-                        { "$match": { "portfolioID": portfolioID,
-                                        "lastUpdated": { "$lte": date } } },
-                        { "$sort": { "lastUpdated": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
+            query = { "portfolioID": portfolioID,
+                        "lastUpdated": { "$lte": date } }
         elif when == "after":
             query = { "portfolioID": portfolioID,
                         "lastUpdated": { "$gte": date } }
         else:
             sys.exit("when not in [on, after]")
     
-        results = []
-    
         if when == "on":
-            results = self.db.pf_holdings.aggregate( query )
+            holdings = self._find_latest( "pf_holdings", query, "lastUpdated", projection=projection )
         else:
-            results = self.db.pf_holdings.find( query ).sort("date", ASCENDING)
-    
-        holdings = pandas.DataFrame()
-        for doc in results:
-            holdings = holdings.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+            holdings = self._find( "pf_holdings", query, projection, [("date", ASCENDING)] )
     
         if not holdings.empty:
-            holdings.drop("_id", axis=1, inplace=True)
+            holdings.drop("_id", axis=1, errors='ignore', inplace=True)
     
         return holdings
     
-    def get_performance(self, ref_portfolioID, ref_date = "1990-01-01"):
+    def get_performance(self, ref_portfolioID, ref_date = "1990-01-01", fields = None):
         """
         Return portfolio performance from MongoDB
         @params:
             ref_portfolioID - Required  : portfolio ID (Str)
             ref_date        - Optional  : date YYYY-MM-DD (Str)
+            fields          - Optional  : fields to return, None for all ([Str])
         """
     
         query = { "portfolioID": { "$in": ref_portfolioID },
                     "date": { "$gte": ref_date } }
     
-        results = self.db.pf_performance.find( query ).sort("date", DESCENDING)
-       
-        performance = pandas.DataFrame()
-        for doc in results:
-            performance = performance.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+        projection = self._projection(fields, ["portfolioID","date"])
+    
+        performance = self._find( "pf_performance", query, projection, [("date", DESCENDING)] )
     
-        performance.drop("_id", axis=1, errors='ignore', inplace=True)
+        performance.drop(["_id",UPDATED_FIELD], axis=1, errors='ignore', inplace=True)
         performance.reset_index(drop=True, inplace=True)
     
         return performance
     
-    def get_stock_list(self, ref_date = "1990-01-01", when = "on"):
+    def iter_performance(self, ref_portfolioID, ref_date = "1990-01-01", fields = None, ascending = False, chunk_size = DEFAULT_CHUNK_SIZE, window = None):
+        """
+        Yield portfolio performance from MongoDB in chunks
+        @params:
+            ref_portfolioID - Required  : portfolio ID list ([Str])
+            ref_date        - Optional  : date YYYY-MM-DD (Str)
+            fields          - Optional  : fields to return, None for all ([Str])
+            ascending       - Optional  : oldest first (Bool)
+            chunk_size      - Optional  : maximum rows per chunk, None for no limit (Int)
+            window          - Optional  : day, month, year, None for no window (Str)
+        """
+    
+        query = { "portfolioID": { "$in": ref_portfolioID },
+                    "date": { "$gte": ref_date } }
+    
+        projection = self._projection(fields, ["portfolioID","date"])
+        sort = [("date", ASCENDING if ascending else DESCENDING)]
+    
+        for frame in self._iter_find( "pf_performance", query, projection, sort, chunk_size, "date", window ):
+            yield frame.drop(["_id",UPDATED_FIELD], axis=1, errors='ignore')
+    
+    def get_stock_list(self, ref_date = "1990-01-01", when = "on", fields = None):
         """
         Return ranked list of stocks from MongoDB
         @params:
             ref_date    - Optional  : date YYYY-MM-DD (Str)
             when        - Optional  : on, latest (Str)
+            fields      - Optional  : fields to return, None for all ([Str])
         """
     
         query = []
     
-        gte_date = (pandas.Timestamp(ref_date) + pandas.DateOffset(days=-50)).strftime('%Y-%m-%d')
+        projection = self._projection(fields, ["symbol","date","peROERatio"])
+    
+        gte_date = shift_date(ref_date, -50)
     
         if when == "on":
             query = { "date": ref_date }
         elif when == "latest":
-            query = [
-                        { "$match": { "date": { "$lte": ref_date } } },
-                        { "$match": { "date": { "$gte": gte_date } } },
-                        { "$sort": { "date": DESCENDING } },
-                        { "$group": {
-                            "_id": "$symbol",
-                            "symbols": { "$push": "$$ROOT" }
-                            }
-                        },
-                        { "$replaceRoot": {
-                            "newRoot": { "$arrayElemAt": ["$symbols", 0] }
-                            }
-                        },
-                        { "$sort": { "symbol": ASCENDING } }
-                    ]
+            query = { "date": { "$lte": ref_date, "$gte": gte_date } }
         else:
             sys.exit("when not in [on, latest]")
     
-        results = []
-    
         if when == "on":
-            results = self.db.stock_list.find( query )
+            stock_list = self._find( "stock_list", query, projection )
         elif when == "latest":
-            results = self.db.stock_list.aggregate( query )
-    
-        stock_list = pandas.DataFrame()
-        for doc in results:
-            stock_list = stock_list.append( pandas.DataFrame.from_dict(doc, orient='index').T, ignore_index=True, sort=False )
+            stock_list = self._find_latest( "stock_list", query, "date", projection=projection )
     
         if not stock_list.empty:
             stock_list = stock_list.sort_values(by="peROERatio", ascending=True, axis="index")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Author: J. Walker
+
+Column types applied to query results as they are materialized
+"""
+
+import pandas
+
+#Fields that may be held as categories to save memory, only when a caller asks for them
+CATEGORICAL = ["symbol", "portfolioID"]
+
+#Numeric fields per collection, converted to float64
+#Missing or unparseable values become NaN
+NUMERIC = {
+    "iex_charts": ["open","high","low","close","change","changePercent","vwap","changeOverTime"],
+    "iex_quotes": ["open","high","low","close","latestPrice","previousClose","change","changePercent",
+                   "marketCap","peRatio","week52High","week52Low","ytdChange"],
+    "iex_stats": ["marketcap","beta","week52high","week52low","sharesOutstanding","float",
+                  "dividendYield","ttmEPS","peRatio","day200MovingAvg","day50MovingAvg"],
+    "iex_earnings": ["actualEPS","consensusEPS","EPSSurpriseDollar","yearAgo","yearAgoChangePercent"],
+    "iex_financials": ["grossProfit","costOfRevenue","operatingRevenue","totalRevenue","operatingIncome",
+                       "netIncome","currentAssets","totalAssets","totalLiabilities","currentCash",
+                       "currentDebt","totalCash","totalDebt","shareholderEquity","cashChange","cashFlow"],
+    "iex_balancesheets": ["currentCash","shortTermInvestments","receivables","inventory","currentAssets",
+                          "longTermInvestments","propertyPlantEquipment","goodwill","intangibleAssets",
+                          "totalAssets","accountsPayable","currentLongTermDebt","totalCurrentLiabilities",
+                          "longTermDebt","totalLiabilities","commonStock","retainedEarnings",
+                          "treasuryStock","shareholderEquity","netTangibleAssets"],
+    "pf_transactions": ["price","commission"],
+    "pf_holdings": ["endOfDayQuantity"],
+    "pf_performance": ["prevCloseValue","closeValue","adjPrevCloseValue","adjCloseValue","percentReturn"],
+    "stock_list": ["shareholderEquity","close","marketCap","peRatio","EPS","sharesOutstanding",
+                   "netIncome","returnOnEquity","peROERatio"],
+}
+
+#Date fields per collection, only converted when parse_dates is requested
+#Most callers compare dates with YYYY-MM-DD strings so they are kept as text by default
+DATES = {
+    "iex_charts": ["date"],
+    "iex_quotes": ["date"],
+    "iex_stats": ["date"],
+    "iex_dividends": ["exDate","paymentDate","recordDate","declaredDate"],
+    "iex_earnings": ["fiscalEndDate","EPSReportDate"],
+    "iex_financials": ["reportDate"],
+    "iex_balancesheets": ["reportDate"],
+    "pf_info": ["inceptionDate"],
+    "pf_transactions": ["date"],
+    "pf_holdings": ["lastUpdated"],
+    "pf_performance": ["date"],
+    "stock_list": ["date","reportDate"],
+}
+
+def apply_schema(frame, collection, parse_dates = False, categories = False):
+    """
+    Convert the columns of a query result to their schema types in place
+    Prices and ratios become float64, symbols stay strings unless categories is set
+    @params:
+        frame       - Required  : query result (DataFrame)
+        collection  - Required  : collection the result came from (Str)
+        parse_dates - Optional  : convert dates to datetime64 (Bool)
+        categories  - Optional  : hold symbol and portfolioID as categories (Bool)
+    """
+
+    if frame.empty:
+        return frame
+
+    for field in NUMERIC.get(collection, []):
+        if field in frame.columns and frame[field].dtype != "float64":
+            frame[field] = pandas.to_numeric(frame[field], errors="coerce").astype("float64")
+
+    if categories:
+        for field in CATEGORICAL:
+            if field in frame.columns and frame[field].dtype.name != "category":
+                frame[field] = frame[field].astype("category")
+
+    if parse_dates:
+        for field in DATES.get(collection, []):
+            if field in frame.columns:
+                frame[field] = pandas.to_datetime(frame[field], format="%Y-%m-%d", errors="coerce")
+
+    return frame
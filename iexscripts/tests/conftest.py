@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+
+#The scripts import both mdb and iexscripts, as when run from iexscripts/
+IEXSCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ os.path.dirname(IEXSCRIPTS), IEXSCRIPTS ]
+
+from mdb import backend
+from mdb.backend import MongoBackend, SqliteBackend, use_backend
+from mdb.cache import query_cache
+
+class MongomockBackend(MongoBackend):
+    """
+    MongoBackend on an in-memory mongomock database, runs the aggregation paths
+    """
+
+    def __init__(self):
+        import mongomock
+        self._database = mongomock.MongoClient().diywealth
+
+    def database(self):
+        return self._database
+
+@pytest.fixture
+def sqlite_backend():
+    previous = backend.get_backend()
+    sqlite = SqliteBackend(":memory:")
+    use_backend(sqlite)
+    query_cache.invalidate()
+    yield sqlite
+    use_backend(previous)
+
+@pytest.fixture
+def mongo_backend():
+    pytest.importorskip("mongomock")
+    previous = backend.get_backend()
+    mongo = MongomockBackend()
+    use_backend(mongo)
+    query_cache.invalidate()
+    yield mongo
+    use_backend(previous)
@@ -0,0 +1,43 @@
+import datetime
+import pytest
+from mdb.backend import translate_filter
+
+DOCS = [ { "symbol": "A", "date": "2026-01-05", "close": 1.0, "isEnabled": True },
+         { "symbol": "B", "date": "2026-01-06", "close": 2.0, "isEnabled": False },
+         { "symbol": "C", "date": "2026-01-07", "close": None },
+         { "symbol": "D", "date": datetime.datetime(2026, 1, 8) } ]
+
+@pytest.fixture
+def quotes(sqlite_backend):
+    collection = sqlite_backend.database().iex_quotes
+    collection.insert_many( [ dict(doc) for doc in DOCS ] )
+    return collection
+
+@pytest.mark.parametrize( "query, symbols", [
+    ( {}, ["A", "B", "C", "D"] ),
+    ( { "symbol": "B" }, ["B"] ),
+    ( { "symbol": { "$eq": "B" } }, ["B"] ),
+    ( { "symbol": { "$ne": "B" } }, ["A", "C", "D"] ),
+    ( { "close": None }, ["C", "D"] ),
+    ( { "close": { "$ne": None } }, ["A", "B"] ),
+    ( { "close": { "$ne": 1.0 } }, ["B", "C", "D"] ),
+    ( { "symbol": { "$in": ["A", "C"] } }, ["A", "C"] ),
+    ( { "symbol": { "$in": [] } }, [] ),
+    ( { "symbol": { "$nin": ["A", "C"] } }, ["B", "D"] ),
+    ( { "symbol": { "$nin": [] } }, ["A", "B", "C", "D"] ),
+    ( { "date": { "$gt": "2026-01-05", "$lte": "2026-01-07" } }, ["B", "C"] ),
+    ( { "date": { "$gte": "2026-01-06", "$lt": "2026-01-07" } }, ["B"] ),
+    ( { "date": { "$gte": datetime.datetime(2026, 1, 8) } }, ["D"] ),
+    ( { "close": { "$exists": True } }, ["A", "B", "C"] ),
+    ( { "close": { "$exists": False } }, ["D"] ),
+    ( { "date": { "$type": "string" } }, ["A", "B", "C", "D"] ),
+    ( { "isEnabled": True }, ["A"] ),
+    ( { "$or": [ { "symbol": "A" }, { "close": 2.0 } ] }, ["A", "B"] ),
+    ( { "$and": [ { "date": { "$gte": "2026-01-06" } }, { "symbol": { "$ne": "D" } } ] }, ["B", "C"] ),
+] )
+def test_translate_filter(quotes, query, symbols):
+    assert sorted( doc["symbol"] for doc in quotes.find( query ) ) == symbols
+
+def test_translate_filter_rejects_unknown_operators():
+    with pytest.raises( NotImplementedError ):
+        translate_filter( { "symbol": { "$regex": "^A" } } )
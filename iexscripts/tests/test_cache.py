@@ -0,0 +1,95 @@
+import pytest
+import pandas
+from mdb import cache
+from mdb.cache import QueryCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr( cache.time, "monotonic", lambda: now[0] )
+    return now
+
+def test_disabled_cache_stores_nothing():
+    results = QueryCache()
+    key = results.make_key( "iex_quotes", { "symbol": "A" } )
+
+    results.put( key, "frame" )
+
+    assert results.get( key ) is None
+
+def test_entries_expire_after_ttl(clock):
+    results = QueryCache()
+    results.enable( ttl=60 )
+    key = results.make_key( "iex_quotes", { "symbol": "A" } )
+    results.put( key, "frame" )
+
+    clock[0] += 59
+    assert results.get( key ) == "frame"
+    clock[0] += 2
+    assert results.get( key ) is None
+    assert (results.hits, results.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted(clock):
+    results = QueryCache()
+    results.enable( max_entries=2 )
+    first, second, third = [ results.make_key( "iex_quotes", symbol ) for symbol in "ABC" ]
+    results.put( first, 1 )
+    results.put( second, 2 )
+
+    #Reading the first entry makes the second the least recently used
+    results.get( first )
+    results.put( third, 3 )
+
+    assert results.get( first ) == 1
+    assert results.get( second ) is None
+    assert results.get( third ) == 3
+
+def test_invalidate_drops_the_collection_and_derived_results(clock):
+    results = QueryCache()
+    results.enable()
+    quotes = results.make_key( "iex_quotes", "A" )
+    company = results.make_key( "iex_company", "A" )
+    universe = results.make_key( "universe", "2026-01-05" )
+    for key in [quotes, company, universe]:
+        results.put( key, "frame" )
+
+    results.invalidate( "iex_company" )
+
+    assert results.get( quotes ) == "frame"
+    assert results.get( company ) is None
+    assert results.get( universe ) is None
+
+    results.invalidate()
+    assert results.get( quotes ) is None
+
+def test_make_key_ignores_dict_order():
+    results = QueryCache()
+
+    assert results.make_key( "iex_quotes", { "a": 1, "b": 2 } ) == results.make_key( "iex_quotes", { "b": 2, "a": 1 } )
+
+def test_results_are_evicted_to_stay_under_max_bytes(clock):
+    frame = pandas.DataFrame( { "symbol": ["A"] * 100, "close": [1.0] * 100 } )
+    size = cache.result_size( frame )
+    results = QueryCache()
+    results.enable( max_bytes=2 * size )
+    first, second, third = [ results.make_key( "iex_quotes", symbol ) for symbol in "ABC" ]
+    for key in [first, second, third]:
+        results.put( key, frame )
+
+    assert results.get( first ) is None
+    assert results.get( second ) is frame
+    assert results.bytes == 2 * size
+
+    results.invalidate( "iex_quotes" )
+    assert results.bytes == 0
+
+def test_results_larger_than_max_bytes_are_not_cached(clock):
+    frame = pandas.DataFrame( { "symbol": ["A"] * 100 } )
+    results = QueryCache()
+    results.enable( max_bytes=cache.result_size( frame ) - 1 )
+    key = results.make_key( "iex_quotes", "A" )
+
+    results.put( key, frame )
+
+    assert results.get( key ) is None
+    assert results.bytes == 0
@@ -0,0 +1,46 @@
+import pytest
+from mdb.checkpoint import Checkpoint
+
+def test_completed_steps_are_skipped_on_resume(sqlite_backend):
+    calls = []
+    Checkpoint( "daily", runID="2026-01-05" ).run( "insert_quotes", calls.append, 1 )
+
+    Checkpoint( "daily", resume=True, runID="2026-01-05" ).run( "insert_quotes", calls.append, 2 )
+
+    assert calls == [1]
+
+def test_failed_step_resumes_after_its_completed_symbols(sqlite_backend):
+    journal = Checkpoint( "daily", runID="2026-01-05" )
+
+    def crash():
+        journal.complete( ["A", "B"] )
+        raise RuntimeError( "IEX unavailable" )
+
+    with pytest.raises( RuntimeError ):
+        journal.run( "insert_quotes", crash )
+    status = journal.status()
+    assert status["status"].tolist() == ["failed"]
+    assert status["error"].tolist() == ["RuntimeError: IEX unavailable"]
+
+    resumed = Checkpoint( "daily", resume=True, runID="2026-01-05" )
+    seen = []
+    resumed.run( "insert_quotes", lambda: seen.append( resumed.completed() ) )
+
+    assert seen == [ {"A", "B"} ]
+    assert resumed.status()["status"].tolist() == ["complete"]
+
+def test_journal_of_another_run_is_ignored(sqlite_backend):
+    calls = []
+    Checkpoint( "daily", runID="2026-01-05" ).run( "insert_quotes", calls.append, 1 )
+
+    Checkpoint( "daily", resume=True, runID="2026-01-06" ).run( "insert_quotes", calls.append, 2 )
+
+    assert calls == [1, 2]
+
+def test_without_resume_the_journal_is_cleared(sqlite_backend):
+    calls = []
+    Checkpoint( "daily", runID="2026-01-05" ).run( "insert_quotes", calls.append, 1 )
+
+    Checkpoint( "daily", runID="2026-01-05" ).run( "insert_quotes", calls.append, 2 )
+
+    assert calls == [1, 2]
@@ -0,0 +1,33 @@
+from pymongo import ASCENDING, DESCENDING
+from mdb.datasets import latest_pipeline
+
+def test_latest_pipeline_whole_documents():
+    match = { "symbol": { "$in": ["A", "B"] }, "date": { "$lte": "2026-01-05" } }
+
+    pipeline = latest_pipeline( match, "date" )
+
+    assert pipeline == [ { "$match": match },
+                         { "$sort": { "symbol": ASCENDING, "date": DESCENDING } },
+                         { "$group": { "_id": "$symbol", "doc": { "$first": "$$ROOT" } } },
+                         { "$replaceRoot": { "newRoot": "$doc" } },
+                         { "$sort": { "symbol": ASCENDING } } ]
+
+def test_latest_pipeline_projection_groups_only_the_fields():
+    pipeline = latest_pipeline( {}, "lastUpdated", "portfolioID", { "_id": 0, "endOfDayQuantity": 1 } )
+
+    assert pipeline[1] == { "$sort": { "portfolioID": ASCENDING, "lastUpdated": DESCENDING } }
+    assert pipeline[2] == { "$group": { "_id": "$portfolioID",
+                                        "portfolioID": { "$first": "$portfolioID" },
+                                        "endOfDayQuantity": { "$first": "$endOfDayQuantity" } } }
+    assert pipeline[3] == { "$project": { "_id": 0 } }
+
+def test_latest_pipeline_sort_matches_the_index_direction(mongo_backend):
+    collection = mongo_backend.database().iex_quotes
+    collection.insert_many( [ { "symbol": "B", "date": "2026-01-05", "close": 1.0 },
+                              { "symbol": "A", "date": "2026-01-06", "close": 2.0 },
+                              { "symbol": "A", "date": "2026-01-05", "close": 3.0 },
+                              { "symbol": "A", "date": "2026-01-07", "close": 4.0 } ] )
+
+    docs = list( collection.aggregate( latest_pipeline( { "date": { "$lte": "2026-01-06" } }, "date" ) ) )
+
+    assert [ (doc["symbol"], doc["close"]) for doc in docs ] == [ ("A", 2.0), ("B", 1.0) ]
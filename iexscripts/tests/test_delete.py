@@ -0,0 +1,51 @@
+import pytest
+from mdb.delete import Delete
+
+@pytest.fixture(params=["sqlite_backend", "mongo_backend"])
+def db_backend(request):
+    return request.getfixturevalue(request.param)
+
+def test_delete_duplicates_keeps_last_inserted(db_backend):
+    delete = Delete()
+    delete.db.iex_quotes.insert_many( [ { "symbol": "A", "date": "2026-01-05", "close": 1.0 },
+                                        { "symbol": "A", "date": "2026-01-05", "close": 2.0 },
+                                        { "symbol": "A", "date": "2026-01-06", "close": 3.0 } ] )
+
+    report = delete.delete_duplicates( ["iex_quotes"] )
+
+    assert report["duplicates"].tolist() == [1]
+    closes = sorted( doc["close"] for doc in delete.db.iex_quotes.find( {} ) )
+    assert closes == [2.0, 3.0]
+
+def test_delete_duplicates_dry_run(db_backend):
+    delete = Delete()
+    delete.db.iex_quotes.insert_many( [ { "symbol": "A", "date": "2026-01-05" },
+                                        { "symbol": "A", "date": "2026-01-05" } ] )
+
+    report = delete.delete_duplicates( ["iex_quotes"], dry_run=True )
+
+    assert report["duplicates"].tolist() == [1]
+    assert delete.db.iex_quotes.count_documents( {} ) == 2
+
+def test_delete_duplicates_matches_missing_key_fields(db_backend):
+    delete = Delete()
+    delete.db.iex_quotes.insert_many( [ { "symbol": "A", "date": "2026-01-05", "close": 1.0 },
+                                        { "symbol": "A", "date": "2026-01-06", "close": 2.0 },
+                                        { "symbol": "A", "close": 3.0 },
+                                        { "symbol": "A", "close": 4.0 },
+                                        { "symbol": "B", "close": 5.0 } ] )
+
+    delete.delete_duplicates( ["iex_quotes"] )
+
+    #Only the older of the two documents without a date is a duplicate
+    closes = sorted( doc["close"] for doc in delete.db.iex_quotes.find( {} ) )
+    assert closes == [1.0, 2.0, 4.0, 5.0]
+
+def test_delete_duplicates_keeps_dividends_sharing_an_exdate(db_backend):
+    delete = Delete()
+    delete.db.iex_dividends.insert_many( [ { "symbol": "A", "exDate": "2026-03-02", "amount": 0.5, "flag": "Cash" },
+                                           { "symbol": "A", "exDate": "2026-03-02", "amount": 2.0, "flag": "Special" } ] )
+
+    delete.delete_duplicates()
+
+    assert delete.db.iex_dividends.count_documents( {} ) == 2
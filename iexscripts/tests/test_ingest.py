@@ -0,0 +1,37 @@
+from mdb.mdb import Mdb
+from mdb.ingest import write_documents
+
+def test_write_documents_upserts_on_the_natural_key(sqlite_backend):
+    db = Mdb().db
+
+    write_documents( db, "iex_quotes", [ { "symbol": "A", "date": "2026-01-05", "close": 1.0 } ] )
+    inserted, updated = write_documents( db, "iex_quotes", [ { "symbol": "A", "date": "2026-01-05", "close": 2.0 } ] )
+
+    assert (inserted, updated) == (0, 1)
+    assert [ doc["close"] for doc in db.iex_quotes.find( {} ) ] == [2.0]
+
+def test_write_documents_keeps_dividends_sharing_an_exdate(sqlite_backend):
+    db = Mdb().db
+
+    write_documents( db, "iex_dividends", [ { "symbol": "A", "exDate": "2026-03-02", "amount": 0.5, "flag": "Cash" },
+                                            { "symbol": "A", "exDate": "2026-03-02", "amount": 2.0, "flag": "Special" } ] )
+
+    assert sorted( doc["amount"] for doc in db.iex_dividends.find( {} ) ) == [0.5, 2.0]
+
+import pytest
+from mdb.ingest import plan_chart_range
+
+#2026-01-09 is a Friday
+@pytest.mark.parametrize( "last_date, end_date, expected", [
+    (None, "2026-01-12", "1y"),
+    ("2026-01-12", "2026-01-12", None),
+    ("2026-01-09", "2026-01-11", None),
+    ("2026-01-09", "2026-01-12", "20260112"),
+    ("2026-01-09", "2026-01-16", "5d"),
+    ("2026-01-09", "2026-01-19", "1m"),
+    ("2026-01-09", "2026-02-06", "1m"),
+    ("2026-01-09", "2026-02-07", "3m"),
+    ("2020-01-09", "2026-01-09", "5y"),
+] )
+def test_plan_chart_range(last_date, end_date, expected):
+    assert plan_chart_range( last_date, end_date ) == expected
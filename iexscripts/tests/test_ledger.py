@@ -0,0 +1,69 @@
+import pandas
+import pytest
+from mdb.ledger import Ledger, CASH, dividend_transactions
+
+def trade(kind, symbol, price, volume, date = "2026-01-05"):
+    return { "portfolioID": "P", "type": kind, "symbol": symbol, "price": price, "volume": volume, "date": date }
+
+def test_ledger_applies_transactions_to_positions():
+    ledger = Ledger( "P" )
+
+    ledger.apply( trade( "deposit", CASH, 1.0, 1000.0 ) )
+    ledger.apply( trade( "buy", "A", 10.0, 20 ) )
+    ledger.apply( trade( "sell", "A", 12.0, 5 ) )
+    ledger.apply( trade( "dividend", "A", 0.5, 15 ) )
+    ledger.apply( trade( "withdrawal", CASH, 1.0, 100.0 ) )
+
+    assert ledger.quantity( "A" ) == 15
+    assert ledger.quantity( CASH ) == 1000.0 - 200.0 + 60.0 + 7.5 - 100.0
+    assert ledger.held() == ["A"]
+
+def test_ledger_rejects_selling_unowned_stock():
+    with pytest.raises( Exception ):
+        Ledger( "P" ).apply( trade( "sell", "A", 10.0, 1 ) )
+
+def test_close_returns_only_changed_positions():
+    ledger = Ledger( "P", { "A": 10.0, "B": 5.0, CASH: 100.0 } )
+    ledger.apply( trade( "buy", "A", 1.0, 1 ) )
+
+    rows = ledger.close( "2026-01-05" )
+
+    assert sorted( (row["symbol"], row["endOfDayQuantity"]) for row in rows ) == [ ("A", 11.0), (CASH, 99.0) ]
+    assert all( row["lastUpdated"] == "2026-01-05" and row["portfolioID"] == "P" for row in rows )
+    #Nothing changed since the last close
+    assert ledger.close( "2026-01-06" ) == []
+    ledger.touch( "B" )
+    assert ledger.close( "2026-01-07" ) == [ { "portfolioID": "P", "symbol": "B", "endOfDayQuantity": 5.0, "lastUpdated": "2026-01-07" } ]
+
+def dividend(symbol, exDate, paymentDate, amount = 0.5):
+    return { "symbol": symbol, "exDate": exDate, "paymentDate": paymentDate, "amount": amount, "currency": "USD" }
+
+def test_dividends_are_owed_on_positions_held_before_the_exdate():
+    dividends = pandas.DataFrame( [ dividend( "A", "2026-01-07", "2026-01-20" ),
+                                    dividend( "B", "2026-01-07", "2026-01-21" ) ] )
+    #A held before the replay, B bought on the exDate itself
+    transactions = pandas.DataFrame( [ trade( "buy", "B", 10.0, 4, "2026-01-07" ) ] )
+
+    owed = dividend_transactions( "P", dividends, transactions, { "A": 10.0 } )
+
+    assert owed[["symbol","date","price","volume"]].values.tolist() == [ ["A", "2026-01-20", 0.5, 10.0] ]
+
+def test_dividends_follow_trades_up_to_the_day_before_the_exdate():
+    dividends = pandas.DataFrame( [ dividend( "A", "2026-01-07", "2026-01-20" ) ] )
+    transactions = pandas.DataFrame( [ trade( "buy", "A", 10.0, 4, "2026-01-06" ),
+                                       trade( "sell", "A", 10.0, 10, "2026-01-07" ) ] )
+
+    owed = dividend_transactions( "P", dividends, transactions, { "A": 10.0 } )
+
+    #Sold on the exDate, still owed on the 14 held the day before
+    assert owed["volume"].tolist() == [14.0]
+
+def test_dividends_already_paid_or_without_amount_are_dropped():
+    dividends = pandas.DataFrame( [ dividend( "A", "2026-01-07", "2026-01-20" ),
+                                    dividend( "B", "2026-01-07", "2026-01-20", amount=0 ),
+                                    dividend( "C", "2026-01-07", None ) ] )
+    transactions = pandas.DataFrame( [ trade( "dividend", "A", 0.5, 10, "2026-01-20" ) ] )
+
+    owed = dividend_transactions( "P", dividends, transactions, { "A": 10.0, "B": 1.0, "C": 1.0 } )
+
+    assert owed.empty
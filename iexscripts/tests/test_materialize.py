@@ -0,0 +1,42 @@
+import numpy
+from mdb.materialize import cursor_to_dataframe, iter_dataframes, INITIAL_CAPACITY
+
+def test_numeric_columns_grow_past_initial_capacity():
+    n_rows = 2 * INITIAL_CAPACITY + 1
+    docs = [ { "symbol": "S" + str(i), "close": i } for i in range(n_rows) ]
+
+    frame = cursor_to_dataframe( docs, numeric=["close"] )
+
+    assert len(frame.index) == n_rows
+    assert frame["close"].dtype == "float64"
+    assert frame["close"].tolist() == [ float(i) for i in range(n_rows) ]
+
+def test_numeric_columns_coerce_like_to_numeric():
+    docs = [ { "close": 1 }, { "close": "2.5" }, { "close": "n/a" }, { "close": None }, { "symbol": "A" } ]
+
+    frame = cursor_to_dataframe( docs, numeric=["close"] )
+
+    assert frame["close"].dtype == "float64"
+    assert frame["close"].tolist()[:2] == [1.0, 2.5]
+    assert numpy.isnan( frame["close"].tolist()[2:] ).all()
+
+def test_columns_keep_first_seen_order_and_back_fill():
+    docs = [ { "symbol": "A", "close": 1.0 }, { "symbol": "B", "open": 2.0 }, { "date": "2026-01-05" } ]
+
+    frame = cursor_to_dataframe( docs, numeric=["close", "open"] )
+
+    assert list(frame.columns) == ["symbol", "close", "open", "date"]
+    assert frame["symbol"].tolist()[:2] == ["A", "B"]
+    assert frame["date"].isna().tolist() == [True, True, False]
+    assert numpy.isnan( frame["open"][0] )
+
+def test_empty_cursor_gives_empty_frame():
+    assert cursor_to_dataframe( [], numeric=["close"] ).empty
+
+def test_iter_dataframes_splits_on_month_and_chunk_size():
+    docs = [ { "date": date, "close": 1.0 } for date in ["2026-01-05", "2026-01-06", "2026-01-07", "2026-02-02"] ]
+
+    chunks = list( iter_dataframes( docs, chunk_size=2, date_field="date", window="month", numeric=["close"] ) )
+
+    assert [ frame["date"].tolist() for frame in chunks ] == [ ["2026-01-05", "2026-01-06"], ["2026-01-07"], ["2026-02-02"] ]
+    assert all( frame["close"].dtype == "float64" for frame in chunks )
@@ -0,0 +1,16 @@
+from mdb.mdb import Mdb
+from mdb.migrate import Migrate
+from mdb.dates import native_field
+
+def test_migrate_native_dates_on_sqlite(sqlite_backend):
+    db = Mdb().db
+    db.iex_quotes.insert_many( [ { "symbol": "A", "date": "2026-01-05" },
+                                 { "symbol": "B", "date": "2026-01-06" } ] )
+    migrate = Migrate()
+    assert migrate.check_native_dates( ["iex_quotes"] )["missing"].tolist() == [2]
+
+    migrate.migrate_native_dates( ["iex_quotes"] )
+
+    assert migrate.check_native_dates( ["iex_quotes"] )["missing"].tolist() == [0]
+    doc = db.iex_quotes.find_one( { "symbol": "A" } )
+    assert doc[native_field("date")].startswith("2026-01-05")
@@ -17,5 +17,7 @@ setup(
     author='John Walker and Robert Stainforth',
     url='https://github.com/DIYWealth',
     packages=['iexscripts',],
-    install_requires=required
+    install_requires=required,
+    extras_require={ 'mirror': [ 'pyarrow' ],
+                     'test': [ 'pytest', 'mongomock' ] }
 )